@@ -0,0 +1,195 @@
+import collections
+import fcntl
+import gzip
+import io
+import json
+import os
+import struct
+
+from snapshot.core import SnapshotError
+
+# Archive holds many save files (members) in one large file, so listing and reading them does not need an open and
+# stat per file (slow on network file systems). Members are stored unchanged (also compressed ones), one after another,
+# and are followed by an index with offsets and meta data of all members. Archive is append-only: new members and a new
+# index are appended at the end, and the fixed size trailer at the very end points to the latest index. Writers hold an
+# exclusive flock while appending and readers a shared one, so readers never see a partially appended tail.
+#
+# Members are addressed as if archive was a directory, e.g. "old.snaparc/file.snap" (see open_archive_member()).
+ARCHIVE_SUFFIX = '.snaparc'
+ARCHIVE_MAGIC = b'SNAPARC1'
+_TRAILER = struct.Struct('<8sQQ')  # magic, index offset, index size
+
+# Indexes of recently read archives, keyed by (path, mtime, size)
+_index_cache = collections.OrderedDict()
+_INDEX_CACHE_SIZE = 16
+
+
+class ArchiveError(SnapshotError):
+    """
+    Raised when archive is not valid.
+    """
+    pass
+
+
+def is_archive(path: str):
+    """
+    Check if path is an archive file (by its suffix, archive may not exist yet).
+
+    :param path: Path.
+
+    :return: True if archive.
+    """
+    return path.endswith(ARCHIVE_SUFFIX) and not os.path.isdir(path)
+
+
+def split_archive_path(path: str):
+    """
+    Split path of the archive member to path of the archive and name of the member.
+
+    :param path: Path (e.g. "dir/old.snaparc/file.snap").
+
+    :return: (archive path, member name) or None if path is not in an archive.
+    """
+    marker = ARCHIVE_SUFFIX + os.sep
+    end = path.rfind(marker)
+    if end < 0:
+        return None
+    archive_path = path[:end + len(ARCHIVE_SUFFIX)]
+    if not is_archive(archive_path):
+        return None
+    return archive_path, path[end + len(marker):]
+
+
+def open_archive_member(path: str):
+    """
+    Open member of the archive for reading in binary mode.
+
+    :param path: Path of the member (e.g. "dir/old.snaparc/file.snap").
+
+    :return: File object or None if path is not in an archive.
+    """
+    split_path = split_archive_path(path)
+    if split_path is None:
+        return None
+    archive_path, name = split_path
+    return io.BytesIO(SnapshotArchive(archive_path).read(name))
+
+
+def archive_member_exists(path: str):
+    """
+    Check if path is a member of an archive.
+
+    :param path: Path of the member (e.g. "dir/old.snaparc/file.snap").
+
+    :return: True if member exists.
+    """
+    split_path = split_archive_path(path)
+    return split_path is not None and split_path[1] in SnapshotArchive(split_path[0]).get_members()
+
+
+class SnapshotArchive(object):
+    def __init__(self, path: str):
+        """
+        Append-only archive of save files.
+
+        :param path: Path to the archive file (created on first append()).
+
+        :return:
+        """
+        self.path = os.path.abspath(path)
+
+    def get_members(self):
+        """
+        Get members of the archive from its index (members are not read).
+
+        :return: Dict {<name>: {'offset': <bytes>, 'size': <bytes>, 'mtime': <modification time>,
+                                'metadata': <dict with meta data>}}. Empty if archive does not exist.
+        """
+        try:
+            with open(self.path, 'rb') as archive_file:
+                fcntl.flock(archive_file.fileno(), fcntl.LOCK_SH)
+                stat = os.fstat(archive_file.fileno())
+                key = (self.path, stat.st_mtime, stat.st_size)
+                members = _index_cache.get(key)
+                if members is None:
+                    members = self._read_index(archive_file, stat.st_size)
+                    _index_cache[key] = members
+                    while len(_index_cache) > _INDEX_CACHE_SIZE:
+                        _index_cache.popitem(last=False)
+                else:
+                    _index_cache.move_to_end(key)
+                return members
+        except FileNotFoundError:
+            return dict()
+
+    def _read_index(self, archive_file, size):
+        if not size:
+            return dict()  # E.g. first append failed
+        elif size < _TRAILER.size:
+            raise ArchiveError('{} is not a valid archive (too short).'.format(self.path))
+        archive_file.seek(size - _TRAILER.size)
+        magic, offset, index_size = _TRAILER.unpack(archive_file.read(_TRAILER.size))
+        if magic != ARCHIVE_MAGIC or offset + index_size > size - _TRAILER.size:
+            raise ArchiveError('{} is not a valid archive (no index at the end).'.format(self.path))
+        archive_file.seek(offset)
+        try:
+            return json.loads(gzip.decompress(archive_file.read(index_size)).decode())['members']
+        except (OSError, ValueError, KeyError) as e:
+            raise ArchiveError('Index of the archive {} cannot be read: {}'.format(self.path, e))
+
+    def read(self, name: str):
+        """
+        Read the member.
+
+        :param name: Name of the member.
+
+        :return: Content (bytes) of the member, as it was appended.
+        """
+        member = self.get_members().get(name)
+        if member is None:
+            raise FileNotFoundError('{} is not in the archive {}'.format(name, self.path))
+        with open(self.path, 'rb') as archive_file:
+            fcntl.flock(archive_file.fileno(), fcntl.LOCK_SH)
+            archive_file.seek(member['offset'])
+            return archive_file.read(member['size'])
+
+    def append(self, members):
+        """
+        Append members to the archive (created if it does not exist). Member with a name which is already in the
+        archive replaces the old one (its data stays in the archive but is no longer indexed).
+
+        :param members: Iterable of (name, data, mtime, metadata) tuples. Data is content of the member (bytes).
+
+        :return: List of appended member names.
+        """
+        with open(self.path, 'ab+') as archive_file:
+            # Only one writer at a time. Readers wait until the new index is written.
+            fcntl.flock(archive_file.fileno(), fcntl.LOCK_EX)
+            try:
+                size = archive_file.seek(0, os.SEEK_END)
+                index = dict(self._read_index(archive_file, size))
+                archive_file.seek(0, os.SEEK_END)
+                try:
+                    if not size:
+                        archive_file.write(ARCHIVE_MAGIC + b'\n')
+
+                    names = list()
+                    for name, data, mtime, metadata in members:
+                        index[name] = {'offset': archive_file.tell(), 'size': len(data), 'mtime': mtime,
+                                       'metadata': metadata}
+                        archive_file.write(data)
+                        names.append(name)
+
+                    index_data = gzip.compress(json.dumps({'members': index}).encode())
+                    offset = archive_file.tell()
+                    archive_file.write(index_data)
+                    archive_file.write(_TRAILER.pack(ARCHIVE_MAGIC, offset, len(index_data)))
+                    archive_file.flush()
+                    os.fsync(archive_file.fileno())
+                except BaseException:
+                    # Partially appended members would hide the last index
+                    archive_file.truncate(size)
+                    raise
+                return names
+            finally:
+                fcntl.flock(archive_file.fileno(), fcntl.LOCK_UN)
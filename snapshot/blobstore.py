@@ -0,0 +1,207 @@
+import fcntl
+import gzip
+import hashlib
+import os
+from contextlib import contextmanager
+
+from snapshot.archive import open_archive_member
+
+# Blob store is a directory next to the save files. Large values (JSON text of waveforms) are stored there once, named
+# by the SHA-256 digest of their content. Save files reference them by digest instead of storing the value:
+#     examplePv:waveform,@<digest>
+# Each blob has a ".refs" file listing names of save files which reference it. When the last reference is released
+# (save file is deleted) the blob is removed. ".refs" files are changed in place under an exclusive flock, so references
+# added by concurrent saves are never lost.
+BLOB_DIR_NAME = '.blobs'
+BLOB_REF_PREFIX = '@'
+DEFAULT_BLOB_MIN_SIZE = 4096  # Minimal size of JSON value text (in bytes) to be stored as a blob
+
+
+def is_blob_ref(value_str: str):
+    """
+    Check if saved value is a reference to the blob store.
+
+    :param value_str: Value part of the save file line.
+
+    :return: True if reference.
+    """
+    return value_str.startswith(BLOB_REF_PREFIX)
+
+
+def find_blob_refs(lines):
+    """
+    Get digests of all blobs referenced in the save file.
+
+    :param lines: Iterable of save file lines (e.g. opened save file).
+
+    :return: Set of digests.
+    """
+    digests = set()
+    for line in lines:
+        if not line.startswith('#'):
+            split_line = line.strip().split(',', 1)
+            if len(split_line) > 1 and is_blob_ref(split_line[1]):
+                digests.add(split_line[1][len(BLOB_REF_PREFIX):])
+    return digests
+
+
+class SnapshotBlobStore(object):
+    def __init__(self, save_dir: str, min_size: int = DEFAULT_BLOB_MIN_SIZE):
+        """
+        Content-addressed store of large values shared by all save files in the save directory.
+
+        :param save_dir: Directory with save files. Blobs are stored in its BLOB_DIR_NAME subdirectory.
+        :param min_size: Values with JSON text of at least min_size bytes are stored as blobs.
+
+        :return:
+        """
+        self.save_dir = os.path.abspath(save_dir)
+        self.path = os.path.join(self.save_dir, BLOB_DIR_NAME)
+        self.min_size = min_size
+
+    def get_blob_path(self, digest: str):
+        """
+        Get path of the blob file (gzip compressed JSON text of the value).
+
+        :param digest: Digest of the blob.
+
+        :return: Path.
+        """
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+    def _refs_path(self, digest: str):
+        return self.get_blob_path(digest) + '.refs'
+
+    def put(self, value_str: str, owner: str):
+        """
+        Store value (if not already stored) and add reference to it.
+
+        :param value_str: JSON text of the value.
+        :param owner: Name of the save file referencing the value.
+
+        :return: Reference to be written to the save file instead of the value.
+        """
+        digest = hashlib.sha256(value_str.encode()).hexdigest()
+        blob_path = self.get_blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+
+        # Reference is added first, so blob is not collected while being written
+        with self._lock_refs(digest) as refs_file:
+            refs_file.write(owner + '\n')
+
+        if not os.path.isfile(blob_path):
+            # Write to temporary file first so readers never see a partial blob
+            tmp_path = '{}.{}.tmp'.format(blob_path, os.getpid())
+            with gzip.open(tmp_path, 'wt') as blob_file:
+                blob_file.write(value_str)
+            os.replace(tmp_path, blob_path)
+
+        return BLOB_REF_PREFIX + digest
+
+    def get(self, ref: str):
+        """
+        Get stored value.
+
+        :param ref: Reference as written in save file (or just a digest).
+
+        :return: JSON text of the value.
+        """
+        if is_blob_ref(ref):
+            ref = ref[len(BLOB_REF_PREFIX):]
+
+        # Blob store of an archive is read from the archive members
+        blob_path = self.get_blob_path(ref)
+        with gzip.open(open_archive_member(blob_path) or blob_path, 'rt') as blob_file:
+            return blob_file.read()
+
+    def get_refs(self, digest: str):
+        """
+        Get names of the save files referencing the blob.
+
+        :param digest: Digest of the blob.
+
+        :return: Set of save file names.
+        """
+        try:
+            with open(self._refs_path(digest)) as refs_file:
+                fcntl.flock(refs_file.fileno(), fcntl.LOCK_SH)
+                return _read_refs(refs_file)
+        except FileNotFoundError:
+            return set()
+
+    def release(self, owner: str, digests):
+        """
+        Remove references of the save file. Blobs with no references left are deleted.
+
+        :param owner: Name of the save file.
+        :param digests: Digests of blobs referenced by the save file (see find_blob_refs()).
+
+        :return: List of deleted blobs digests.
+        """
+        removed = list()
+        for digest in digests:
+            if self._update_refs(digest, lambda refs: refs - {owner}):
+                removed.append(digest)
+        return removed
+
+    def collect_garbage(self):
+        """
+        Remove references of save files which no longer exist and delete all blobs without references. Can be used
+        after save files were deleted without releasing their blobs.
+
+        :return: List of deleted blobs digests.
+        """
+        removed = list()
+        if not os.path.isdir(self.path):
+            return removed
+
+        for sub_dir in os.listdir(self.path):
+            for file_name in os.listdir(os.path.join(self.path, sub_dir)):
+                if len(file_name) != 62:
+                    continue  # .refs and temporary files
+
+                digest = sub_dir + file_name
+                if self._update_refs(digest, lambda refs: set(
+                        ref for ref in refs if os.path.lexists(os.path.join(self.save_dir, ref)))):
+                    removed.append(digest)
+        return removed
+
+    @contextmanager
+    def _lock_refs(self, digest: str):
+        # Open (or create) ".refs" file of the blob and lock it for exclusive access. File could be removed by another
+        # client (last reference released) while waiting for the lock, in which case the new file is opened.
+        refs_path = self._refs_path(digest)
+        while True:
+            with open(refs_path, 'a+') as refs_file:
+                fcntl.flock(refs_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    linked = os.stat(refs_path).st_ino == os.fstat(refs_file.fileno()).st_ino
+                except FileNotFoundError:
+                    linked = False
+                if linked:
+                    yield refs_file
+                    return
+
+    def _update_refs(self, digest: str, update):
+        # Replace references of the blob with update(refs) in place. Blob without references left is deleted (blob
+        # first, so a save waiting for the lock writes the blob again). Returns True if deleted.
+        with self._lock_refs(digest) as refs_file:
+            refs_file.seek(0)
+            all_refs = _read_refs(refs_file)
+            refs = update(all_refs)
+            if not refs:
+                for path in [self.get_blob_path(digest), self._refs_path(digest)]:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                return True
+            elif refs != all_refs:
+                refs_file.seek(0)
+                refs_file.truncate()
+                refs_file.writelines(ref + '\n' for ref in sorted(refs))
+            return False
+
+
+def _read_refs(refs_file):
+    return set(line.strip() for line in refs_file if line.strip())
@@ -8,13 +8,18 @@
 import numpy
 import json
 import os
+import sqlite3
 import time
 from enum import Enum
 
 from epics import PV, ca, dbr
 
 from snapshot.core import SnapshotPv, PvStatus
+from snapshot.blobstore import SnapshotBlobStore, find_blob_refs, is_blob_ref
+from snapshot.index import SnapshotIndex
 from snapshot.parser import SnapshotReqFile, parse_macros
+from snapshot.snapfile import add_compression_suffix, file_digest, format_metadata, is_save_file, open_save_file, \
+    replace_metadata, summarize_body
 
 import logging
 
@@ -41,13 +46,14 @@ class ActionStatus(Enum):
 
 
 class Snapshot(object):
-    def __init__(self, req_file_path, macros=None):
+    def __init__(self, req_file_path, macros=None, tolerance_rules=None):
         """
         Main snapshot class. Provides methods to handle PVs from request or snapshot files and to create, delete, etc
         snap (saved) files
 
         :param req_file_path: Path to the request file.
         :param macros: macros to be substituted in request file (can be dict {'A': 'B', 'C': 'D'} or str "A=B,C=D").
+        :param tolerance_rules: SnapshotToleranceRules for PVs without tolerance declared in the request file.
 
         :return:
         """
@@ -62,6 +68,7 @@ class Snapshot(object):
 
         self.pvs = dict()
         self.macros = macros
+        self.tolerance_rules = tolerance_rules
 
         # Other important states
         self._restore_started = False
@@ -75,6 +82,7 @@ class Snapshot(object):
 
         req_f = SnapshotReqFile(self.req_file_path, changeable_macros=list(macros.keys()))
         pvs = req_f.read()
+        self.tolerances = req_f.tolerances  # by raw PV names
 
         self.add_pvs(pvs)
 
@@ -95,6 +103,9 @@ class Snapshot(object):
             if not self.pvs.get(p_name):
 
                 pv_ref = SnapshotPv(p_name)
+                pv_ref.tolerance = self.tolerances.get(pvname_raw)
+                if pv_ref.tolerance is None and self.tolerance_rules:
+                    pv_ref.tolerance = self.tolerance_rules.get(p_name)
 
             # if not self.pvs.get(pv_ref.pvname):
                 self.pvs[pv_ref.pvname] = pv_ref
@@ -139,7 +150,7 @@ class Snapshot(object):
             self.remove_pvs(pvs_to_remove)
             self.add_pvs(pvs_to_change)
 
-    def save_pvs(self, save_file_path, force=False, symlink_path=None, **kw):
+    def save_pvs(self, save_file_path, force=False, symlink_path=None, compression=None, blob_store=None, **kw):
         """
         Get current PV values and save them in file. can also create symlink to the file. If additional metadata should
         be saved, it can be provided as keyword arguments.
@@ -147,8 +158,15 @@ class Snapshot(object):
         :param save_file_path: Path to save file.
         :param force: Save if not all PVs connected? Not connected PVs values will not be saved in such case.
         :param symlink_path: Path to symlink. If symlink exists it will be replaced.
+        :param compression: Compress file with one of the snapshot.snapfile.compressors ('gz', 'bz2', 'xz'). Codec
+                            suffix is appended to save_file_path if not already there.
+        :param blob_store: Optional SnapshotBlobStore. Large array values are stored there and only referenced from
+                           the save file.
         :param kw: Will be appended to metadata.
 
+        Saved file (and symlink) is registered in the index of the save directory, so other clients see it without
+        scanning the directory.
+
         :return: (action_status, pvs_status)
 
             action_status: Status of action as ActionStatus type.
@@ -185,11 +203,32 @@ class Snapshot(object):
             pvs_data[pvname]['raw_name'] = pv_ref.pvname
 
         logging.debug("Writing snapshot to file")
-        self.parse_to_save_file(pvs_data, save_file_path, self.macros, symlink_path, **kw)
+        save_file_path = self.parse_to_save_file(pvs_data, save_file_path, self.macros, symlink_path,
+                                                 compression=compression, blob_store=blob_store, **kw)
+        self._register_saved_files([save_file_path, symlink_path])
         logging.debug("Snapshot done")
 
         return ActionStatus.ok, pvs_status
 
+    @staticmethod
+    def _register_saved_files(paths):
+        # Updates index of the save directory for saved files. File is saved anyway, so index update is not an error
+        # (files not registered are found by the next update of the index).
+        save_dirs = dict()
+        for path in paths:
+            if path and is_save_file(path):
+                path = os.path.abspath(path)
+                save_dirs.setdefault(os.path.dirname(path), list()).append(os.path.basename(path))
+        for save_dir, names in save_dirs.items():
+            try:
+                index = SnapshotIndex(save_dir)
+                try:
+                    index.update_files(names)
+                finally:
+                    index.close()
+            except (OSError, sqlite3.Error) as e:
+                logging.warning('Cannot register saved files in the index of {}: {}'.format(save_dir, e))
+
     def restore_pvs(self, pvs_raw, force=False, callback=None, custom_macros=None):
         """
         Restore PVs form snapshot file or dictionary. If restore is successfully started (ActionStatus.ok returned),
@@ -344,64 +383,85 @@ class Snapshot(object):
 
     def replace_metadata(self, save_file_path, metadata):
         """
-        Reopen save data and replace meta data.
+        Replace meta data of the save file. Only the meta data line is overwritten (body of the file is not rewritten)
+        if new meta data fits into it, otherwise file is atomically replaced with the updated one.
 
         :param save_file_path: Path to save file.
         :param metadata: Dict with new metadata.
 
         :return:
         """
-        # Will replace metadata in the save file with the provided one
-
-        with open(save_file_path, 'r') as save_file:
-            lines = save_file.readlines()
-            if lines[0].startswith('#'):
-                lines[0] = "#" + json.dumps(metadata) + "\n"
-            else:
-                lines.insert(0, "#" + json.dumps(metadata) + "\n")
-
-            with open(save_file_path, 'w') as save_file_write:
-                save_file_write.writelines(lines)
+        replace_metadata(save_file_path, metadata)
 
     # Parser functions
 
-    def parse_to_save_file(self, pvs, save_file_path, macros=None, symlink_path=None, **kw):
+    def parse_to_save_file(self, pvs, save_file_path, macros=None, symlink_path=None, compression=None,
+                           blob_store=None, **kw):
         """
         This function is called at each save of PV values. This is a parser which generates save file from pvs. All
-        parameters in **kw are packed as meta data
+        parameters in **kw are packed as meta data. Meta data is extended with a 'summary' of the saved file (number of
+        PVs, number of PVs without value, size and SHA-256 digest of the file body, SHA-256 digest of the request
+        file), so saved files can be listed and validated without reading their body.
 
         :param pvs: Dict with pvs data to be saved. pvs = {pvname: {'value': value}}
-        :param save_file_path: Path of the saved file.
+        :param save_file_path: Path of the saved file. If it ends with a codec suffix (e.g. .snap.gz) file is
+                               compressed.
         :param macros: Macros
         :param symlink_path: Optional path to the symlink to be created.
+        :param compression: Optional codec name ('gz', 'bz2', 'xz'). Its suffix is appended to save_file_path.
+        :param blob_store: Optional SnapshotBlobStore. Array values with JSON text of at least blob_store.min_size bytes
+                           are stored to the blob store and referenced by digest.
         :param kw: Additional meta data.
 
-        :return:
+        :return: Path of the saved file (with codec suffix).
         """
         # This function is called at each save of PV values.
         # This is a parser which generates save file from pvs
         # All parameters in **kw are packed as meta data
 
-        save_file_path = os.path.abspath(save_file_path)
-        save_file = open(save_file_path, 'w')
+        save_file_path = add_compression_suffix(os.path.abspath(save_file_path), compression)
+        save_file_name = os.path.basename(save_file_path)
 
-        # Save meta data
-        if macros:
-            kw['macros'] = macros
-        save_file.write("#" + json.dumps(kw) + "\n")
+        old_blob_refs = set()
+        if blob_store is not None and os.path.isfile(save_file_path):
+            # File will be overwritten. References of the old file must be released when done.
+            with open_save_file(save_file_path) as old_save_file:
+                old_blob_refs = find_blob_refs(old_save_file)
 
+        # Body is prepared first, since its summary is part of the meta data
+        body = list()
+        blob_refs = set()
         for pvname, data in pvs.items():
             value = data.get("value")
             pvname_raw = data.get("raw_name")
             if value is not None:
                 if isinstance(value, numpy.ndarray):
-                    save_file.write("{},{}\n".format(pvname_raw, json.dumps(value.tolist())))
+                    value_str = json.dumps(value.tolist())
+                    if blob_store is not None and len(value_str) >= blob_store.min_size:
+                        value_str = blob_store.put(value_str, save_file_name)
+                        blob_refs.add(value_str[1:])
+                    body.append("{},{}\n".format(pvname_raw, value_str))
                 else:
-                    save_file.write("{},{}\n".format(pvname_raw, json.dumps(value)))
+                    body.append("{},{}\n".format(pvname_raw, json.dumps(value)))
             else:
-                save_file.write("{}\n".format(pvname_raw))
+                body.append("{}\n".format(pvname_raw))
+
+        # Save meta data
+        if macros:
+            kw['macros'] = macros
 
-        save_file.close()
+        kw['summary'] = summarize_body(body)
+        try:
+            kw['summary']['req_file_sha256'] = file_digest(self.req_file_path)
+        except OSError:
+            kw['summary']['req_file_sha256'] = None
+
+        with open_save_file(save_file_path, 'w') as save_file:
+            save_file.write(format_metadata(kw))
+            save_file.writelines(body)
+
+        if old_blob_refs - blob_refs:
+            blob_store.release(save_file_name, old_blob_refs - blob_refs)
 
         # Create symlink _latest.snap
         if symlink_path:
@@ -424,14 +484,18 @@ class Snapshot(object):
 
                 counter -= 1
 
+        return save_file_path
 
 
     @staticmethod
-    def parse_from_save_file(save_file_path):
+    def parse_from_save_file(save_file_path, body_summary=None):
         """
-        Parses save file to dict {'pvname': {'data': {'value': <value>, 'raw_name': <name_with_macros>}}}
+        Parses save file to dict {'pvname': {'data': {'value': <value>, 'raw_name': <name_with_macros>}}}. Compressed
+        save files are decompressed while reading and values referenced from the blob store are loaded from it.
 
         :param save_file_path: Path to save file.
+        :param body_summary: Optional SaveFileBodySummary, updated with body lines in the same pass (e.g. to verify
+                             the file without reading it twice).
 
         :return: (saved_pvs, meta_data, err)
 
@@ -445,10 +509,14 @@ class Snapshot(object):
         saved_pvs = dict()
         meta_data = dict()  # If macros were used they will be saved in meta_data
         err = list()
-        saved_file = open(save_file_path)
+        saved_file = open_save_file(save_file_path)
         meta_loaded = False
+        blob_store = None
+
+        for line_idx, line in enumerate(saved_file):
+            if body_summary is not None and not (line_idx == 0 and line.startswith('#')):
+                body_summary.update(line)
 
-        for line in saved_file:
             # first line with # is metadata (as json dump of dict)
             if line.startswith('#') and not meta_loaded:
                 line = line[1:]
@@ -467,10 +535,17 @@ class Snapshot(object):
                     # In case of array it will return a list, otherwise value
                     # of proper type
                     try:
+                        if is_blob_ref(pv_value_str):
+                            if blob_store is None:
+                                blob_store = SnapshotBlobStore(os.path.dirname(os.path.abspath(save_file_path)))
+                            pv_value_str = blob_store.get(pv_value_str)
                         pv_value = json.loads(pv_value_str)
                     except json.JSONDecodeError:
                         pv_value = None
                         err.append('Value of \'{}\' cannot be decoded. Will be ignored.'.format(pvname))
+                    except OSError:
+                        pv_value = None
+                        err.append('Value of \'{}\' is missing in the blob store. Will be ignored.'.format(pvname))
 
                     if isinstance(pv_value, list):
                         # arrays as numpy array, because pyepics returns
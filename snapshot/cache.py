@@ -0,0 +1,100 @@
+import collections
+import sys
+
+import numpy
+
+# Rough memory overhead of one saved PV in parsed file (name, dicts, value object)
+_PV_OVERHEAD = 300
+
+
+def estimate_pvs_size(pvs_list: dict):
+    """
+    Estimate memory used by the PVs of the parsed save file (as returned by Snapshot.parse_from_save_file()).
+
+    :param pvs_list: Dict {pvname: {'value': value}}.
+
+    :return: Size in bytes.
+    """
+    size = 0
+    for pvname, pv_data in pvs_list.items():
+        value = pv_data.get('value')
+        size += _PV_OVERHEAD + len(pvname)
+        if isinstance(value, numpy.ndarray):
+            size += value.nbytes
+        elif isinstance(value, str):
+            size += len(value)
+        elif isinstance(value, list):
+            size += sys.getsizeof(value) + sum(len(item) if isinstance(item, str) else 24 for item in value)
+    return size
+
+
+class SnapshotLruCache(object):
+    def __init__(self, max_size: int):
+        """
+        Cache keeping the least recently used items up to the given total size. Not thread safe.
+
+        :param max_size: Memory budget in bytes. Item bigger than that is not cached.
+
+        :return:
+        """
+        self.max_size = max_size
+        self.size = 0
+        self._items = collections.OrderedDict()  # key: (value, size), least recently used first
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """
+        Get cached value and mark it as most recently used.
+
+        :param key: Key.
+        :param default: Returned if not cached.
+
+        :return: Value.
+        """
+        item = self._items.get(key)
+        if item is None:
+            return default
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, value, size: int):
+        """
+        Add value to the cache, least recently used values are removed to keep the cache in its budget.
+
+        :param key: Key.
+        :param value: Value.
+        :param size: Size of the value in bytes.
+
+        :return:
+        """
+        self.pop(key)
+        if size > self.max_size:
+            return
+        self._items[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size:
+            old_value, old_size = self._items.popitem(last=False)[1]
+            self.size -= old_size
+
+    def pop(self, key):
+        """
+        Remove value from the cache.
+
+        :param key: Key.
+
+        :return: Value or None if not cached.
+        """
+        item = self._items.pop(key, None)
+        if item is None:
+            return None
+        self.size -= item[1]
+        return item[0]
+
+    def clear(self):
+        self._items.clear()
+        self.size = 0
@@ -1 +1 @@
-from .snapshot_cmd import save, restore
+from .snapshot_cmd import save, restore, verify, prune, archive_pack, archive_unpack, archive_list
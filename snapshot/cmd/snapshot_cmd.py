@@ -1,14 +1,23 @@
 import datetime
+import json
 import logging
 import os
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 
+from snapshot.blobstore import SnapshotBlobStore
 from snapshot.ca_core import PvStatus, ActionStatus, Snapshot
-from snapshot.core import SnapshotError
+from snapshot.core import SnapshotError, SnapshotPv
+from snapshot.parser import SnapshotReqFile, parse_macros
+from snapshot.retention import DAY, SnapshotRetentionRule, prune as prune_files
+from snapshot.archive import SnapshotArchive
+from snapshot.snapfile import SaveFileBodySummary, list_save_files, move_save_files, pack_save_files, \
+    unpack_save_files
 
 
-def save(req_file_path, save_file_path='.', macros=None, force=False, timeout=10, labels_str=None, comment=None):
+def save(req_file_path, save_file_path='.', macros=None, force=False, timeout=10, labels_str=None, comment=None,
+         compression=None, dedup_min_size=None):
     symlink_path = None
     if os.path.isdir(save_file_path):
         symlink_path = save_file_path + '/{}_latest.snap'.format(os.path.splitext(os.path.basename(req_file_path))[0])
@@ -35,13 +44,18 @@ def save(req_file_path, save_file_path='.', macros=None, force=False, timeout=10
         logging.error('Snapshot cannot be loaded due to a following error: {}'.format(e))
         sys.exit(1)
 
+    blob_store = None
+    if dedup_min_size is not None:
+        # Large waveforms are stored once in a blob store next to the saved file
+        blob_store = SnapshotBlobStore(os.path.dirname(os.path.abspath(save_file_path)), dedup_min_size)
+
     logging.info('Waiting for PVs connections (timeout: {} s) ...'.format(timeout))
     end_time = time.time() + timeout
     while snapshot.get_disconnected_pvs_names() and time.time() < end_time:
         time.sleep(0.2)
 
     status, pv_status = snapshot.save_pvs(save_file_path, force=force, labels=labels, comment=comment,
-                                          symlink_path=symlink_path)
+                                          symlink_path=symlink_path, compression=compression, blob_store=blob_store)
 
     if status != ActionStatus.ok:
         for pv_name, status in pv_status.items():
@@ -106,3 +120,243 @@ def restore(saved_file_path, force=False, timeout=10):
                 logging.error('\"{}\": No connection or no read access.'.format(pv_name))
 
         logging.error('Snapshot file was not restored.')
+
+
+# PV names from the request file, set once per verify worker process (see verify())
+_verify_req_pvs = None
+
+
+def _init_verify_worker(req_pvs):
+    global _verify_req_pvs
+    _verify_req_pvs = req_pvs
+
+
+def _verify_save_file(file_path):
+    """
+    Check single save file. Runs in a worker process.
+
+    :param file_path: Path to the save file.
+
+    :return: Report as dict {'file': <name>, 'ok': <bool>, 'errors': [...], 'warnings': [...], ...}
+    """
+    report = {'file': os.path.basename(file_path), 'ok': True, 'errors': list(), 'warnings': list()}
+    try:
+        body_summary = SaveFileBodySummary()
+        saved_pvs, meta_data, err = Snapshot.parse_from_save_file(file_path, body_summary)
+        actual_summary = body_summary.result()
+    except Exception as e:
+        # Truncated compressed files, permission problems, etc.
+        report['ok'] = False
+        report['errors'].append('File cannot be parsed: {}'.format(e))
+        return report
+
+    report['errors'] += err
+    summary = meta_data.get('summary')
+    if not isinstance(summary, dict):
+        report['warnings'].append('No summary in meta data (file saved with older version). Digest not checked.')
+    else:
+        if summary.get('body_sha256') != actual_summary['body_sha256']:
+            report['errors'].append('Digest of the file does not match the one in meta data (corrupted or '
+                                    'truncated file).')
+        if summary.get('pv_count') != actual_summary['pv_count']:
+            report['errors'].append('File has {} PVs, but {} were saved.'.format(actual_summary['pv_count'],
+                                                                                 summary.get('pv_count')))
+    report['pv_count'] = actual_summary['pv_count']
+    report['null_count'] = actual_summary['null_count']
+
+    if _verify_req_pvs is not None:
+        macros = meta_data.get('macros', dict())
+        req_pvs = set(SnapshotPv.macros_substitution(pvname, macros) for pvname in _verify_req_pvs)
+        report['missing_pvs'] = sorted(req_pvs - set(saved_pvs.keys()))
+        report['extra_pvs'] = sorted(set(saved_pvs.keys()) - req_pvs)
+        if report['missing_pvs']:
+            report['errors'].append('{} PVs from request file are not in the file.'.format(len(report['missing_pvs'])))
+
+    report['ok'] = not report['errors']
+    return report
+
+
+def verify(save_dir, req_file_path=None, macros=None, prefix='', jobs=None, out=None):
+    """
+    Check all save files in the directory in parallel (process pool) and write a report with one JSON object per
+    line (one for each file, and the last one with totals).
+
+    :param save_dir: Directory with save files.
+    :param req_file_path: If specified, check that all PVs from request file are in the save files.
+    :param macros: Macros for request file (dict or str "A=B,C=D").
+    :param prefix: Check only files starting with prefix.
+    :param jobs: Number of worker processes (default: number of CPUs).
+    :param out: Path to the report file (default: stdout).
+
+    :return: Number of files with errors.
+    """
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    req_pvs = None
+    if req_file_path:
+        if isinstance(macros, str):
+            macros = parse_macros(macros)
+        macros = macros or dict()
+        try:
+            req_pvs = [SnapshotPv.macros_substitution(pvname, macros) for pvname in
+                       SnapshotReqFile(req_file_path, changeable_macros=list(macros.keys())).read()]
+        except (IOError, SnapshotError) as e:
+            logging.error('Request file cannot be loaded due to a following error: {}'.format(e))
+            sys.exit(1)
+
+    # Symlinks (e.g. *_latest.snap) point to files which are checked anyway
+    file_paths = sorted(path for path in list_save_files(save_dir, prefix) if not os.path.islink(path))
+    logging.info('Verifying {} files ...'.format(len(file_paths)))
+
+    totals = {'files': len(file_paths), 'failed': 0, 'warnings': 0}
+    jobs = jobs or os.cpu_count() or 1
+    # Big enough chunks to keep inter-process overhead low, but small enough to balance the load
+    chunk_size = max(1, min(256, len(file_paths) // (jobs * 8)))
+    out_file = open(out, 'w') if out else sys.stdout
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_verify_worker, initargs=(req_pvs,)) as executor:
+            for report in executor.map(_verify_save_file, file_paths, chunksize=chunk_size):
+                totals['failed'] += not report['ok']
+                totals['warnings'] += bool(report['warnings'])
+                out_file.write(json.dumps(report) + '\n')
+
+        out_file.write(json.dumps({'totals': totals}) + '\n')
+    finally:
+        if out:
+            out_file.close()
+
+    if totals['failed']:
+        logging.error('{} of {} files have errors.'.format(totals['failed'], totals['files']))
+    else:
+        logging.info('All {} files are valid.'.format(totals['files']))
+    return totals['failed']
+
+
+def prune(save_dir, keep_all=None, keep_daily=None, keep_weekly=None, keep_labels=None, prefix='', archive_dir=None,
+          dry_run=False, out=None):
+    """
+    Delete (or archive) save files in the directory which are not kept by any of the retention rules. Names of pruned
+    files are written one per line.
+
+    :param save_dir: Directory with save files.
+    :param keep_all: Keep all files from the last keep_all days.
+    :param keep_daily: Keep the newest file of each day from the last keep_daily days.
+    :param keep_weekly: Keep the newest file of each week from the last keep_weekly days.
+    :param keep_labels: Keep all files with any of these labels.
+    :param prefix: Prune only files starting with prefix.
+    :param archive_dir: Move pruned files to this directory instead of deleting them.
+    :param dry_run: Only list files which would be pruned.
+    :param out: Path to the file with names of pruned files (default: stdout).
+
+    :return: Number of pruned files.
+    """
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    rules = list()
+    if keep_all is not None:
+        rules.append(SnapshotRetentionRule(within=keep_all * DAY))
+    if keep_daily is not None:
+        rules.append(SnapshotRetentionRule(within=keep_daily * DAY, every=DAY))
+    if keep_weekly is not None:
+        rules.append(SnapshotRetentionRule(within=keep_weekly * DAY, every=7 * DAY))
+    if keep_labels:
+        rules.append(SnapshotRetentionRule(labels=keep_labels))
+    if not rules:
+        logging.error('No retention rule specified. At least one of the --keep options is needed.')
+        sys.exit(1)
+
+    pruned = prune_files(save_dir, rules, prefix, archive_dir, dry_run)
+    out_file = open(out, 'w') if out else sys.stdout
+    try:
+        out_file.writelines(name + '\n' for name in pruned)
+    finally:
+        if out:
+            out_file.close()
+
+    if dry_run:
+        logging.info('{} files would be pruned.'.format(len(pruned)))
+    elif archive_dir:
+        logging.info('{} files were moved to {}.'.format(len(pruned), archive_dir))
+    else:
+        logging.info('{} files were deleted.'.format(len(pruned)))
+    return len(pruned)
+
+
+def archive_pack(archive_path, paths, prefix='', remove=False):
+    """
+    Append save files to the archive.
+
+    :param archive_path: Path to the archive (created if it does not exist).
+    :param paths: Paths to save files or directories (all save files in them are packed).
+    :param prefix: Pack only files (in directories) starting with prefix.
+    :param remove: Remove packed files.
+
+    :return: Number of packed files.
+    """
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    file_paths = list()
+    for path in paths:
+        if os.path.isdir(path):
+            # Symlinks (e.g. *_latest.snap) point to files which are packed anyway, hidden files are temporary
+            file_paths += sorted(file_path for file_path in list_save_files(path, prefix) if
+                                 not os.path.islink(file_path) and not os.path.basename(file_path).startswith('.'))
+        else:
+            file_paths.append(path)
+
+    try:
+        if remove:
+            packed = move_save_files(file_paths, archive_path)
+        else:
+            packed = pack_save_files(file_paths, archive_path)
+    except (OSError, SnapshotError) as e:
+        logging.error('Files cannot be packed due to a following error: {}'.format(e))
+        sys.exit(1)
+    logging.info('{} files were packed to {}.'.format(len(packed), archive_path))
+    return len(packed)
+
+
+def archive_unpack(archive_path, dest_dir='.', names=None):
+    """
+    Extract save files from the archive.
+
+    :param archive_path: Path to the archive.
+    :param dest_dir: Destination directory.
+    :param names: Names of files to be extracted (default: all).
+
+    :return: Number of extracted files.
+    """
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    try:
+        paths = unpack_save_files(archive_path, dest_dir, names or None)
+    except (OSError, SnapshotError) as e:
+        logging.error('Files cannot be extracted due to a following error: {}'.format(e))
+        sys.exit(1)
+    logging.info('{} files were extracted to {}.'.format(len(paths), dest_dir))
+    return len(paths)
+
+
+def archive_list(archive_path, out=None):
+    """
+    List save files in the archive, one JSON object per line (name, modification time, size, labels and comment).
+
+    :param archive_path: Path to the archive.
+    :param out: Path to the output file (default: stdout).
+
+    :return:
+    """
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    try:
+        members = SnapshotArchive(archive_path).get_members()
+    except (OSError, SnapshotError) as e:
+        logging.error('Archive cannot be read due to a following error: {}'.format(e))
+        sys.exit(1)
+
+    out_file = open(out, 'w') if out else sys.stdout
+    try:
+        for name, member in sorted(members.items(), key=lambda item: item[1]['mtime']):
+            metadata = member['metadata']
+            if metadata is not None:  # Blob store values have no meta data
+                out_file.write(json.dumps({'name': name, 'mtime': member['mtime'], 'size': member['size'],
+                                           'labels': metadata.get('labels', list()),
+                                           'comment': metadata.get('comment', '')}) + '\n')
+    finally:
+        if out:
+            out_file.close()
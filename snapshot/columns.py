@@ -0,0 +1,136 @@
+import numbers
+
+import numpy
+
+from snapshot.core import close_mask
+
+# Values of one snapshot file (or current PV values) for all PVs are kept column-wise. Numeric scalars are kept in a
+# numpy array, so columns can be compared in one vectorized pass, and only other values (arrays, strings) are kept as
+# objects. Kind of each value is one of:
+MISSING = 0  # no value (None)
+INT = 1
+FLOAT = 2
+OBJECT = 3  # array, string, or int which cannot be exactly represented as float
+
+_MAX_EXACT_INT = 2 ** 53
+
+
+def _kind(value):
+    if value is None:
+        return MISSING
+    elif isinstance(value, (bool, numpy.bool_)):
+        return INT
+    elif isinstance(value, numbers.Integral):
+        return INT if abs(value) <= _MAX_EXACT_INT else OBJECT
+    elif isinstance(value, numbers.Real):
+        return FLOAT
+    else:
+        return OBJECT
+
+
+class SnapshotColumn(object):
+    def __init__(self, values=(), size=None):
+        """
+        Column of PV values, one per row.
+
+        :param values: Sequence of values (None if PV has no value).
+        :param size: Number of rows. If bigger than len(values), rows are filled with None.
+
+        :return:
+        """
+        values = list(values)
+        if size is None:
+            size = len(values)
+        kinds = [_kind(value) for value in values]
+        kinds += [MISSING] * (size - len(values))
+
+        self.kinds = numpy.array(kinds, dtype=numpy.int8)
+        self.numbers = numpy.zeros(size, dtype=numpy.float64)
+        numeric = numpy.flatnonzero(self.is_numeric())
+        self.numbers[numeric] = [values[row] for row in numeric]
+        self.objects = {row: values[row] for row in numpy.flatnonzero(self.kinds == OBJECT).tolist()}
+        self.texts = dict()  # row: text, cache of formatted values, cleared when value changes
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, row):
+        kind = self.kinds[row]
+        if kind == INT:
+            return int(self.numbers[row])
+        elif kind == FLOAT:
+            return float(self.numbers[row])
+        elif kind == OBJECT:
+            return self.objects[row]
+        return None
+
+    def __setitem__(self, row, value):
+        kind = _kind(value)
+        self.kinds[row] = kind
+        if kind in (INT, FLOAT):
+            self.numbers[row] = value
+        if kind == OBJECT:
+            self.objects[row] = value
+        else:
+            self.objects.pop(row, None)
+        self.texts.pop(row, None)
+
+    def resize(self, size):
+        """
+        Change number of rows. Added rows have no value.
+
+        :param size: New number of rows.
+        :return:
+        """
+        old_size = len(self)
+        self.kinds = numpy.resize(self.kinds, size)
+        self.numbers = numpy.resize(self.numbers, size)
+        if size > old_size:
+            self.kinds[old_size:] = MISSING
+        else:
+            self.objects = {row: value for row, value in self.objects.items() if row < size}
+            self.texts = {row: text for row, text in self.texts.items() if row < size}
+
+    def is_numeric(self):
+        return (self.kinds == INT) | (self.kinds == FLOAT)
+
+
+def eq_mask(column1: SnapshotColumn, column2: SnapshotColumn, compare, tolerances=None):
+    """
+    Compare two columns row by row. Numeric values (and missing ones) are compared in one vectorized pass, only rows
+    with arrays or strings are compared by compare().
+
+    :param column1: Column of values.
+    :param column2: Column of values with same number of rows.
+    :param compare: Callable compare(row, value1, value2) returning True if values are equal.
+    :param tolerances: Tuple of numpy arrays (abs, rel) with tolerance of each row (see close_mask()), or None to
+                       compare numeric values exactly.
+
+    :return: Boolean numpy array, True for rows with equal values.
+    """
+    mask = (column1.kinds == MISSING) & (column2.kinds == MISSING)
+    if tolerances is None:
+        numbers_eq = column1.numbers == column2.numbers
+    else:
+        numbers_eq = close_mask(column1.numbers, column2.numbers, *tolerances)
+    mask |= column1.is_numeric() & column2.is_numeric() & numbers_eq
+    for row in numpy.flatnonzero((column1.kinds == OBJECT) | (column2.kinds == OBJECT)).tolist():
+        mask[row] = bool(compare(row, column1[row], column2[row]))
+    return mask
+
+
+def columns_eq_mask(columns, compare, size, tolerances=None):
+    """
+    Check for each row if values in all columns are equal to the first one (one vectorized pass per column).
+
+    :param columns: List of columns with size rows.
+    :param compare: Callable compare(row, value1, value2), see eq_mask().
+    :param size: Number of rows.
+    :param tolerances: Tolerance of each row, see eq_mask().
+
+    :return: Boolean numpy array, True for rows with all values equal (also if there are less than two columns).
+    """
+    mask = numpy.ones(size, dtype=bool)
+    for column in columns[1:]:
+        mask &= eq_mask(columns[0], column, compare, tolerances)
+    return mask
@@ -55,6 +55,7 @@ class SnapshotPv(PV):
         if connection_callback:
             self.add_conn_callback(connection_callback)
         self.is_array = False
+        self.tolerance = None  # PvTolerance used to compare values (restore is skipped if equal), None if exact
 
         super().__init__(pvname, connection_callback=self._internal_cnct_callback, auto_monitor=True,
                          connection_timeout=None, **kw)
@@ -192,21 +193,23 @@ class SnapshotPv(PV):
 
         :return: Result of comparison.
         """
-        return SnapshotPv.compare(value, self.value, self.is_array)
+        return SnapshotPv.compare(value, self.value, self.is_array, self.tolerance)
 
     @staticmethod
-    def compare(value1, value2, is_array=False):
+    def compare(value1, value2, is_array=False, tolerance=None):
         """
         Compare two values snapshot style (handling numpy arrays) for waveforms.
 
         :param value1: Value to be compared to value2.
         :param value2: Value to be compared to value1.
         :param is_array: Are values to be compared arrays?
+        :param tolerance: PvTolerance for numeric values (also elements of arrays), None for exact comparison.
 
         :return: Result of comparison.
         """
 
-        if is_array:
+        if is_array or isinstance(value1, numpy.ndarray) or isinstance(value2, numpy.ndarray):
+            # Arrays are also compared element-wise if PV is not known to be an array (e.g. disconnected PV)
             # Because of how pyepics works, array value can also be sent as scalar (nord=1) and
             # numpy.size() will return 1
             # or as (type: epics.dbr.c_double_Array_0) if array is empty --> numpy.size() will
@@ -222,8 +225,18 @@ class SnapshotPv(PV):
             elif numpy.size(value2) == 0:
                 value2 = None
 
+            if tolerance and value1 is not None and value2 is not None and \
+                    numpy.shape(value1) == numpy.shape(value2) and _is_numeric(value1) and _is_numeric(value2):
+                return bool(numpy.all(close_mask(numpy.asarray(value1, dtype=numpy.float64),
+                                                 numpy.asarray(value2, dtype=numpy.float64),
+                                                 tolerance.abs, tolerance.rel)))
+
             return numpy.array_equal(value1, value2)
 
+        elif tolerance and numpy.size(value1) == 1 and numpy.size(value2) == 1 and _is_numeric(value1) and \
+                _is_numeric(value2):
+            return bool(close_mask(float(value1), float(value2), tolerance.abs, tolerance.rel))
+
         else:
             return value1 == value2
 
@@ -297,3 +310,19 @@ class SnapshotPv(PV):
             txt = txt.replace(macro, macros[key])
         return txt
 
+
+def _is_numeric(value):
+    return numpy.asarray(value).dtype.kind in 'iuf'
+
+
+def close_mask(values1, values2, tolerance_abs, tolerance_rel):
+    """
+    Element-wise comparison of numeric values with tolerance: values are equal if they differ by at most
+    tolerance_abs + tolerance_rel * (larger of their absolute values). Arguments can be scalars or numpy arrays.
+
+    :return: Boolean (array).
+    """
+    with numpy.errstate(invalid='ignore'):
+        return (values1 == values2) | (numpy.abs(values1 - values2) <=
+                                       tolerance_abs + tolerance_rel * numpy.maximum(numpy.abs(values1),
+                                                                                     numpy.abs(values2)))
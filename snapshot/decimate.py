@@ -0,0 +1,44 @@
+import numpy
+
+
+def minmax_decimate(values, start, stop, n_bins):
+    """
+    Decimate values[start:stop] for drawing: elements are split to n_bins bins of equal size, and only minimum and
+    maximum of each bin are kept (in their original order). Line drawn through them with one bin per pixel looks the
+    same as line through all values (peaks are not lost).
+
+    :param values: 1D numpy array (float).
+    :param start: Index of first element.
+    :param stop: Index after last element.
+    :param n_bins: Number of bins (e.g. width of the plot in pixels).
+
+    :return: Tuple of numpy arrays (indices, values), indices are positions of kept elements in values. If there are
+             at most 2 * n_bins elements, all are returned.
+    """
+    start = max(int(start), 0)
+    stop = min(int(stop), len(values))
+    n_bins = max(int(n_bins), 1)
+    n = stop - start
+    if n <= 0:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=values.dtype)
+
+    if n <= 2 * n_bins:
+        return numpy.arange(start, stop), values[start:stop]
+
+    # Pad last bin with the last value (does not change its minimum and maximum)
+    size = -(-n // n_bins)
+    n_bins = -(-n // size)
+    segment = values[start:stop]
+    if n_bins * size > n:
+        segment = numpy.concatenate((segment, numpy.full(n_bins * size - n, segment[-1])))
+    bins = segment.reshape(n_bins, size)
+
+    i_min = numpy.argmin(bins, axis=1)
+    i_max = numpy.argmax(bins, axis=1)
+    offsets = numpy.arange(n_bins) * size
+    indices = numpy.empty(2 * n_bins, dtype=numpy.int64)
+    indices[0::2] = offsets + numpy.minimum(i_min, i_max)
+    indices[1::2] = offsets + numpy.maximum(i_min, i_max)
+    indices = numpy.minimum(indices, n - 1)
+
+    return indices + start, values[start + indices]
@@ -4,6 +4,7 @@
 # but WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
 
+import hashlib
 import json
 import os
 import re
@@ -14,8 +15,15 @@ from PyQt5 import QtGui, QtCore, QtWidgets
 from PyQt5.QtCore import Qt
 
 from ..ca_core import Snapshot, SnapshotPv
+from ..columns import SnapshotColumn, columns_eq_mask, eq_mask
+from ..name_index import SnapshotNameIndex
+from .waveform import SnapshotWaveformWidget
 
-import time
+
+# Arrays with more elements are shown summarized in the PV table (first elements, number of elements and a hash). Tool
+# tip shows up to ARRAY_TOOLTIP_SIZE elements, and full value can be copied from the context menu.
+ARRAY_SUMMARY_SIZE = 8
+ARRAY_TOOLTIP_SIZE = 1000
 
 
 class PvCompareFilter(Enum):
@@ -40,8 +48,10 @@ class SnapshotCompareWidget(QtWidgets.QWidget):
         self.view = SnapshotPvTableView(self)
         self.view.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
         self.view.restore_requested.connect(self._handle_restore_request)
+        self.view.waveform_requested.connect(self._show_waveform)
 
         self.model = SnapshotPvTableModel(self)
+        self.model.rows_changed.connect(self._handle_rows_changed)
         self._proxy = SnapshotPvFilterProxyModel(self)
         self._proxy.setSourceModel(self.model)
         self._proxy.filtered.connect(self._handle_filtered)
@@ -49,6 +59,16 @@ class SnapshotCompareWidget(QtWidgets.QWidget):
         # Build model and set default visualization on view (column widths, etc)
         #TODO self.model.add_pvs(doc.snapshot.pvs.values())
         self.view.setModel(self._proxy)
+        self.view.selectionModel().currentRowChanged.connect(self._handle_current_row_changed)
+
+        # Plots of array values of the selected PV (opened from the context menu)
+        self.waveform = SnapshotWaveformWidget(self)
+        self.waveform.hide()
+        splitter = QtWidgets.QSplitter(Qt.Vertical, self)
+        splitter.addWidget(self.view)
+        splitter.addWidget(self.waveform)
+        splitter.setStretchFactor(0, 2)
+        splitter.setStretchFactor(1, 1)
 
         # ---------- Filter control elements ---------------
         # - text input to filter by name
@@ -136,7 +156,7 @@ class SnapshotCompareWidget(QtWidgets.QWidget):
         layout.setContentsMargins(10,10,10,10)
         layout.setSpacing(10)
         layout.addLayout(filter_layout)
-        layout.addWidget(self.view)
+        layout.addWidget(splitter)
         self.setLayout(layout)
 
     def _handle_filtered(self, pvs_names_list):
@@ -173,33 +193,69 @@ class SnapshotCompareWidget(QtWidgets.QWidget):
         self.model.add_snap_files(selected_files)
         self._proxy.apply_filter()
 
-    def sel_changed_files(self,selItems):
-        doc=QtWidgets.QApplication.instance().doc
-        #self.model.clear_snap_files()
-        objDict=dict()
-        for item in selItems:
-            fn=item.text(1)
-            meta=item.data(0,0x100)
-            pvs_list=item.data(0,0x101)
-            if pvs_list is None:
-                pvs_list, meta_data, err=doc.snapshot.parse_from_save_file(os.path.join(doc.save_dir, fn))
-                item.setData(0,0x101,pvs_list)
-            objDict[fn]={'meta_data':meta,'pvs_list':pvs_list}
-        self.model.add_snap_files(objDict)
-        #self._proxy.apply_filter()
+    def sel_changed_files(self, selected_files):
+        # selected_files is a dict() with file names as keywords and dict() of file data (meta_data, pvs_list) as value
+        self.model.clear_snap_files()
+        self.model.add_snap_files(selected_files)
+        self._proxy.apply_filter()
+        self._update_waveform()
+
+    def add_snap_file(self, file_name, file_data, selected_files):
+        """
+        Add column of the file (e.g. parsed after the selection changed), without rebuilding columns of the shown files.
 
+        :param file_name: File name.
+        :param file_data: Dict of file data (meta_data, pvs_list).
+        :param selected_files: Ordered list of selected files, column is put to the position of the file in it.
+        :return:
+        """
+        shown_files = self.model.get_snap_file_names()
+        if file_name in shown_files:
+            return
+        position = len([name for name in selected_files[:selected_files.index(file_name)] if name in shown_files])
+        rows = self.model.insert_snap_file(position, file_name, file_data)
+        if rows is None:
+            self._proxy.apply_filter()  # Compare mode changed
+        else:
+            self._proxy.refilter_rows(rows)
+        self._update_waveform()
 
     def update_shown_files(self, updated_files):
         self.model.update_snap_files(updated_files)
         self._proxy.apply_filter()
+        self._update_waveform()
 
     def handle_new_snapshot_instance(self, snapshot):
         doc=QtWidgets.QApplication.instance().doc
         doc.snapshot = snapshot
+        self.waveform.hide()
+        self.waveform.pvname = None
         self.model.clear_pvs()
         self.model.add_pvs(snapshot.pvs.values())
         self.view.sortByColumn(0, Qt.AscendingOrder)  # default sorting
 
+    def _show_waveform(self, pvname):
+        self.waveform.show()
+        self._update_waveform(pvname)
+
+    def _update_waveform(self, pvname=None):
+        pvname = pvname or self.waveform.pvname
+        row = self.model.get_row(pvname)
+        if self.waveform.isVisible() and row is not None:
+            self.waveform.set_values(pvname, *self.model.get_values(row))
+
+    def _handle_current_row_changed(self, current, previous):
+        # Open waveform follows the selected array PV
+        if self.waveform.isVisible() and current.isValid():
+            row = self._proxy.mapToSource(current).row()
+            if self.model.is_array_row(row):
+                self._update_waveform(self.model.get_pvname(row))
+
+    def _handle_rows_changed(self, rows):
+        # Current value of the shown PV changed
+        if self.waveform.isVisible() and self.model.get_row(self.waveform.pvname) in rows:
+            self._update_waveform()
+
     def _handle_restore_request(self, pvs_list):
         self.restore_requested.emit(pvs_list)
 
@@ -229,6 +285,7 @@ class SnapshotPvTableView(QtWidgets.QTableView):
     """
 
     restore_requested = QtCore.pyqtSignal(list)
+    waveform_requested = QtCore.pyqtSignal(str)
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -257,23 +314,44 @@ class SnapshotPvTableView(QtWidgets.QTableView):
         :return:
         """
         super().setModel(model)
+        self.model().sourceModel().set_visible_rows_getter(self.get_visible_source_rows)
         self.model().sourceModel().columnsInserted.connect(self.set_snap_visualization)
         self.model().sourceModel().columnsRemoved.connect(self.set_snap_visualization)
         self.set_default_visualization()
         self.sortByColumn(0, Qt.AscendingOrder)  # default sorting
 
-    def dataChanged(self, mode_idx, mode_idx1):
+    def dataChanged(self, mode_idx, mode_idx1, roles=()):
         """
-        Force update of the view on any data change in the model. If self.viewport().update() is not called here
-        the view is not updated if application window is not in focus.
- 
+        Force update of the changed rows on any data change in the model. If self.viewport().update() is not called
+        here the view is not updated if application window is not in focus.
+
         :param mode_idx:
         :param mode_idx1:
         :return:
         """
 
-        super().dataChanged(mode_idx, mode_idx1)
-        self.viewport().update()
+        super().dataChanged(mode_idx, mode_idx1, roles)
+        rect = self.visualRect(mode_idx).united(self.visualRect(mode_idx1))
+        rect.setLeft(0)
+        rect.setRight(self.viewport().width())
+        self.viewport().update(rect)
+
+    def get_visible_source_rows(self):
+        """
+        Get rows of the source model (SnapshotPvTableModel) which are currently visible in the view.
+
+        :return: Set of row numbers.
+        """
+        if not self.isVisible():
+            return set()
+        proxy = self.model()
+        first = self.rowAt(0)
+        if first < 0:
+            return set()
+        last = self.rowAt(self.viewport().height() - 1)
+        if last < 0:
+            last = proxy.rowCount() - 1
+        return set(proxy.mapToSource(proxy.index(row, 0)).row() for row in range(first, last + 1))
 
     def reset(self):
         super().reset()
@@ -329,6 +407,10 @@ class SnapshotPvTableView(QtWidgets.QTableView):
 
         if selected_rows:
             menu.addAction("Copy PV name", self._copy_pv_name)
+            if self.indexAt(point).column() == 1 or self.indexAt(point).column() > 2:
+                menu.addAction("Copy value", self._copy_value)
+            if self.model().sourceModel().is_array_row(self.model().mapToSource(self.indexAt(point)).row()):
+                menu.addAction("Plot values", self._plot_values)
             if len(selected_rows) == 1 and len(self.model().sourceModel().get_snap_file_names()) == 1:
                     menu.addAction("Restore selected PV", self._restore_selected_pvs)
 
@@ -356,6 +438,15 @@ class SnapshotPvTableView(QtWidgets.QTableView):
         idx = self.indexAt(self._menu_click_pos)
         cb.setText(self._get_pvname_with_selection_model_idx(idx), mode=cb.Clipboard)
 
+    def _plot_values(self):
+        self.waveform_requested.emit(self._get_pvname_with_selection_model_idx(self.indexAt(self._menu_click_pos)))
+
+    def _copy_value(self):
+        cb = QtWidgets.QApplication.clipboard()
+        cb.clear(mode=cb.Clipboard)
+        idx = self.model().mapToSource(self.indexAt(self._menu_click_pos))
+        cb.setText(self.model().sourceModel().get_value_text(idx.row(), idx.column()) or '', mode=cb.Clipboard)
+
     def _get_pvname_with_selection_model_idx(self, idx: QtCore.QModelIndex):
         # Map index from selection model to original model
         # Access original model through proxy model and get pv name.
@@ -366,16 +457,47 @@ class SnapshotPvTableView(QtWidgets.QTableView):
 class SnapshotPvTableModel(QtCore.QAbstractTableModel):
     """
     Model of the PV table. Handles adding and removing PVs (rows) and snapshot files (columns).
-    Each row (PV) is represented with SnapshotPvTableLine object. It doesnt emmit dataChange() on each
-    PV change, but rather 5 times per second if some PVs have changed in this time. This increases performance.
+    Rows are stored flat: lists of PVs and their callback ids, a boolean array of connection states and a column of
+    current values (see SnapshotColumn), so no object is created per row. Values of snapshot files are held
+    column-wise as well, and text of values is only formatted when shown and cached in the columns.
+
+    PV changes are not handled on each CA callback: the same callbacks of the model (for all PVs) only store the
+    latest value or connection state in a dict, which is drained 2 times per second (no signal is emitted from the CA
+    threads, and single dict operations are atomic, so no lock is needed). Changed rows are collected, and
+    dataChanged() is only emitted for the changed rows visible in the view (see set_visible_rows_getter()), one per
+    range of consecutive rows. Rows which are not visible are read when scrolled to anyway. rows_changed is emitted
+    with all changed rows (e.g. for filtering).
+
+    Results of comparison (are all files equal, is file equal to current value) are kept as boolean arrays, computed
+    in one vectorized pass per column when files change, and only for the changed rows when PVs change.
     """
+    rows_changed = QtCore.pyqtSignal(list)
+    _DIR_PATH = os.path.dirname(os.path.realpath(__file__))
+    _WARN_ICON = None
+    _NEQ_ICON = None
 
     def __init__(self, parent=None):
         super().__init__(parent)
-        self._pvs_lines = dict()
-        self._data = list()
+        self._pvs = list()  # SnapshotPv of each row
+        self._pvs_rows = dict()  # pvname: row
+        self._name_index = SnapshotNameIndex()
+        self._clb_ids = list()  # (connection callback id, value callback id) of each row
+        self._conn = numpy.zeros(0, dtype=bool)  # is PV connected
         self._headers = ['PV', 'Current value', '']
-        self._some_data_changed = False
+        self._changed_rows = set()
+        self._get_visible_rows = None
+        self._pending_values = dict()  # pvname: value, filled from CA threads
+        self._pending_conns = dict()  # pvname: connection state, filled from CA threads
+        self._snap_columns = list()  # SnapshotColumn per file
+        self._curr_column = SnapshotColumn()  # current values (None if disconnected)
+        self._files_eq = numpy.ones(0, dtype=bool)  # are values in all files equal
+        self._curr_eq = numpy.ones(0, dtype=bool)  # is value in the (only) file equal to current value
+        self._tolerances = (numpy.zeros(0), numpy.zeros(0))  # abs and rel tolerance of each row (0 if exact)
+
+        # Icons are shared by all rows
+        if SnapshotPvTableModel._WARN_ICON is None:
+            SnapshotPvTableModel._WARN_ICON = QtGui.QIcon(os.path.join(self._DIR_PATH, "images/warn.png"))
+            SnapshotPvTableModel._NEQ_ICON = QtGui.QIcon(os.path.join(self._DIR_PATH, "images/neq.png"))
 
         self._timer = QtCore.QTimer()
         self._timer.timeout.connect(self._push_data_to_view)
@@ -385,11 +507,66 @@ class SnapshotPvTableModel(QtCore.QAbstractTableModel):
     def get_snap_file_names(self):
         return self._file_names
 
+    def set_visible_rows_getter(self, get_visible_rows):
+        """
+        Set callable returning the set of rows visible in the view. If not set, all changed rows are emitted.
+
+        :param get_visible_rows: Callable get_visible_rows() or None.
+        :return:
+        """
+        self._get_visible_rows = get_visible_rows
+
     def get_pvname(self, line: int):
-        return self.get_pv_line_model(line).pvname
+        return self._pvs[line].pvname
+
+    def get_row(self, pvname):
+        return self._pvs_rows.get(pvname)
+
+    def match_names(self, name_filter):
+        """
+        Get rows with PV names matching the filter (see SnapshotNameIndex.match()).
+
+        :param name_filter: Substring (str) or compiled regular expression.
+        :return: Read only numpy bool array.
+        """
+        return self._name_index.match(name_filter)
+
+    def is_connected(self, row):
+        return bool(self._conn[row])
+
+    def get_values(self, row):
+        """
+        Get current and saved values of the PV.
+
+        :param row: Row index.
+        :return: Tuple (current value or None if disconnected, list of (file name, saved value)).
+        """
+        return self._curr_column[row], [(file_name, column[row]) for file_name, column in
+                                        zip(self._headers[3:], self._snap_columns)]
 
-    def get_pv_line_model(self, line: int):
-        return self._pvs_lines.get(self.data(self.createIndex(line, 0), QtCore.Qt.DisplayRole), None)
+    def is_array_row(self, row):
+        """
+        Check if PV is an array, or has an array saved in one of the files.
+
+        :param row: Row index.
+        :return: True if array.
+        """
+        if not 0 <= row < len(self._pvs):
+            return False
+        return self._pvs[row].is_array or any(isinstance(column[row], (list, numpy.ndarray))
+                                              for column in self._snap_columns + [self._curr_column])
+
+    def refresh_rows(self, rows):
+        """
+        Emit dataChanged() for given rows (one per range of consecutive rows), e.g. so the proxy model filters them
+        again.
+
+        :param rows: Sorted list of row numbers.
+        :return:
+        """
+        last_column = len(self._headers) - 1
+        for first, last in _row_ranges(rows):
+            self.dataChanged.emit(self.createIndex(first, 0), self.createIndex(last, last_column))
 
     def add_pvs(self, pvs: list):
         """
@@ -400,10 +577,19 @@ class SnapshotPvTableModel(QtCore.QAbstractTableModel):
         """
         self.beginResetModel()
         for pv in pvs:
-            line = SnapshotPvTableLine(pv, self)
-            self._pvs_lines[pv.pvname] = line
-            self._data.append(line)
-            self._data[-1].data_changed.connect(self.handle_pv_change)
+            self._pvs_rows[pv.pvname] = len(self._pvs)
+            self._pvs.append(pv)
+            self._clb_ids.append((pv.add_conn_callback(self._conn_callback), pv.add_callback(self._callback)))
+
+        self._name_index = SnapshotNameIndex([pv.pvname for pv in self._pvs])
+
+        # If connected take current value (might missed first callbacks). New PVs have no value in the shown files.
+        self._conn = numpy.array([bool(pv.connected) for pv in self._pvs], dtype=bool)
+        self._curr_column = SnapshotColumn([pv.value if conn else None for pv, conn in zip(self._pvs, self._conn)])
+        for column in self._snap_columns:
+            column.resize(len(self._pvs))
+        self._update_tolerances()
+        self._compare_all()
         self.endResetModel()
 
     def add_snap_files(self, files: dict):
@@ -421,18 +607,44 @@ class SnapshotPvTableModel(QtCore.QAbstractTableModel):
             # To get a proper update, need to go through all existing pvs. Otherwise values of PVs listed in request
             # but not in the saved file are not cleared (value from previous file is seen on the screen)
             self._headers.append(file_name)
-            for pvname, pv_line in self._pvs_lines.items():
-                pv_data = pvs_list_full_names.get(pvname, {"value": None})
-                pv_line.append_snap_value(pv_data.get("value", None))
+            self._snap_columns.append(self._create_snap_column(pvs_list_full_names))
+        self._compare_all()
         self.endInsertColumns()
         self.insertColumns(1, 1, QtCore.QModelIndex())
 
+    def insert_snap_file(self, position, file_name, file_data):
+        """
+        Insert column of one file. Comparison is updated only with the new column.
+
+        :param position: Position among the file columns.
+        :param file_name: File name.
+        :param file_data: Dict of file data (meta_data, pvs_list).
+        :return: Rows whose comparison changed, or None if compare mode (number of files) changed so all rows are
+                 affected.
+        """
+        column = self._create_snap_column(self._replace_macros_on_file_data(file_data))
+        self.beginInsertColumns(QtCore.QModelIndex(), 3 + position, 3 + position)
+        self._file_names.insert(position, file_name)
+        self._headers.insert(3 + position, file_name)
+        self._snap_columns.insert(position, column)
+        if len(self._snap_columns) <= 2:
+            self._compare_all()
+            rows = None
+        else:
+            # All other columns are already equal to each other
+            reference = self._snap_columns[1 if position == 0 else 0]
+            files_eq = self._files_eq & eq_mask(reference, column, self._compare_values, self._tolerances)
+            rows = numpy.flatnonzero(files_eq != self._files_eq).tolist()
+            self._files_eq = files_eq
+        self.endInsertColumns()
+        return rows
+
     def clear_snap_files(self):
         self._file_names = list()
         self.beginRemoveColumns(QtCore.QModelIndex(), 3, self.columnCount(self.createIndex(-1, -1)) - 1)
         # remove all snap files
-        for pvname, pv_line in self._pvs_lines.items():  # Go through all existing pv lines
-            pv_line.clear_snap_values()
+        self._snap_columns = list()
+        self._compare_all()
 
         self._headers = self._headers[0:3]
         self.endRemoveColumns()
@@ -443,23 +655,131 @@ class SnapshotPvTableModel(QtCore.QAbstractTableModel):
         :return:
         """
         self.beginResetModel()
-        for line in self._pvs_lines.values():
-            line.disconnect_callbacks()
-        self._data = list()
-        self._pvs_lines = dict()
+        for pv, (conn_clb_id, clb_id) in zip(self._pvs, self._clb_ids):
+            pv.remove_conn_callback(conn_clb_id)
+            pv.remove_callback(clb_id)
+        self._pvs = list()
+        self._pvs_rows = dict()
+        self._name_index = SnapshotNameIndex()
+        self._clb_ids = list()
+        self._conn = numpy.zeros(0, dtype=bool)
+        self._changed_rows = set()
+        self._pending_values.clear()
+        self._pending_conns.clear()
+        self._snap_columns = [SnapshotColumn() for column in self._snap_columns]
+        self._curr_column = SnapshotColumn()
+        self._update_tolerances()
+        self._compare_all()
         self.endResetModel()
 
     def update_snap_files(self, updated_files):
         # Check if one of updated files is currently selected, and update
         # the values if it is.
-        for file_name in self._headers:
+        changed = False
+        for idx, file_name in enumerate(self._headers[3:]):
             file_data = updated_files.get(file_name, None)
             if file_data is not None:
-                saved_pvs = self._replace_macros_on_file_data(file_data)
-                idx = self._headers.index(file_name)
-                for pvname, pv_line in self._pvs_lines.items():
-                    pv_data = saved_pvs.get(pvname, {"value": None})
-                    pv_line.change_snap_value(idx, pv_data.get("value", None))
+                self._snap_columns[idx] = self._create_snap_column(self._replace_macros_on_file_data(file_data))
+                changed = True
+
+        if changed:
+            self._compare_all()
+
+    def _create_snap_column(self, saved_pvs):
+        # Values of PVs not in the saved file are None
+        return SnapshotColumn([saved_pvs.get(pv.pvname, {}).get("value", None) for pv in self._pvs])
+
+    def _update_tolerances(self):
+        tolerances = [pv.tolerance or (0, 0) for pv in self._pvs]
+        self._tolerances = (numpy.array([tolerance[0] for tolerance in tolerances], dtype=numpy.float64),
+                            numpy.array([tolerance[1] for tolerance in tolerances], dtype=numpy.float64))
+
+    def _compare_values(self, row, value1, value2):
+        pv = self._pvs[row]
+        return SnapshotPv.compare(value1, value2, pv.is_array, pv.tolerance)
+
+    def _compare_all(self):
+        # Vectorized comparison of all rows (when files or PVs are changed), with tolerance of each PV
+        self._files_eq = columns_eq_mask(self._snap_columns, self._compare_values, len(self._pvs), self._tolerances)
+        if len(self._snap_columns) == 1:
+            self._curr_eq = eq_mask(self._snap_columns[0], self._curr_column, self._compare_values,
+                                    self._tolerances)
+        else:
+            self._curr_eq = numpy.ones(len(self._pvs), dtype=bool)
+
+    def _compare_row(self, row):
+        # Compare single row (when its PV is changed, since comparison of arrays depends on PV type)
+        values = [column[row] for column in self._snap_columns]
+        self._files_eq[row] = all(self._compare_values(row, values[0], value) for value in values[1:])
+        if len(values) == 1:
+            self._curr_eq[row] = self._compare_values(row, values[0], self._curr_column[row])
+
+    def get_snap_count(self):
+        return len(self._snap_columns)
+
+    def are_snap_values_eq(self, row):
+        return bool(self._files_eq[row])
+
+    def is_snap_eq_to_pv(self, row):
+        return bool(self._conn[row] and self._curr_eq[row])
+
+    def get_value_text(self, row, column):
+        """
+        Get full (not summarized) text of the value in the column.
+
+        :param row: Row index.
+        :param column: Column index.
+        :return: Text or None if column has no value.
+        """
+        if column == 0:
+            return self._pvs[row].pvname
+        elif column == 1:
+            if not self._conn[row]:
+                return None
+            return self._format_curr_value(row)
+        elif column == 2:
+            return None
+        return format_value(self._snap_columns[column - 3][row])
+
+    def _format_curr_value(self, row, max_size=None):
+        value = self._curr_column[row]
+        if value is None:
+            return ''
+        if max_size is not None and is_large_array(value, max_size):
+            return summarize_array(value, max_size)
+        return SnapshotPv.value_to_str(value, self._pvs[row].is_array or isinstance(value, numpy.ndarray)) or ''
+
+    def _get_text(self, row, column):
+        # Values are formatted only when shown and kept until they change
+        if column == 0:
+            return self._pvs[row].pvname
+        elif column == 1:
+            if not self._conn[row]:
+                return 'PV disconnected'
+            texts = self._curr_column.texts
+            text = texts.get(row)
+            if text is None:
+                text = texts[row] = self._format_curr_value(row, ARRAY_SUMMARY_SIZE)
+            return text
+        elif column == 2:
+            return ''
+
+        column = self._snap_columns[column - 3]
+        text = column.texts.get(row)
+        if text is None:
+            text = column.texts[row] = format_value(column[row], ARRAY_SUMMARY_SIZE)
+        return text
+
+    def _get_tooltip(self, row, column):
+        # Value of the summarized arrays with up to ARRAY_TOOLTIP_SIZE elements
+        if column == 1:
+            if self._conn[row] and is_large_array(self._curr_column[row], ARRAY_SUMMARY_SIZE):
+                return self._format_curr_value(row, ARRAY_TOOLTIP_SIZE)
+        elif column > 2:
+            value = self._snap_columns[column - 3][row]
+            if is_large_array(value, ARRAY_SUMMARY_SIZE):
+                return format_value(value, ARRAY_TOOLTIP_SIZE)
+        return None
 
     def _replace_macros_on_file_data(self, file_data):
         doc=QtWidgets.QApplication.instance().doc
@@ -476,207 +796,199 @@ class SnapshotPvTableModel(QtCore.QAbstractTableModel):
 
     # Reimplementation of parent methods needed for visualization
     def rowCount(self, parent):
-        return len(self._data)
+        return len(self._pvs)
 
     def columnCount(self, parent):
         return len(self._headers)
 
     def data(self, index, role):
+        row, column = index.row(), index.column()
         if role == QtCore.Qt.DisplayRole:
-            return self._data[index.row()].data[index.column()].get('data', '')
+            return self._get_text(row, column)
+        elif role == QtCore.Qt.ToolTipRole:
+            return self._get_tooltip(row, column)
         elif role == QtCore.Qt.DecorationRole:
-            return self._data[index.row()].data[index.column()].get('icon', None)
-
-    def handle_pv_change(self, pv_line):
-        self._some_data_changed = True
+            if column == 1 and not self._conn[row]:
+                return self._WARN_ICON
+            elif column == 2 and len(self._snap_columns) == 1 and self._conn[row] and not self._curr_eq[row]:
+                # Compare result (only if one file is selected)
+                return self._NEQ_ICON
+            return None
+
+    def _callback(self, pvname=None, value=None, **kw):
+        # Called from CA threads for all PVs
+        self._pending_values[pvname] = value
+
+    def _conn_callback(self, pvname=None, conn=None, **kw):
+        # Called from CA threads for all PVs. Value received before disconnection is outdated (value received after
+        # connection is the first monitor value and is kept).
+        if not conn:
+            self._pending_values.pop(pvname, None)
+        self._pending_conns[pvname] = conn
+
+    def _apply_pv_updates(self):
+        # Applies PV changes collected since the last call (only the latest value of each PV). Connection changes are
+        # applied first, since values received before them are dropped.
+        for pvname, conn in _drain(self._pending_conns).items():
+            row = self._pvs_rows.get(pvname)
+            if row is not None:
+                # Value is not read here (it might be a blocking CA get), it is set by the first monitor callback
+                self._conn[row] = bool(conn)
+                self._curr_column[row] = None
+                self._compare_row(row)
+                self._changed_rows.add(row)
+
+        for pvname, value in _drain(self._pending_values).items():
+            row = self._pvs_rows.get(pvname)
+            if row is not None and self._conn[row]:
+                self._curr_column[row] = value
+                self._compare_row(row)
+                self._changed_rows.add(row)
 
     def _push_data_to_view(self):
         """
-        This function is called periodically by self._timer. It emits dataChanged() signal
-        which forces views to update the whole PV table.
+        This function is called periodically by self._timer. It applies PV changes and emits dataChanged() signal for
+        the changed rows which are visible in the view.
         """
-        if self._some_data_changed:
-            # Something changed. Update view.
-            self._some_data_changed = False
-            self.dataChanged.emit(self.createIndex(0, 0), self.createIndex(len(self._data) - 1,
-                                  len(self._data[-1].data) - 1))
+        self._apply_pv_updates()
+        if not self._changed_rows:
+            return
+        changed_rows = sorted(self._changed_rows)
+        self._changed_rows = set()
+
+        rows = changed_rows
+        if self._get_visible_rows is not None:
+            visible_rows = self._get_visible_rows()
+            rows = [row for row in changed_rows if row in visible_rows]
+
+        self.refresh_rows(rows)
+        self.rows_changed.emit(changed_rows)
 
     def headerData(self, section, orientation, role):
         if role == QtCore.Qt.DisplayRole:
             return self._headers[section]
 
 
-class SnapshotPvTableLine(QtCore.QObject):
-    """
-    Model of row in the PV table. Uses SnapshotPv callbacks to update its
-    visualization of the PV state.
-    """
-    _pv_changed = QtCore.pyqtSignal(dict)
-    _pv_conn_changed = QtCore.pyqtSignal(dict)
-    data_changed = QtCore.pyqtSignal(QtCore.QObject)
-    _DIR_PATH = os.path.dirname(os.path.realpath(__file__))
-
-    def __init__(self, pv_ref, parent=None):
-        super().__init__(parent)
-        self._WARN_ICON = QtGui.QIcon(os.path.join(self._DIR_PATH, "images/warn.png"))
-        self._NEQ_ICON = QtGui.QIcon(os.path.join(self._DIR_PATH, "images/neq.png"))
-
-        self._pv_ref = pv_ref
-        self.pvname = pv_ref.pvname
-        self.data = [{'data': pv_ref.pvname},
-                     {'data': 'PV disconnected', 'icon': self._WARN_ICON},  # current value
-                     {'icon': None}]  # Compare result
-
-        self._conn_clb_id = pv_ref.add_conn_callback(self._conn_callback)
-        self._clb_id = pv_ref.add_callback(self._callback)
-
-        # Internal signal
-        self._pv_conn_changed.connect(self._handle_conn_callback)
-        self._pv_changed.connect(self._handle_callback)
-
-        # If connected take current value (might missed first callbacks)
-        if pv_ref.connected:
-            self.conn = pv_ref.connected
-            self.data[1]['data'] = pv_ref.value_as_str()
-            self.data[1]['icon'] = None
-
-        else:
-            self.conn = False
-
-        self._last_update = time.time()
-        self._signal_emitted = False
-
-    def disconnect_callbacks(self):
-        """
-        Disconnect from SnapshotPv object. Should be called before removing line from model.
-        :return:
-        """
-        self._pv_ref.remove_conn_callback(self._conn_clb_id)
-        self._pv_ref.remove_callback(self._clb_id)
-
-    def append_snap_value(self, value):
-        if value is not None:
-            self.data.append({'data': SnapshotPvTableLine.string_repr_snap_value(value), 'raw_value': value})
-        else:
-            self.data.append({'data': '', 'raw_value': None})
-
-        # Do compare
-        self._compare()
-
-    def change_snap_value(self, idx, value):
-        if value is not None:
-            self.data[idx]['data'] = SnapshotPvTableLine.string_repr_snap_value(value)
-            self.data[idx]['raw_value'] = value
+def _drain(pending: dict):
+    # Takes items of dict filled from other threads. Only as many items as present at the start are taken, so it
+    # returns even if the dict is refilled faster than drained (rest is taken on the next call).
+    items = dict()
+    for _ in range(len(pending)):
+        try:
+            key, value = pending.popitem()
+        except KeyError:
+            break  # Emptied in the meantime
+        items[key] = value
+    return items
+
+
+def _row_ranges(rows):
+    # Sorted row numbers to (first, last) ranges of consecutive rows
+    ranges = list()
+    for row in rows:
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1][1] = row
         else:
-            self.data[idx]['data'] = ''
-            self.data[idx]['raw_value'] = value
+            ranges.append([row, row])
+    return [tuple(row_range) for row_range in ranges]
 
-        # Do compare
-        self._compare()
 
-    def clear_snap_values(self):
-        self.data = self.data[0:3]
-        self._compare()
+def is_large_array(value, size):
+    return (isinstance(value, numpy.ndarray) and value.size > size) or (isinstance(value, list) and len(value) > size)
 
-    def are_snap_values_eq(self):
-        n_files = len(self.data) - 3  # 3 "fixed columns"
-        if n_files < 2:
-            return True
-        else:
-            first_data = self.data[3]['raw_value']
-            for data in self.data[4:]:
-                if not SnapshotPv.compare(first_data, data['raw_value'], self._pv_ref.is_array):
-                    return False
-            return True
-
-    def is_snap_eq_to_pv(self, idx):
-        idx += 3
-        if self._pv_ref.connected:
-            return SnapshotPv.compare(self._pv_ref.value, self.data[idx]['raw_value'], self._pv_ref.is_array)
-        else:
-            return False
-
-    def get_snap_count(self):
-        return len(self.data) - 3
-
-    def _compare(self, pv_value=None):
-        if pv_value is None and self._pv_ref.connected:
-            pv_value = self._pv_ref.value
 
-        n_files = self.get_snap_count()
-
-        if n_files == 1 and self._pv_ref.connected and \
-                not SnapshotPv.compare(pv_value, self.data[-1]['raw_value'], self._pv_ref.is_array):
-            self.data[2]['icon'] = self._NEQ_ICON
-        else:
-            self.data[2]['icon'] = None
-
-    @staticmethod
-    def string_repr_snap_value(value):
-        if isinstance(value, numpy.ndarray):
-            # Handle arrays
-            return json.dumps(value.tolist())
-        elif isinstance(value, str):
-            # If string do not dump it will add "" to a string
-            return value
-        else:
-            # dump other values
-            return json.dumps(value)
-
-    def _callback(self, **kwargs):
-        self._pv_changed.emit(kwargs)
-
-    def _handle_callback(self, data):
-
-        pv_value = data.get('value', '')
-        self.data[1]['data'] = SnapshotPv.value_to_str(pv_value, self._pv_ref.is_array)
-        self._compare(pv_value)
-
-        new_time = time.time()
-        if (new_time - self._last_update) >= 1:  # Only update every second
-            self._last_update = new_time
-            # Only allow one signal to be emitted in one time interval
-            self._signal_emitted = False
-
-        if not self._signal_emitted:
-            self.data_changed.emit(self)
-            self._signal_emitted = True
-
-    def _conn_callback(self, **kwargs):
-        self._pv_conn_changed.emit(kwargs)
+def summarize_array(value, size):
+    """
+    Summary of the array: first size elements, number of elements and a short hash of the whole array (so arrays
+    with same beginning can be told apart).
 
-    def _handle_conn_callback(self, data):
-        self.conn = data.get('conn')
-        if not self.conn:
-            self.data[1] = {'data': 'PV disconnected', 'icon': self._WARN_ICON}
-            self.data[2]['icon'] = None
-        else:
-            self.data[1] = {'data': '', 'icon': None}
+    :param value: numpy array or list (of strings).
+    :param size: Number of shown elements.
+    :return: String.
+    """
+    if isinstance(value, numpy.ndarray):
+        elements = value.ravel()[:size].tolist()
+        digest = hashlib.sha1(numpy.ascontiguousarray(value).tobytes()).hexdigest()
+    else:
+        elements = value[:size]
+        digest = hashlib.sha1(json.dumps(value).encode()).hexdigest()
+    return '{}, ...] ({} elements, #{})'.format(json.dumps(elements)[:-1], numpy.size(value), digest[:8])
+
+
+def string_repr_snap_value(value):
+    if isinstance(value, numpy.ndarray):
+        # Handle arrays
+        return json.dumps(value.tolist())
+    elif isinstance(value, str):
+        # If string do not dump it will add "" to a string
+        return value
+    else:
+        # dump other values
+        return json.dumps(value)
+
+
+def format_value(value, max_size=None):
+    """
+    Text of the saved value. Arrays with more than max_size elements are summarized.
 
-        self._compare()
-        self.data_changed.emit(self)
+    :param value: Saved value.
+    :param max_size: Maximal number of shown array elements or None for all.
+    :return: Text.
+    """
+    if value is None:
+        return ''
+    if max_size is not None and is_large_array(value, max_size):
+        return summarize_array(value, max_size)
+    return string_repr_snap_value(value)
 
 
 class SnapshotPvFilterProxyModel(QtCore.QSortFilterProxyModel):
     """
-    Proxy model providing a custom filtering functionality for PV table
+    Proxy model providing a custom filtering functionality for PV table. Set of accepted rows is kept by
+    filterAcceptsRow(), so filter can be updated incrementally: when PVs change, only changed rows are checked, and
+    when the name filter changes only rows whose name match changed are checked. Names are matched with an index of
+    PV names, which keeps the results of recent filters (see SnapshotPvTableModel.match_names()). Only rows whose
+    acceptance changed are then filtered again by Qt (see SnapshotPvTableModel.refresh_rows()).
     """
     filtered = QtCore.pyqtSignal(list)
+    # If acceptance of more rows changed, all rows are filtered again at once
+    max_refiltered_rows = 1000
 
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.setDynamicSortFilter(True)  # Rows are filtered again (and sorted) on dataChanged()
         self._disconn_filter = True  # show disconnected?
         self._name_filter = ''  # string or regex object
+        self._name_mask = None  # rows matching the name filter, updated lazily
         self._eq_filter = PvCompareFilter.show_all
-        self._filtered_pvs = list()
-    
+        self._accepted = set()  # accepted rows of the source model
+        self._accepted_changed = False  # set by filterAcceptsRow(), also when Qt filters changed rows by itself
+
     def setSourceModel(self, model):
         super().setSourceModel(model)
-        self.sourceModel().dataChanged.connect(self.apply_filter)
+        self.sourceModel().rows_changed.connect(self._handle_rows_changed)
+        self.sourceModel().modelAboutToBeReset.connect(self._handle_model_about_to_be_reset)
+
+    def _handle_model_about_to_be_reset(self):
+        # PVs are changed, so are the rows matching the name filter
+        self._name_mask = None
+        self._clear_accepted()
+
+    def _clear_accepted(self):
+        self._accepted.clear()
+        self._accepted_changed = False
+
+    def _get_name_mask(self):
+        if self._name_mask is None:
+            self._name_mask = self.sourceModel().match_names(self._name_filter)
+        return self._name_mask
 
     def set_name_filter(self, srch_filter):
+        old_mask = self._get_name_mask()
         self._name_filter = srch_filter
-        self.apply_filter()
+        self._name_mask = None
+        # Only rows whose name match changed can be accepted or rejected
+        self._refilter_rows(numpy.flatnonzero(old_mask != self._get_name_mask()).tolist())
 
     def set_eq_filter(self, mode):
         self._eq_filter = PvCompareFilter(mode)
@@ -687,10 +999,38 @@ class SnapshotPvFilterProxyModel(QtCore.QSortFilterProxyModel):
         self.apply_filter()
 
     def apply_filter(self):
-        # during invalidateFilter(), filterAcceptsRow() is called for each row
-        self._filtered_pvs = list()
+        # during invalidate(), filterAcceptsRow() is called for each row
+        self._clear_accepted()
         self.invalidate()
-        self.filtered.emit(self._filtered_pvs)
+        self._emit_filtered()
+
+    def _handle_rows_changed(self, rows):
+        # PV values or connections changed. When sorted by current value, changed rows must be sorted again.
+        self._refilter_rows(rows, sort=(self.sortColumn() == 1))
+
+    def refilter_rows(self, rows):
+        """
+        Filter given rows again (e.g. their comparison changed).
+
+        :param rows: List of source model rows.
+        :return:
+        """
+        self._refilter_rows(rows)
+
+    def _refilter_rows(self, rows, sort=False):
+        refiltered = [row for row in rows if self._accepts_row(row) != (row in self._accepted)]
+        if len(refiltered) > self.max_refiltered_rows:
+            self.apply_filter()
+            return
+
+        self.sourceModel().refresh_rows(rows if sort else refiltered)
+        if refiltered or self._accepted_changed:
+            self._emit_filtered()
+
+    def _emit_filtered(self):
+        self._accepted_changed = False
+        model = self.sourceModel()
+        self.filtered.emit([model.get_pvname(row) for row in sorted(self._accepted)])
 
     def filterAcceptsRow(self, idx: int, source_parent: QtCore.QModelIndex):
         """
@@ -700,41 +1040,43 @@ class SnapshotPvFilterProxyModel(QtCore.QSortFilterProxyModel):
         :param source_parent:
         :return: visible (True), hidden(False)
         """
+        result = self._accepts_row(idx)
+        if result != (idx in self._accepted):
+            self._accepted_changed = True
+            if result:
+                self._accepted.add(idx)
+            else:
+                self._accepted.discard(idx)
+        return result
 
-        row_model = self.sourceModel().get_pv_line_model(idx)
+    def _accepts_row(self, idx: int):
+        model = self.sourceModel()
         result = False
-        if row_model:
-            n_files = row_model.get_snap_count()
-
-            if isinstance(self._name_filter, str):
-                name_match = self._name_filter in row_model.pvname
-            else:
-                # regex parser
-                name_match = (self._name_filter.fullmatch(row_model.pvname) is not None)
+        if 0 <= idx < model.rowCount(QtCore.QModelIndex()):
+            n_files = model.get_snap_count()
+            conn = model.is_connected(idx)
+            name_match = bool(self._get_name_mask()[idx])
 
             # Connected is shown in both cases, disconnected only if in show all mode
-            connected_match = row_model.conn or self._disconn_filter
+            connected_match = conn or self._disconn_filter
 
             if n_files > 1:  # multi-file mode
-                files_equal = row_model.are_snap_values_eq()
+                files_equal = model.are_snap_values_eq(idx)
                 compare_match = (((self._eq_filter == PvCompareFilter.show_eq) and files_equal) or
                                  ((self._eq_filter == PvCompareFilter.show_neq) and not files_equal) or
                                  (self._eq_filter == PvCompareFilter.show_all))
 
-                result = name_match and ((row_model.conn and compare_match) or (not row_model.conn and connected_match))
+                result = name_match and ((conn and compare_match) or (not conn and connected_match))
 
             elif n_files == 1:  # "pv-compare" mode
-                compare = row_model.is_snap_eq_to_pv(0)
+                compare = model.is_snap_eq_to_pv(idx)
                 compare_match = (((self._eq_filter == PvCompareFilter.show_eq) and compare) or
                                  ((self._eq_filter == PvCompareFilter.show_neq) and not compare) or
                                  (self._eq_filter == PvCompareFilter.show_all))
 
-                result = name_match and ((row_model.conn and compare_match) or (not row_model.conn and connected_match))
+                result = name_match and ((conn and compare_match) or (not conn and connected_match))
             else:
                 # Only name and connection filters apply
                 result = name_match and connected_match
 
-        if result:
-            self._filtered_pvs.append(row_model.pvname)
-
         return result
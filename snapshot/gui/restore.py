@@ -4,13 +4,20 @@
 # but WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
 
-import copy, datetime, os, time, glob, json
+import collections, copy, datetime, functools, os, threading, time, types
+from concurrent.futures import ThreadPoolExecutor
 
 from PyQt5 import QtGui, QtCore, QtWidgets
 from PyQt5.QtCore import Qt
 
-from ..ca_core import PvStatus, ActionStatus, SnapshotPv
-from .utils import SnapshotKeywordSelectorWidget, SnapshotEditMetadataDialog, DetailedMsgBox
+from ..archive import archive_member_exists, is_archive
+from ..ca_core import PvStatus, ActionStatus, Snapshot, SnapshotPv
+from ..cache import SnapshotLruCache, estimate_pvs_size
+from ..core import SnapshotError
+from ..snapfile import remove_save_file
+from ..store import SnapshotStore
+from ..watcher import SnapshotDirWatcher
+from .utils import SnapshotKeywordSelectorWidget, SnapshotEditMetadataDialog, SnapshotLabelRegistry, DetailedMsgBox
 
 
 class SnapshotRestoreWidget(QtWidgets.QWidget):
@@ -46,6 +53,7 @@ class SnapshotRestoreWidget(QtWidgets.QWidget):
         self.file_selector = SnapshotRestoreFileSelector(self)
 
         self.file_selector.files_selected.connect(self.handle_selected_files)
+        self.file_selector.files_loaded.connect(lambda: self.files_updated.emit(dict()))
 
         # Make restore buttons
         self.refresh_button = QtWidgets.QPushButton("Refresh", self)
@@ -98,7 +106,7 @@ class SnapshotRestoreWidget(QtWidgets.QWidget):
     def do_restore(self, pvs_list=None):
         # Restore can be done only if specific file is selected
         if len(self.file_selector.selected_files) == 1:
-            file_data = self.file_selector.file_list.get(self.file_selector.selected_files[0])
+            file_data = self.file_selector.get_file_data(self.file_selector.selected_files[0])
 
             # Prepare pvs with values to restore
             if file_data:
@@ -239,7 +247,7 @@ class SnapshotRestoreWidget(QtWidgets.QWidget):
 
         selected_data = dict()
         for file_name in selected_files:
-            file_data = self.file_selector.file_list.get(file_name, None)
+            file_data = self.file_selector.get_file_data(file_name)
             if file_data:
                 selected_data[file_name] = file_data
 
@@ -247,8 +255,7 @@ class SnapshotRestoreWidget(QtWidgets.QWidget):
         self.files_selected.emit(selected_data)
 
     def update_files(self):
-        #TODO: self.files_updated.emit(self.file_selector.start_file_list_update())
-        pass
+        self.file_selector.start_file_list_update_new()
 
     def clear_update_files(self):
         self.file_selector.clear_file_selector()
@@ -262,6 +269,9 @@ class SnapshotRestoreFileSelector(QtWidgets.QWidget):
     """
 
     files_selected = QtCore.pyqtSignal(list)
+    files_loaded = QtCore.pyqtSignal()
+    _file_parsed = QtCore.pyqtSignal(str, object, object, str)  # file name, token, parsed PVs, error
+    _index_written = QtCore.pyqtSignal(object, list, dict, str)  # index, changed files, label changes, error
 
     def __init__(self, parent=None, save_file_sufix=".snap", **kw):
         QtWidgets.QWidget.__init__(self, parent, **kw)
@@ -271,8 +281,30 @@ class SnapshotRestoreFileSelector(QtWidgets.QWidget):
         self.selected_files = list()
         self.save_file_sufix = save_file_sufix
 
-        self.file_list = dict()
         self.pvs = dict()
+        # Files are parsed in worker threads. Parsed PVs of recently used files are kept in the cache within the
+        # memory budget, and files next to the current one are parsed in advance (prefetched).
+        doc=QtWidgets.QApplication.instance().doc
+        self._parsed = SnapshotLruCache(doc.parsed_files_cache_size)  # file name: parsed PVs
+        # file name: token with the future of the parsing job (result is ignored if file changed while being parsed)
+        self._parsing = dict()
+        self._parser = ThreadPoolExecutor(max(1, min(4, os.cpu_count() or 1)))
+        self._file_parsed.connect(self._handle_file_parsed)
+        self._index = None
+        # Files changed in this GUI (deleted, edited) are written to the index in a separate thread, since it might
+        # wait for the write lock held by another client (see BUSY_TIMEOUT).
+        self._index_writer = ThreadPoolExecutor(1)
+        self._index_written.connect(self._handle_index_written)
+        self._loader = None
+        self._update_pending = False
+        self._watcher = None
+
+        # Index is shared with other clients (GUIs and "snapshot save"), which register their saved files in it. It is
+        # polled for changes (cheap, nothing is read unless changed), so their files are shown without any scanning.
+        self._index_version = None
+        self._index_timer = QtCore.QTimer(self)
+        self._index_timer.setInterval(1000)
+        self._index_timer.timeout.connect(self._check_index_version)
 
         # Filter handling
         self.file_filter = dict()
@@ -283,26 +315,28 @@ class SnapshotRestoreFileSelector(QtWidgets.QWidget):
 
         self.filter_input.file_filter_updated.connect(self.filter_file_list_selector)
 
-        # Create list with: file names, comment, labels
-        self.file_selector = QtWidgets.QTreeWidget(self)
+        # Create list with: file names, comment, labels. Files are not loaded to the list, but are fetched from the
+        # index of the save directory when shown.
+        self.model = SnapshotFileListModel(self)
+        self.file_selector = QtWidgets.QTreeView(self)
+        self.file_selector.setModel(self.model)
         self.file_selector.setRootIsDecorated(False)
         self.file_selector.setIndentation(0)
-        self.file_selector.setColumnCount(4)
-        self.file_selector.setHeaderLabels(["", "File", "Comment", "Labels"])
-        self.file_selector.headerItem().setIcon(0, QtGui.QIcon(
-            os.path.join(os.path.dirname(os.path.realpath(__file__)), "images/clock.png")))
+        self.file_selector.setUniformRowHeights(True)
         self.file_selector.setAllColumnsShowFocus(True)
         self.file_selector.setSortingEnabled(True)
-        # Sort by file name (alphabetical order)
-        self.file_selector.sortItems(0, Qt.DescendingOrder)
+        # Sort by time (newest first)
+        self.file_selector.sortByColumn(0, Qt.DescendingOrder)
 
-        self.file_selector.itemSelectionChanged.connect(self.evt_sel_changed)
+        self.file_selector.selectionModel().selectionChanged.connect(self.evt_sel_changed)
+        # Model is reset when sorted, so selection must be restored
+        self.model.sorted.connect(self._refresh_file_list)
         self.file_selector.setContextMenuPolicy(Qt.CustomContextMenu)
         self.file_selector.customContextMenuRequested.connect(self.evt_open_menu)
 
         # Set column sizes
-        self.file_selector.resizeColumnToContents(1)
         self.file_selector.setColumnWidth(0, 140)
+        self.file_selector.setColumnWidth(1, 250)
         self.file_selector.setColumnWidth(2, 350)
 
         # Applies following behavior for multi select:
@@ -310,9 +344,8 @@ class SnapshotRestoreFileSelector(QtWidgets.QWidget):
         #   Ctrl + click     adds current file to selected files
         #   Shift + click    adds all files between last selected and current
         #                    to selected
-        self.file_selector.setSelectionMode(QtWidgets.QTreeWidget.ExtendedSelection)
-
-        self.filter_file_list_selector()
+        self.file_selector.setSelectionMode(QtWidgets.QTreeView.ExtendedSelection)
+        self.file_selector.setSelectionBehavior(QtWidgets.QTreeView.SelectRows)
 
         # Add to main layout
         layout = QtWidgets.QVBoxLayout(self)
@@ -325,235 +358,246 @@ class SnapshotRestoreFileSelector(QtWidgets.QWidget):
         self.filter_input.clear()
         self.snapshot = snapshot
 
-    def start_file_list_update(self):
-        self.file_selector.setSortingEnabled(False)
-        # Rescans directory and adds new/modified files and removes none
-        # existing ones from the list.
-        #doc.save_dir"]='/tmp'
-        doc=QtWidgets.QApplication.instance().doc
-        save_files, err_to_report = self.get_save_files(doc.save_dir, self.file_list)
-
-        updated_files = self.update_file_list_selector(save_files)
-
-        self.filter_file_list_selector()
-        # Report any errors with snapshot files to the user
-        err_details = ""
-        if err_to_report:
-            for item in err_to_report:
-                if item[1]:  # list of errors
-
-                    err_details += '- - - ' + item[0] + \
-                                   ' - - -\n * '  # file name
-                    err_details += '\n * '.join(item[1])
-                    err_details += '\n\n'
-
-            err_details = err_details[:-2]  # Remove last two new lines
-
-        if err_details:
-            msg = str(len(err_to_report)) + " of the snapshot saved files (.snap) were loaded with errors " \
-                                            "(see details)."
-            msg_window = DetailedMsgBox(msg, err_details, 'Warning', self, QtWidgets.QMessageBox.Ok)
-            msg_window.exec_()
-
-        self.file_selector.setSortingEnabled(True)
-        return updated_files
-
     def start_file_list_update_new(self):
+        # Updates index of the save directory (only new or modified files are read) in a separate thread, so GUI is
+        # responsive all the time. Files already in the index are shown immediately, new files are shown as index
+        # update progresses.
+        if self._loader is not None:
+            self._update_pending = True  # Update again when the running one finishes
+            return
+
         doc=QtWidgets.QApplication.instance().doc
-        self.file_selector.setSortingEnabled(False)
-        # Rescans directory upüdates the files list
-        save_dir = doc.save_dir
+        self._update_pending = False
         save_file_prefix = os.path.basename(doc.save_file_prefix)
-        existing_labels = doc.existing_labels
-        existing_labels =set(existing_labels)
-        fhIdx=open(os.path.join('/tmp/snapshot/', save_file_prefix+'.idx'),'r')
-        idx_data=json.load(fhIdx)
-
-        #selector_item=QtWidgets.QTreeWidgetItem([time_, modified_file, comment, " ".join(labels)])
-        itr=QtWidgets.QTreeWidgetItemIterator(self.file_selector)
-        fnSet=set()
-        item=itr.value()
-        while item:
-            fnSet.add(item.text(1))
-            itr+=1;item=itr.value()
-        n=0
-        for fn,meta in idx_data:
-            if fn in fnSet:
-                print('found '+fn)
-            else:
-                print('new '+fn)
-                labels = meta.get("labels", list())
-                comment = meta.get("comment", "")
-                modTime = datetime.datetime.fromtimestamp(os.path.getmtime(os.path.join(save_dir,fn))).strftime('%Y/%m/%d %H:%M:%S')
-                item = QtWidgets.QTreeWidgetItem([modTime, fn, comment, " ".join(labels)])
-                item.setData(0,0x100,meta)
-                self.file_selector.addTopLevelItem(item)
-                existing_labels.update(labels)
-                n+=1
-                if n>10: break
-
-            pass
-
-        self.file_selector.setSortingEnabled(True)
-
-
-    def gen_index_file(self,save_dir,save_file_prefix):
-        'reads the first line of files (meta data) and merges all into an index file'
-        #outStream=open(os.path.join(path, filebase+'.idx'),'w')
-        outStream=open(os.path.join('/tmp/snapshot/', save_file_prefix+'.idx'),'w')
-        outStream.write('[\n')
-        for file_path in glob.glob(os.path.join(save_dir, save_file_prefix+'*'+self.save_file_sufix)):
-            f=open(file_path)
-            ln=f.readline()
-            outStream.write('["'+os.path.basename(file_path)+'",'+ln[1:-1]+'],\n')
-            pass
-        outStream.seek(outStream.tell()-3)# remove last ','
-        outStream.write(']\n]\n')
-        outStream.close()
+        save_dirs = [doc.save_dir] + doc.archive_dirs
+        self._loader = SnapshotFileListLoader(save_dirs, save_file_prefix, self.save_file_sufix, doc.migrate_after,
+                                              self._index is None, self)
+        self._loader.index_opened.connect(self._file_list_index_opened)
+        self._loader.index_updated.connect(self._refresh_file_list)
+        self._loader.progress.connect(doc.sts_info.set_progress)
+        self._loader.failed.connect(self._file_list_update_failed)
+        self._loader.finished.connect(self._file_list_update_done)
+        self._loader.start()
+
+    def _file_list_index_opened(self, index, label_counts):
+        loader = self.sender()
+        if loader is not self._loader:
+            index.close()  # File list was cleared in the meantime
+            return
+        doc=QtWidgets.QApplication.instance().doc
+        self._index = index
+        self.model.set_index(index, loader.save_file_prefix)
+        doc.labels.reset(label_counts)
 
+    def _file_list_update_failed(self, msg):
+        doc=QtWidgets.QApplication.instance().doc
+        doc.sts_log.log_msgs("Cannot update list of saved files: " + msg, time.time())
 
-    def get_save_files(self, save_dir, current_files):
-        print('OBSOLETE FUNC get_save_files')
+    def _file_list_update_done(self):
         doc=QtWidgets.QApplication.instance().doc
-        # Parses all new or modified files. Parsed files are returned as a
-        # dictionary.
-        import glob
-        parsed_save_files = dict()
-        err_to_report = list()
-        req_file_name = os.path.basename(doc.req_file_path)
-        # Check if any file added or modified (time of modification)
-        for file_path in glob.glob(os.path.join(save_dir, os.path.splitext(req_file_name)[0])+'*'+self.save_file_sufix):
-            file_name=os.path.basename(file_path)
-            if os.path.isfile(file_path):
-                if (file_name not in current_files) or \
-                        (current_files[file_name]["modif_time"] != os.path.getmtime(file_path)):
-
-                    pvs_list, meta_data, err = doc.snapshot.parse_from_save_file(
-                        file_path)
-
-                    # check if we have req_file metadata. This is used to determine which
-                    # request file the save file belongs to.
-                    # If there is no metadata (or no req_file specified in the metadata)
-                    # we search using a prefix of the request file.
-                    # The latter is less robust, but is backwards compatible.
-                    if ("req_file_name" in meta_data and meta_data["req_file_name"] == req_file_name) \
-                            or file_name.startswith(req_file_name.split(".")[0] + "_"):
-                        # we really should have basic meta data
-                        # (or filters and some other stuff will silently fail)
-                        if "comment" not in meta_data:
-                            meta_data["comment"] = ""
-                        if "labels" not in meta_data:
-                            meta_data["labels"] = []
-
-                        # save data (no need to open file again later))
-                        parsed_save_files[file_name] = dict()
-                        parsed_save_files[file_name]["pvs_list"] = pvs_list
-                        parsed_save_files[file_name]["meta_data"] = meta_data
-                        parsed_save_files[file_name]["modif_time"] = os.path.getmtime(file_path)
-
-                        if err:  # report errors only for matching saved files
-                            err_to_report.append((file_name, err))
-                        if len(parsed_save_files)>10:
-                            break
-
-        return parsed_save_files, err_to_report
-
-    def update_file_list_selector(self, modif_file_list):
-        print('OBSOLETE FUNC update_file_list_selector')
+        loader = self.sender()
+        if loader is not self._loader:
+            return  # File list was cleared in the meantime
+        self._loader = None
+        loader.deleteLater()
+        doc.sts_info.set_progress(0, 0)
+        if self._index is None:
+            return  # Index could not be opened (see _file_list_update_failed)
+
+        self._refresh_file_list()
+        if loader.label_counts is not None:
+            doc.labels.reset(loader.label_counts)
+        self.files_loaded.emit()
+
+        if self._watcher is None and not loader.error:
+            # From now on only changed files are updated
+            self._watcher = SnapshotFileListWatcher(loader.save_dirs, loader.save_file_prefix, self.save_file_sufix,
+                                                    self)
+            self._watcher.files_changed.connect(self._update_changed_files)
+            self._watcher.rescan_needed.connect(self.start_file_list_update_new)
+            self._watcher.start()
+
+        if not self._index_timer.isActive():
+            self._index_version = self._index.get_data_version()
+            self._index_timer.start()
+
+        if self._update_pending:
+            self.start_file_list_update_new()
+
+    def _check_index_version(self):
+        if self._index is None or self._loader is not None:
+            return  # List is refreshed by the running update
+        version = self._index.get_data_version()
+        if version != self._index_version:
+            doc=QtWidgets.QApplication.instance().doc
+            self._index_version = version
+            self._refresh_file_list()
+            doc.labels.reset(self._index.get_label_counts(self.model.prefix))
+            self.files_loaded.emit()
+
+    def is_watching(self):
+        return self._watcher is not None
+
+    def _update_changed_files(self, changed, label_changes):
+        # Handles changes reported by the SnapshotFileListWatcher.
+        if self._loader is not None:
+            self._update_pending = True  # Running update might have missed the change
+
+        self._show_changed_files(changed, label_changes)
+
+        # Changed files must be parsed again
+        for file_name in changed:
+            self._parsed.pop(file_name)
+            self._parsing.pop(file_name, None)
+        if set(changed) & set(self.selected_files):
+            self.evt_sel_changed(force=True)
+
+    def _show_changed_files(self, changed, label_changes):
+        # Only rows of the changed files are updated
         doc=QtWidgets.QApplication.instance().doc
-        existing_labels = doc.existing_labels
-
-        for modified_file, modified_data in modif_file_list.items():
-            meta_data = modified_data["meta_data"]
-            labels = meta_data.get("labels", list())
-            comment = 'X_'+meta_data.get("comment", "")
-            time_ = datetime.datetime.fromtimestamp(modified_data.get("modif_time", 0)).strftime('%Y/%m/%d %H:%M:%S')
-
-            # check if already on list (was just modified) and modify file
-            # selector
-            if modified_file not in self.file_list:
-                selector_item = QtWidgets.QTreeWidgetItem([time_, modified_file, comment, " ".join(labels)])
-                self.file_selector.addTopLevelItem(selector_item)
-                self.file_list[modified_file] = modified_data
-                self.file_list[modified_file]["file_selector"] = selector_item
-                existing_labels += list(set(labels) - set(existing_labels))
-
-            else:
-                # If everything ok only one file should exist in list. Update
-                # its data
-                modified_file_ref = self.file_list[modified_file]
-                old_meta_data = modified_file_ref["meta_data"]
-
-                # Before following actions, update the list of labels from
-                # which might change in the modified file. Remove unused labels
-                # and add new.
-                old_labels = old_meta_data["labels"]
-                labels_to_add = list(set(labels) - set(old_labels))
-                labels_to_remove = list(set(old_labels) - set(labels))
-
-                existing_labels += labels_to_add
-
-                # Update the global data meta_data info, before checking if
-                # labels_to_remove are used in any of the files.
-                self.file_list[modified_file]["meta_data"] = meta_data
-                self.file_list[modified_file]["pvs_list"] = modified_data["pvs_list"]
-
-                # Check if can be removed (no other file has the same label)
-                if labels_to_remove:
-                    # Check all loaded files if label is in use
-                    in_use = [False] * len(labels_to_remove)
-                    for laoded_file in self.file_list.keys():
-                        loaded_file_labels = self.file_list[
-                            laoded_file]["meta_data"]["labels"]
-                        i = 0
-                        for label in labels_to_remove:
-                            in_use[i] = in_use[i] or label in loaded_file_labels
-                            i += 1
-                    i = 0
-                    for label in labels_to_remove:
-                        if not in_use[i]:
-                            existing_labels.remove(label)
-                        i += 1
-
-                # Modify visual representation
-                item_to_modify = modified_file_ref["file_selector"]
-                item_to_modify.setText(0, time_)
-                item_to_modify.setText(2, comment)
-                item_to_modify.setText(3, " ".join(labels))
-        self.filter_input.update_labels()
-
-        # Set column sizes
-        self.file_selector.resizeColumnToContents(1)
-        return modif_file_list
+        self._refresh_file_list(changed)
+        doc.labels.update(label_changes)
+        if self._index_timer.isActive():
+            self._index_version = self._index.get_data_version()  # Change is already shown
+        self.files_loaded.emit()
+
+    def _refresh_file_list(self, changed=None):
+        # Reloads list from the index (only rows of changed files if given) and restores selection (and position of
+        # the current file).
+        current = self.model.get_file_name(self.file_selector.currentIndex().row())
+        selected = self.selected_files
+
+        selection_model = self.file_selector.selectionModel()
+        selection_model.blockSignals(True)  # Selection is only processed once restored
+        if changed is None:
+            self.model.refresh()
+        else:
+            self.model.update_files(changed)
+        selection_model.blockSignals(False)
+
+        selection = QtCore.QItemSelection()
+        for file_name in selected:
+            row = self.model.get_row(file_name)
+            if row is not None:
+                selection.select(self.model.index(row, 0), self.model.index(row, self.model.columnCount() - 1))
+        selection_model.blockSignals(True)
+        current_row = self.model.get_row(current) if current else None
+        if current_row is not None:
+            selection_model.setCurrentIndex(self.model.index(current_row, 0), QtCore.QItemSelectionModel.NoUpdate)
+        selection_model.select(selection, QtCore.QItemSelectionModel.ClearAndSelect)
+        selection_model.blockSignals(False)
+        self.file_selector.viewport().update()
+        self.evt_sel_changed()  # Selected files might be filtered out or deleted
+
+    def _update_index(self, file_names):
+        # Updates index for files changed in this GUI (without waiting for the watcher to report them)
+        self._index_writer.submit(self._write_index, self._index, self.model.prefix, file_names)
+
+    def _write_index(self, index, prefix, file_names):
+        # Runs in the index writer thread (with its own connection to the index)
+        label_changes = dict()
+
+        def file_labels_changed(name, old_labels, new_labels):
+            if name.startswith(prefix):
+                SnapshotLabelRegistry.file_changed(label_changes, name, old_labels, new_labels)
+
+        try:
+            store = SnapshotStore(index.save_dirs, self.save_file_sufix)
+            try:
+                added, modified, removed = store.update_files(file_names, file_labels_changed)
+            finally:
+                store.close()
+        except Exception as e:
+            self._index_written.emit(index, list(), dict(), str(e))
+        else:
+            self._index_written.emit(index, [fn for fn in added + modified + removed if fn.startswith(prefix)],
+                                     label_changes, '')
+
+    def _handle_index_written(self, index, changed, label_changes, error):
+        if index is not self._index:
+            return  # File list was cleared in the meantime
+        if error:
+            self._file_list_update_failed(error)
+        elif changed:
+            self._show_changed_files(changed, label_changes)
+
+    def get_file_data(self, file_name, wait=True):
+        # Meta data and saved PVs of the file in the list. If file is not parsed yet, it is parsed in the GUI thread
+        # (wait=True) or None is returned and file is parsed in a worker thread (see _handle_file_parsed()).
+        if self._index is None:
+            return None
+        file = self._index.get_file(file_name)
+        if file is None:
+            return None
+        pvs_list = self._parsed.get(file_name)
+        if pvs_list is None:
+            if not wait:
+                self._start_parsing(file_name, file["path"])
+                return None
+            pvs_list, meta_data, err = Snapshot.parse_from_save_file(file["path"])
+            self._parsed.put(file_name, pvs_list, estimate_pvs_size(pvs_list))
+            self._parsing.pop(file_name, None)
+        return {"meta_data": file["metadata"], "pvs_list": pvs_list}
+
+    def _start_parsing(self, file_name, path):
+        if file_name in self._parsing or file_name in self._parsed:
+            return
+        token = self._parsing[file_name] = types.SimpleNamespace(future=None)
+        token.future = self._parser.submit(self._parse_file, file_name, path, token)
+
+    def _cancel_parsing(self, keep=()):
+        # Parsing of files which is no longer needed (e.g. prefetched while browsing the list) and not started yet is
+        # cancelled, so it does not delay the files parsed next
+        for file_name, token in list(self._parsing.items()):
+            if file_name not in keep and token.future.cancel():
+                del self._parsing[file_name]
+
+    def _parse_file(self, file_name, path, token):
+        # Runs in a worker thread. File is read from the fastest directory holding it.
+        try:
+            pvs_list, meta_data, err = Snapshot.parse_from_save_file(path)
+        except Exception as e:
+            self._file_parsed.emit(file_name, token, None, str(e))
+        else:
+            self._file_parsed.emit(file_name, token, pvs_list, '')
+
+    def _handle_file_parsed(self, file_name, token, pvs_list, error):
+        if self._parsing.get(file_name) is not token:
+            return  # File changed or list cleared in the meantime
+        del self._parsing[file_name]
+        if pvs_list is None:
+            doc=QtWidgets.QApplication.instance().doc
+            doc.sts_log.log_msgs("Cannot read file {}: {}".format(file_name, error), time.time())
+            return
+        self._parsed.put(file_name, pvs_list, estimate_pvs_size(pvs_list))
+        if file_name in self.selected_files:
+            # Only the parsed file is added to the compare widget (other selected files are already shown). Parsed
+            # PVs are used directly, since file bigger than the cache budget is not kept in the cache.
+            file = self._index.get_file(file_name) if self._index is not None else None
+            if file is not None:
+                cw=self.parent.parent().parent().parent().compare_widget
+                cw.add_snap_file(file_name, {"meta_data": file["metadata"], "pvs_list": pvs_list},
+                                 self.selected_files)
+
+    def _prefetch_files(self):
+        # Parse files next to the current one in advance (e.g. when browsing the list with arrow keys)
+        doc=QtWidgets.QApplication.instance().doc
+        row = self.file_selector.currentIndex().row()
+        if row < 0 or self._index is None:
+            return
+        for neighbour in range(row - doc.prefetch_files, row + doc.prefetch_files + 1):
+            file_name = self.model.get_file_name(neighbour) if neighbour >= 0 else None
+            if file_name is not None and file_name not in self._parsed and file_name not in self._parsing:
+                file = self._index.get_file(file_name)
+                if file is not None:
+                    self._start_parsing(file_name, file["path"])
 
     def filter_file_list_selector(self):
+        # Filtering is done by the index query (see SnapshotFileListModel)
         file_filter = self.filter_input.file_filter
-
-
-
-        keys_filter=set(file_filter.get("keys"))
-        comment_filter=file_filter.get("comment")
-        name_filter=file_filter.get("name")
-        itr=QtWidgets.QTreeWidgetItemIterator(self.file_selector)
-        item=itr.value()
-        while item:
-            hidden=False
-            fn=item.text(1)
-            meta=item.data(0, 0x100)
-            if meta is None:
-                print('item has no meta data!')
-                meta=dict()
-            if name_filter and not name_filter in fn:
-                hidden=True
-            elif comment_filter and not name_filter in meta.get("comment"):
-                hidden=True
-            elif meta is not None and  keys_filter and not keys_filter.issubset(meta.get('labels')):
-                hidden=True
-
-            item.setHidden(hidden);itr+=1;item=itr.value()
-        self.file_selector
-        n=0
-
+        self.model.set_filter(name=file_filter.get("name"), comment=file_filter.get("comment"),
+                              labels=file_filter.get("keys"))
+        self._refresh_file_list()
 
     def evt_open_menu(self, point):
         # event file_selector.customContextMenuRequested
@@ -562,77 +606,448 @@ class SnapshotRestoreFileSelector(QtWidgets.QWidget):
         menu.addAction("Edit file meta-data", self.evt_update_file_metadata)
         menu.exec(QtWidgets.QCursor.pos())
 
-    def evt_sel_changed(self):
-        # event file_selector.itemSelectionChanged
-        self.selected_files = list()
-        if self.file_selector.selectedItems():
-            for item in self.file_selector.selectedItems():
-                self.selected_files.append(item.text(1))
-
-        self.files_selected.emit(self.selected_files)
-        #return
-        #----------------------
-        selItems=self.file_selector.selectedItems()
+    def evt_sel_changed(self, *args, force=False):
+        # event file_selector.selectionModel().selectionChanged
+        selected_files = list()
+        for index in self.file_selector.selectionModel().selectedRows():
+            file_name = self.model.get_file_name(index.row())
+            if file_name is not None:
+                selected_files.append(file_name)
+        if selected_files == self.selected_files and not force:
+            return  # e.g. list was refreshed
+        self.selected_files = selected_files
+
         parent=self.parent
-        if len(selItems) == 1:
+        if len(selected_files) == 1:
             parent.restore_all_button.setEnabled(True)
             parent.restore_button.setEnabled(True)
         else:
             parent.restore_all_button.setEnabled(False)
             parent.restore_button.setEnabled(False)
 
-        # First update other GUI components (compare widget) and then pass pvs to compare to the snapshot core
-        cw=self.parent.parent().parent().parent().compare_widget
-        cw.sel_changed_files(selItems)
+        # Selected files are parsed first, neighbours are queued again by _prefetch_files()
+        self._cancel_parsing(selected_files)
+        self._show_selected_files()
+        self._prefetch_files()
 
+    def _show_selected_files(self):
+        # Selected files which are already parsed are shown in the compare widget, others when parsed
+        selected_data = dict()
+        for file_name in self.selected_files:
+            file_data = self.get_file_data(file_name, wait=False)
+            if file_data:
+                selected_data[file_name] = file_data
+        cw=self.parent.parent().parent().parent().compare_widget
+        cw.sel_changed_files(selected_data)
 
     def evt_delete_files(self):
         # event delete in context menu (evt_open_menu)
-        doc=QtWidgets.QApplication.instance().doc
         if self.selected_files:
             msg = "Do you want to delete selected files?"
             reply = QtWidgets.QMessageBox.question(self, 'Message', msg, QtWidgets.QMessageBox.Yes, QtWidgets.QMessageBox.No)
             if reply == QtWidgets.QMessageBox.Yes:
+                deleted = list()
+                archived = list()
                 for selected_file in self.selected_files:
+                    # Members of archives cannot be deleted (archives are append only)
+                    if any(is_archive(save_dir) and archive_member_exists(os.path.join(save_dir, selected_file))
+                           for save_dir in self._index.save_dirs):
+                        archived.append(selected_file)
+                        continue
                     try:
-                        file_path = os.path.join(doc.save_dir,
-                                                 selected_file)
-                        os.remove(file_path)
-                        self.file_list.pop(selected_file)
+                        # File is deleted from all directories, so a copy in another directory does not show up instead
+                        for save_dir in self._index.save_dirs:
+                            file_path = os.path.join(save_dir, selected_file)
+                            if os.path.lexists(file_path):
+                                remove_save_file(file_path)
+                        deleted.append(selected_file)
+                        self._parsed.pop(selected_file)
                         self.pvs = dict()
-                        self.file_selector.takeTopLevelItem(
-                            self.file_selector.indexOfTopLevelItem(self.file_selector.findItems(
-                                selected_file, Qt.MatchCaseSensitive, 1)[0]))
 
                     except OSError as e:
                         warn = "Problem deleting file:\n" + str(e)
                         QtWidgets.QMessageBox.warning(self, "Warning", warn,
                                                   QtWidgets.QMessageBox.Ok,
                                                   QtWidgets.QMessageBox.NoButton)
+                if archived:
+                    warn = "Archived files cannot be deleted:\n" + "\n".join(archived)
+                    QtWidgets.QMessageBox.warning(self, "Warning", warn,
+                                                  QtWidgets.QMessageBox.Ok,
+                                                  QtWidgets.QMessageBox.NoButton)
+                if deleted:
+                    self._update_index(deleted)
 
     def evt_update_file_metadata(self):
         # event 'Edit file meta-data' in context menu (evt_open_menu)
+        doc=QtWidgets.QApplication.instance().doc
         if self.selected_files:
             if len(self.selected_files) == 1:
-                settings_window = SnapshotEditMetadataDialog(
-                    self.file_list.get(self.selected_files[0])["meta_data"],
-                    self.common_settings, self)
+                file_name = self.selected_files[0]
+                meta_data = copy.deepcopy(self._index.get_file(file_name)["metadata"])
+                meta_data.setdefault("comment", "")
+                meta_data.setdefault("labels", list())
+                settings_window = SnapshotEditMetadataDialog(meta_data, self)
                 settings_window.resize(800, 200)
-                # if OK was pressed, update actual file and reflect changes in the list
+                # if OK was pressed, update actual file and reflect changes in the list (only the edited file, the
+                # file body is not rewritten, so there is no need to rescan it)
                 if settings_window.exec_():
-                    self.snapshot.replace_metadata(self.selected_files[0],
-                                                   self.file_list.get(self.selected_files[0])["meta_data"])
-                    self.parent.clear_update_files()
+                    try:
+                        doc.snapshot.replace_metadata(self._index.get_path(file_name), meta_data)
+                    except (OSError, SnapshotError) as e:
+                        QtWidgets.QMessageBox.warning(self, "Warning", "Cannot edit meta data:\n" + str(e),
+                                                      QtWidgets.QMessageBox.Ok, QtWidgets.QMessageBox.NoButton)
+                        return
+                    self._update_index([file_name])
             else:
                 QtWidgets.QMessageBox.information(self, "Information", "Please select one file only",
                                               QtWidgets.QMessageBox.Ok,
                                               QtWidgets.QMessageBox.NoButton)
 
     def clear_file_selector(self):
-        self.file_selector.clear()  # Clears and "deselects" itmes on file selector
+        self._index_timer.stop()
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher.deleteLater()
+            self._watcher = None
+        if self._loader is not None:
+            # Results of the running update are ignored (might be for another save directory)
+            self._loader.index_updated.disconnect(self._refresh_file_list)
+            if self._loader.isFinished():
+                self._loader.deleteLater()
+            else:
+                self._loader.finished.connect(self._loader.deleteLater)
+            self._loader = None
+        self.model.set_index(None)
+        self._parsed.clear()
+        self._cancel_parsing()
+        self._parsing.clear()
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        doc=QtWidgets.QApplication.instance().doc
+        doc.labels.reset(dict())
+        self.file_selector.selectionModel().clearSelection()
         self.evt_sel_changed()  # Process new,empty list of selected files
         self.pvs = dict()
-        self.file_list = dict()
+
+
+class SnapshotFileListModel(QtCore.QAbstractTableModel):
+    """
+    Model of the save files in the index of the save directories (SnapshotStore). Files are fetched from the index in
+    pages, when view scrolls to them, and only last max_pages pages are kept in memory. Sorting and filtering is done
+    by the index queries, so even directories with 100k files are shown instantly.
+    """
+    sorted = QtCore.pyqtSignal()
+
+    page_size = 256
+    max_pages = 16
+
+    def __init__(self, parent=None):
+        QtCore.QAbstractTableModel.__init__(self, parent)
+        self.prefix = ''
+        self._index = None
+        self._filter = dict()
+        self._order_by = 'mtime'
+        self._descending = True
+        self._count = 0  # Number of files matching the filter
+        self._fetched = 0  # Number of rows already shown to the view (increased with fetchMore())
+        self._pages = collections.OrderedDict()  # page number: list of files
+        self._headers = ["", "File", "Comment", "Labels"]
+        self._time_icon = QtGui.QIcon(os.path.join(os.path.dirname(os.path.realpath(__file__)), "images/clock.png"))
+
+    def set_index(self, index, prefix=''):
+        self._index = index
+        self.prefix = prefix
+        self._fetched = 0
+        self.refresh()
+
+    def set_filter(self, name='', comment='', labels=()):
+        self._filter = {'name': name or '', 'comment': comment or '', 'labels': list(labels or [])}
+
+    def refresh(self):
+        # Reloads files from the index (e.g. when index or filter changed). Number of rows shown to the view is kept,
+        # so the view does not jump back to the first page.
+        self.beginResetModel()
+        self._pages.clear()
+        if self._index is not None:
+            self._count = self._index.count_files(prefix=self.prefix, **self._filter)
+        else:
+            self._count = 0
+        self._fetched = min(self._count, max(self._fetched, self.page_size))
+        self.endResetModel()
+
+    def update_files(self, file_names):
+        """
+        Update rows of changed (added, modified or removed) files. Only rows of these files are removed and inserted
+        (or changed in place), so other rows and their selection are kept. If the old rows are not known (not all
+        fetched rows are cached), or too many files changed, model is reset (see refresh()).
+
+        :param file_names: Names of changed files (index is already updated).
+        :return:
+        """
+        old_names = self._get_fetched_names()
+        changed = set(file_names)
+        if self._index is None or old_names is None or len(changed) > self.page_size:
+            self.refresh()
+            return
+
+        # Unchanged files keep their order, changed files are put to their new positions
+        new_names = [name for name in old_names if name not in changed]
+        positions = list()
+        for name in changed:
+            row = self._index.get_position(name, self._order_by, self._descending, prefix=self.prefix, **self._filter)
+            if row is not None:
+                positions.append((row, name))
+        for row, name in sorted(positions):
+            if row <= len(new_names):
+                new_names.insert(row, name)
+
+        files = self._index.query_files(self._order_by, self._descending, 0, len(new_names), prefix=self.prefix,
+                                        **self._filter)
+        if [file['name'] for file in files] != new_names:
+            self.refresh()  # Index changed also for other files in the meantime
+            return
+
+        self._count = self._index.count_files(prefix=self.prefix, **self._filter)
+        self._set_pages(files)
+        if new_names == old_names:
+            last_column = self.columnCount() - 1
+            for row, name in enumerate(new_names):
+                if name in changed:
+                    self.dataChanged.emit(self.index(row, 0), self.index(row, last_column))
+            return
+
+        names = list(old_names)
+        for row in reversed(range(len(names))):
+            if names[row] in changed:
+                self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+                del names[row]
+                self._fetched -= 1
+                self.endRemoveRows()
+        for row, name in enumerate(new_names):
+            if row >= len(names) or names[row] != name:
+                self.beginInsertRows(QtCore.QModelIndex(), row, row)
+                names.insert(row, name)
+                self._fetched += 1
+                self.endInsertRows()
+
+    def _get_fetched_names(self):
+        # Names of files in all fetched rows, None if some of them are not cached
+        names = list()
+        for page_number in range(-(-self._fetched // self.page_size)):
+            page = self._pages.get(page_number)
+            if page is None:
+                return None
+            names += [file['name'] for file in page]
+        if len(names) < self._fetched:
+            return None
+        return names[:self._fetched]
+
+    def _set_pages(self, files):
+        self._pages.clear()
+        for page_number in range(max(0, -(-len(files) // self.page_size) - self.max_pages),
+                                 -(-len(files) // self.page_size)):
+            self._pages[page_number] = files[page_number * self.page_size:(page_number + 1) * self.page_size]
+
+    def get_file_name(self, row):
+        file = self._get_file(row)
+        return file['name'] if file else None
+
+    def get_row(self, file_name):
+        # Row of the file (file is made available to the view if not fetched yet) or None if not shown.
+        if self._index is None:
+            return None
+        row = self._index.get_position(file_name, self._order_by, self._descending, prefix=self.prefix, **self._filter)
+        if row is None or row >= self._count:
+            return None
+        if row >= self._fetched:
+            fetched = min(self._count, (row // self.page_size + 1) * self.page_size)
+            self.beginInsertRows(QtCore.QModelIndex(), self._fetched, fetched - 1)
+            self._fetched = fetched
+            self.endInsertRows()
+        return row
+
+    def _get_file(self, row):
+        if row < 0 or row >= self._fetched:
+            return None
+        page_number = row // self.page_size
+        page = self._pages.get(page_number)
+        if page is None:
+            page = self._index.query_files(self._order_by, self._descending, page_number * self.page_size,
+                                           self.page_size, prefix=self.prefix, **self._filter)
+            self._pages[page_number] = page
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(page_number)
+
+        row = row % self.page_size
+        if row < len(page):
+            return page[row]
+        else:
+            return None  # Index was changed in the meantime (list will be refreshed)
+
+    # Reimplementation of parent methods needed for visualization
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._fetched
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self._headers)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self._fetched < self._count
+
+    def fetchMore(self, parent):
+        fetched = min(self._count, self._fetched + self.page_size)
+        self.beginInsertRows(QtCore.QModelIndex(), self._fetched, fetched - 1)
+        self._fetched = fetched
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role not in [Qt.DisplayRole, Qt.ToolTipRole]:
+            return QtCore.QVariant()
+        file = self._get_file(index.row())
+        if file is None:
+            return QtCore.QVariant()
+
+        column = index.column()
+        if column == 0:
+            return datetime.datetime.fromtimestamp(file['mtime']).strftime('%Y/%m/%d %H:%M:%S')
+        elif column == 1:
+            return file['name']
+        elif column == 2:
+            return file['comment']
+        else:
+            return " ".join(file['labels'])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal:
+            if role == Qt.DisplayRole:
+                return self._headers[section]
+            elif role == Qt.DecorationRole and section == 0:
+                return self._time_icon
+        return QtCore.QVariant()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._order_by = SnapshotStore.sort_columns[column]
+        self._descending = order == Qt.DescendingOrder
+        self.refresh()
+        self.sorted.emit()
+
+
+class SnapshotFileListLoader(QtCore.QThread):
+    """
+    Updates indexes of the save directories in a separate thread. If open_index is set, the index shown in the GUI is
+    opened first and emitted with index_opened (together with the usage of labels), since opening it might wait for
+    the lock held by another client. index_updated is emitted each time a part of the update is committed to the index
+    (and can be shown). If migrate_after (days) is set, files older than that are then moved to the archive directory
+    (last of the save directories). Usage of labels after the update is available in label_counts.
+    """
+    index_opened = QtCore.pyqtSignal(object, dict)  # index, usage of labels
+    index_updated = QtCore.pyqtSignal()
+    progress = QtCore.pyqtSignal(int, int)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, save_dirs, save_file_prefix, save_file_sufix, migrate_after=None, open_index=False,
+                 parent=None):
+        QtCore.QThread.__init__(self, parent)
+        self.save_dirs = save_dirs
+        self.save_file_prefix = save_file_prefix
+        self.save_file_sufix = save_file_sufix
+        self.migrate_after = migrate_after
+        self.open_index = open_index
+        self.error = None
+        self.label_counts = None
+        self._last_progress = None
+
+    def run(self):
+        try:
+            if self.open_index:
+                index = SnapshotStore(self.save_dirs, self.save_file_sufix)
+                try:
+                    label_counts = index.get_label_counts(self.save_file_prefix)
+                except Exception:
+                    index.close()
+                    raise
+                self.index_opened.emit(index, label_counts)  # Closed by the receiver
+
+            store = SnapshotStore(self.save_dirs, self.save_file_sufix)
+            try:
+                store.update(progress=self._report_progress)
+                if self.migrate_after is not None and len(store.save_dirs) > 1:
+                    self._last_progress = None
+                    store.migrate(self.migrate_after * 24 * 3600, self.save_file_prefix, self._report_progress)
+                self.label_counts = store.get_label_counts(self.save_file_prefix)
+            finally:
+                store.close()
+        except Exception as e:
+            self.error = e
+            self.failed.emit(str(e))
+
+    def _report_progress(self, done, total):
+        if done:
+            self.index_updated.emit()  # Progress is reported after each committed chunk
+
+        # Report only each percent, not to flood the GUI thread with signals
+        percent = done * 100 // total if total else 100
+        if percent != self._last_progress:
+            self._last_progress = percent
+            self.progress.emit(done, total)
+
+
+class SnapshotFileListWatcher(QtCore.QObject):
+    """
+    Watches the save directories (see SnapshotDirWatcher) and updates the index for changed files. Names of changed
+    files matching the prefix are emitted, together with changes of the labels usage.
+    """
+    files_changed = QtCore.pyqtSignal(list, dict)  # changed files, changes of labels usage (see SnapshotLabelRegistry)
+    rescan_needed = QtCore.pyqtSignal()
+
+    def __init__(self, save_dirs, save_file_prefix, save_file_sufix, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.save_dirs = save_dirs
+        self.save_file_prefix = save_file_prefix
+        self.save_file_sufix = save_file_sufix
+        self._index = None
+        self._lock = threading.Lock()  # Each directory is watched in its own thread
+        self._watchers = [SnapshotDirWatcher(save_dir, functools.partial(self._handle_changes, save_dir),
+                                             save_file_sufix) for save_dir in save_dirs]
+
+    def start(self):
+        for watcher in self._watchers:
+            watcher.start()
+
+    def stop(self):
+        for watcher in self._watchers:
+            watcher.stop()
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+    def _handle_changes(self, save_dir, names):
+        # Called from the watcher threads
+        if names is None:
+            self.rescan_needed.emit()
+            return
+
+        with self._lock:
+            self._update_files(save_dir, names)
+
+    def _update_files(self, save_dir, names):
+        if self._index is None:
+            self._index = SnapshotStore(self.save_dirs, self.save_file_sufix)
+        label_changes = dict()
+
+        def file_labels_changed(name, old_labels, new_labels):
+            if name.startswith(self.save_file_prefix):
+                SnapshotLabelRegistry.file_changed(label_changes, name, old_labels, new_labels)
+
+        added, modified, removed = self._index.update_files(names, file_labels_changed, save_dir)
+        changed = [fn for fn in added + modified + removed if fn.startswith(self.save_file_prefix)]
+        if changed:
+            self.files_changed.emit(changed, label_changes)
 
 
 class SnapshotFileFilterWidget(QtWidgets.QWidget):
@@ -708,9 +1123,6 @@ class SnapshotFileFilterWidget(QtWidgets.QWidget):
 
         self.file_filter_updated.emit()
 
-    def update_labels(self):
-        self.keys_input.update_suggested_keywords()
-
     def clear(self):
         self.keys_input.clear_keywords()
         self.name_input.setText('')
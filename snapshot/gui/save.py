@@ -12,6 +12,7 @@ from PyQt5 import QtGui, QtCore, QtWidgets
 from PyQt5.QtCore import Qt
 
 from ..ca_core import PvStatus, ActionStatus
+from ..snapfile import add_compression_suffix, compressors
 from .utils import SnapshotKeywordSelectorWidget, DetailedMsgBox
 
 
@@ -115,6 +116,7 @@ class SnapshotSaveWidget(QtWidgets.QWidget):
         self.update_name()
 
         if self.check_file_name_available():
+            doc=QtWidgets.QApplication.instance().doc
             self.save_button.setEnabled(False)
             self.sts_log.log_msgs("Save started.", time.time())
             self.sts_info.set_status("Saving ...", 0, "orange")
@@ -213,15 +215,20 @@ class SnapshotSaveWidget(QtWidgets.QWidget):
             self.name_extension = name_extension_inp
             name_extension_rb = name_extension_inp + self.save_file_sufix
 
+        # Compressed files get codec suffix (e.g. .snap.gz)
+        compression = self.advanced.get_compression()
+        name_extension_rb = add_compression_suffix(name_extension_rb, compression)
+
         # Use manually entered prefix only if advanced options are selected
         if self.advanced.file_prefix_input.text() and self.advanced.isChecked():
             doc.save_file_prefix = self.advanced.file_prefix_input.text()
         else:
             doc.save_file_prefix = os.path.split(doc.req_file_path)[1].split(".")[0] + "_"
 
-        self.file_path = os.path.join(doc.save_dir,
-                                      doc.save_file_prefix +
-                                      self.name_extension + self.save_file_sufix)
+        self.file_path = add_compression_suffix(os.path.join(doc.save_dir,
+                                                             doc.save_file_prefix +
+                                                             self.name_extension + self.save_file_sufix),
+                                                compression)
         self.file_name_rb.setText(doc.save_file_prefix +
                                   name_extension_rb)
 
@@ -305,14 +312,38 @@ class SnapshotAdvancedSaveSettings(QtWidgets.QGroupBox):
         self.file_prefix_input.textChanged.connect(
             self.parent.update_name)
 
+        # Make field for selecting compression of the saved file
+        compression_layout = QtWidgets.QHBoxLayout()
+        compression_layout.setSpacing(10)
+        compression_label = QtWidgets.QLabel("Compression:", self.frame)
+        compression_label.setStyleSheet("background-color: None")
+        compression_label.setAlignment(Qt.AlignCenter | Qt.AlignRight)
+        compression_label.setMinimumWidth(min_label_width)
+        self.compression_input = QtWidgets.QComboBox(self.frame)
+        self.compression_input.addItem("None")
+        self.compression_input.addItems(sorted(compressors.keys()))
+        compression_layout.addWidget(compression_label)
+        compression_layout.addWidget(self.compression_input)
+        compression_layout.addStretch()
+        self.compression_input.currentIndexChanged.connect(
+            self.parent.update_name)
+
         # self.frame_layout.addStretch()
         self.frame_layout.addLayout(comment_layout)
         self.frame_layout.addLayout(labels_layout)
         self.frame_layout.addLayout(file_prefix_layout)
+        self.frame_layout.addLayout(compression_layout)
 
     def update_labels(self):
         self.labels_input.update_suggested_keywords()
 
+    def get_compression(self):
+        # Compression is used only if advanced options are selected
+        if self.isChecked() and self.compression_input.currentIndex():
+            return self.compression_input.currentText()
+        else:
+            return None
+
     def toggle(self):
         self.frame.setVisible(self.isChecked())
         self.parent.update_name()
@@ -15,10 +15,11 @@ from PyQt5.QtCore import Qt, QThread
 from snapshot.ca_core import Snapshot, parse_macros
 from snapshot.core import SnapshotError
 from snapshot.parser import ReqParseError, MacroError
+from snapshot.tolerance import SnapshotToleranceRules
 from .compare import SnapshotCompareWidget
 from .restore import SnapshotRestoreWidget
 from .save import SnapshotSaveWidget
-from .utils import SnapshotConfigureDialog, SnapshotSettingsDialog, DetailedMsgBox
+from .utils import SnapshotConfigureDialog, SnapshotSettingsDialog, SnapshotLabelRegistry, DetailedMsgBox
 
 class Doc:
     '''application document containing most important data and references to main widgets'''
@@ -47,11 +48,13 @@ class SnapshotGui(QtWidgets.QMainWindow):
 
     def __init__(self, req_file_path: str = None, req_file_macros=None, save_dir: str = None, force: bool = False,
                  default_labels: list = None, force_default_labels: bool = None, init_path: str = None,
-                 config_path: str = None, parent=None):
+                 config_path: str = None, archive_dirs: list = None, migrate_after: float = None, parent=None):
         """
         :param req_file_path: path to request file
         :param req_file_macros: macros can be as dict (key, value pairs) or a string in format A=B,C=D
         :param save_dir: path to the default save directory
+        :param archive_dirs: list of directories with older save files (listed together with the save directory)
+        :param migrate_after: move save files older than migrate_after days to the last of the archive_dirs
         :param force: force saving on disconnected channels
         :param default_labels: list of default labels
         :param force_default_labels: if True, user can only select predefined labels
@@ -69,6 +72,11 @@ class SnapshotGui(QtWidgets.QMainWindow):
                 # force-labels must be type of bool
                 if not isinstance(config.get('labels', dict()).get('force-labels', False), bool):
                     raise TypeError('"force-labels" must be boolean')
+                SnapshotToleranceRules(config.get('tolerances'))  # Raises ToleranceError if invalid
+                cache_config = config.get('cache', dict())
+                if not isinstance(cache_config.get('size-mb', 0), (int, float)) or \
+                        not isinstance(cache_config.get('prefetch', 0), int):
+                    raise TypeError('"size-mb" and "prefetch" of "cache" must be numbers')
             except Exception as e:
                 msg = "Loading configuration file failed! Do you want to continue with out it?\n"
                 msg_window = DetailedMsgBox(msg, str(e), 'Warning')
@@ -90,7 +98,7 @@ class SnapshotGui(QtWidgets.QMainWindow):
         doc.save_file_prefix = ""
         doc.req_file_path = ""
         doc.req_file_macros = dict()
-        doc.existing_labels = list()  # labels that are already in snap files
+        doc.labels = SnapshotLabelRegistry()  # labels that are already in snap files
         doc.force = force
 
         if isinstance(default_labels, str):
@@ -109,6 +117,20 @@ class SnapshotGui(QtWidgets.QMainWindow):
         # Predefined filters
         doc.predefined_filters = config.get('filters', dict())
 
+        # Parsed save files are cached (within the memory budget) and files next to the selected one are prefetched
+        cache_config = config.get('cache', dict())
+        doc.parsed_files_cache_size = int(cache_config.get('size-mb', 256) * 1024 * 1024)
+        doc.prefetch_files = cache_config.get('prefetch', 2)
+
+        # Tolerances used to compare values of PVs not having them in the request file
+        doc.tolerance_rules = SnapshotToleranceRules(config.get('tolerances'))
+
+        # Archive directories (slower tiers), listed together with the save directory
+        archive_config = config.get('archive', dict())
+        doc.archive_dirs = [os.path.abspath(archive_dir) for archive_dir in
+                            (archive_dirs or list()) + archive_config.get('dirs', list())]
+        doc.migrate_after = migrate_after if migrate_after is not None else archive_config.get('migrate-after')
+
         macros_ok = True
         if req_file_macros is None:
             req_file_macros = dict()
@@ -206,8 +228,6 @@ class SnapshotGui(QtWidgets.QMainWindow):
         # If new files were added to restore list, all elements with Labels
         # should update with new existing labels. Force update for first time
         self.restore_widget.files_updated.connect(self.handle_files_updated)
-        # Trigger files update for first time to properly update label selectors
-        self.restore_widget.update_files()
         self.compare_widget.filter_update()
 
         self.restore_widget.files_selected.connect(self.handle_selected_files)
@@ -252,14 +272,8 @@ class SnapshotGui(QtWidgets.QMainWindow):
         doc=QtWidgets.QApplication.instance().doc
         doc.sts_info.set_status("populate file list...", 0, "orange")
         self.init_snapshot(doc.req_file_path, doc.req_file_macros)
-        wgt=self.restore_widget
-        wgt.files_updated.emit(wgt.file_selector.start_file_list_update())
-        save_dir=doc.save_dir
-        save_file_prefix=os.path.basename(doc.save_file_prefix)
-        doc.sts_info.set_status("generate index file...", 0, "orange")
-        wgt.file_selector.gen_index_file(save_dir, save_file_prefix)
-        doc.sts_info.set_status("load index file...", 0, "orange")
-        wgt.file_selector.start_file_list_update_new()
+        doc.sts_info.set_status("update index...", 0, "orange")
+        self.restore_widget.update_files()
 
         wgt=self.compare_widget
         doc.sts_info.set_status("populate PVs list...", 0, "orange")
@@ -294,8 +308,9 @@ class SnapshotGui(QtWidgets.QMainWindow):
 
     def handle_saved(self):
         # When save is done, save widget is updated by itself
-        # Update restore widget (new file in directory)
-        self.restore_widget.update_files()
+        # Update restore widget (new file in directory), unless the new file is reported by the directory watcher
+        if not self.restore_widget.file_selector.is_watching():
+            self.restore_widget.update_files()
 
     def set_request_file(self, path: str, macros: dict):
         doc=QtWidgets.QApplication.instance().doc
@@ -315,7 +330,7 @@ class SnapshotGui(QtWidgets.QMainWindow):
         req_macros = req_macros or {}
         reopen_config = False
         try:
-            doc.snapshot=ss=Snapshot(req_file_path, req_macros)
+            doc.snapshot=ss=Snapshot(req_file_path, req_macros, tolerance_rules=doc.tolerance_rules)
             self.set_request_file(req_file_path, req_macros)
 
         except IOError:
@@ -341,8 +356,7 @@ class SnapshotGui(QtWidgets.QMainWindow):
 
     def handle_files_updated(self, updated_files):
         # When new save file is added, or old one has changed, this method
-        # should handle things like updating label widgets and compare widget.
-        self.save_widget.update_labels()
+        # should handle things like updating compare widget. Label widgets are updated by doc.labels.
         self.compare_widget.update_shown_files(updated_files)
 
     def handle_selected_files(self, selected_files):
@@ -420,6 +434,10 @@ class SnapshotStatus(QtWidgets.QStatusBar):
         self.status_txt = QtWidgets.QLabel()
         self.status_txt.setStyleSheet("background-color: transparent")
         self.addWidget(self.status_txt)
+        self.progress_bar = QtWidgets.QProgressBar(self)
+        self.progress_bar.setMaximumWidth(200)
+        self.progress_bar.hide()
+        self.addPermanentWidget(self.progress_bar)
         self.set_status()
 
     def set_status(self, text="Ready", duration=0, background="rgba(0, 0, 0, 30)"):
@@ -441,6 +459,15 @@ class SnapshotStatus(QtWidgets.QStatusBar):
     def clear_status(self):
         self.set_status("Ready", 0, "rgba(0, 0, 0, 30)")
 
+    def set_progress(self, done, total):
+        # Progress bar is shown only while something is in progress (done < total)
+        if done < total:
+            self.progress_bar.setMaximum(total)
+            self.progress_bar.setValue(done)
+            self.progress_bar.show()
+        else:
+            self.progress_bar.hide()
+
 
 # This function should be called from outside, to start the gui
 def start_gui(*args, **kwargs):
@@ -296,6 +296,79 @@ class SnapshotFileSelector(QtWidgets.QWidget):
         self.file_path_input.setFocus()
 
 
+class SnapshotLabelRegistry(QtCore.QObject):
+    """
+    Labels used in the listed save files, with the number of files using each label. labels_changed is emitted
+    only with labels which appeared (first file with the label) or disappeared (last file with the label removed),
+    so suggestions can be updated without rebuilding them.
+    """
+    labels_changed = QtCore.pyqtSignal(list, list)  # added labels, removed labels
+
+    def __init__(self, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self._counts = dict()
+
+    def __contains__(self, label):
+        return label in self._counts
+
+    def __iter__(self):
+        return iter(self._counts)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def get_count(self, label):
+        return self._counts.get(label, 0)
+
+    def reset(self, counts: dict):
+        """
+        Replace all labels (e.g. after the whole directory was indexed).
+
+        :param counts: Dict {<label>: <number of files>}.
+
+        :return:
+        """
+        added = [label for label in counts if label not in self._counts]
+        removed = [label for label in self._counts if label not in counts]
+        self._counts = dict((label, count) for label, count in counts.items() if count > 0)
+        if added or removed:
+            self.labels_changed.emit(added, removed)
+
+    def update(self, changes: dict):
+        """
+        Change number of files using the labels.
+
+        :param changes: Dict {<label>: <change of number of files>} (see file_changed()).
+
+        :return:
+        """
+        added = list()
+        removed = list()
+        for label, change in changes.items():
+            old_count = self._counts.get(label, 0)
+            count = old_count + change
+            if count > 0:
+                self._counts[label] = count
+                if not old_count:
+                    added.append(label)
+            elif old_count:
+                del self._counts[label]
+                removed.append(label)
+        if added or removed:
+            self.labels_changed.emit(added, removed)
+
+    @staticmethod
+    def file_changed(changes: dict, name, old_labels, new_labels):
+        # Adds changes of a single file to changes dict (to be passed to update()). Can be used as label_changes
+        # callback of the SnapshotIndex.
+        old_labels = set(old_labels)
+        new_labels = set(new_labels)
+        for label in new_labels - old_labels:
+            changes[label] = changes.get(label, 0) + 1
+        for label in old_labels - new_labels:
+            changes[label] = changes.get(label, 0) - 1
+
+
 class SnapshotKeywordSelectorWidget(QtWidgets.QComboBox):
     """
     Widget for defining keywords (labels). Existing keywords are read from
@@ -334,6 +407,9 @@ class SnapshotKeywordSelectorWidget(QtWidgets.QComboBox):
         self.currentIndexChanged[str].connect(self.add_to_selected)
 
         self.update_suggested_keywords()
+        if not defaults_only:
+            doc=QtWidgets.QApplication.instance().doc
+            doc.labels.labels_changed.connect(self.update_changed_keywords)
 
     def get_keywords(self):
         # Return list of currently selected keywords
@@ -416,15 +492,39 @@ class SnapshotKeywordSelectorWidget(QtWidgets.QComboBox):
         # is changed and widget must be updated.
         doc=QtWidgets.QApplication.instance().doc
         self.clear()
-        labels = list() + doc.default_labels
+        labels = set(doc.default_labels)
         if not self.defaults_only:
-            labels += doc.existing_labels
+            labels.update(doc.labels)
             self.addItem("")
         else:
             self.addItem("Select labels ...")
 
-        labels.sort()
-        self.addItems(labels)
+        self.addItems(sorted(labels))
+
+    def update_changed_keywords(self, added, removed):
+        # Only changed labels are inserted to (removed from) the sorted suggestions.
+        doc=QtWidgets.QApplication.instance().doc
+        for label in removed:
+            if label not in doc.default_labels:
+                i = self._find_suggestion(label)
+                if i < self.count() and self.itemText(i) == label:
+                    self.removeItem(i)
+        for label in added:
+            i = self._find_suggestion(label)
+            if i == self.count() or self.itemText(i) != label:
+                self.insertItem(i, label)
+
+    def _find_suggestion(self, label):
+        # Binary search of the position of the label in sorted suggestions (first item is not a label)
+        low = 1
+        high = self.count()
+        while low < high:
+            middle = (low + high) // 2
+            if self.itemText(middle) < label:
+                low = middle + 1
+            else:
+                high = middle
+        return low
 
     def clear_keywords(self):
         keywords_to_remove = copy.copy(self.get_keywords())
@@ -500,8 +600,8 @@ class SnapshotKeywordWidget(QtWidgets.QFrame):
 
 
 class SnapshotEditMetadataDialog(QtWidgets.QDialog):
-    def __init__(self, metadata, common_settings, parent=None):
-        self.common_settings = common_settings
+    def __init__(self, metadata, parent=None):
+        doc=QtWidgets.QApplication.instance().doc
         self.metadata = metadata
 
         QtWidgets.QDialog.__init__(self, parent)
@@ -510,7 +610,7 @@ class SnapshotEditMetadataDialog(QtWidgets.QDialog):
         layout = QtWidgets.QVBoxLayout()
         form_layout = QtWidgets.QFormLayout()
         form_layout.setFieldGrowthPolicy(QtWidgets.QFormLayout.AllNonFixedFieldsGrow)
-        form_layout.setMargin(10)
+        form_layout.setContentsMargins(10,10,10,10)
         form_layout.setSpacing(10)
         form_layout.setLabelAlignment(Qt.AlignRight)
 
@@ -521,9 +621,7 @@ class SnapshotEditMetadataDialog(QtWidgets.QDialog):
 
         # Make field for labels
         # If default labels are defined, then force default labels
-        self.labels_input = SnapshotKeywordSelectorWidget(common_settings,
-                                                          defaults_only=self.common_settings['force_default_labels'],
-                                                          parent=self)
+        self.labels_input = SnapshotKeywordSelectorWidget(defaults_only=doc.force_default_labels, parent=self)
         for label in metadata["labels"]:
             self.labels_input.add_to_selected(label, force=True)
         form_layout.addRow("Labels:", self.labels_input)
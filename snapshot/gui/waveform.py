@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+import numpy
+from PyQt5 import QtGui, QtCore, QtWidgets
+from PyQt5.QtCore import Qt
+
+from ..decimate import minmax_decimate
+
+_TRACE_COLORS = [Qt.black, Qt.blue, Qt.red, Qt.darkGreen, Qt.magenta, Qt.darkCyan, Qt.darkYellow, Qt.darkRed]
+
+
+def _to_numeric_array(value):
+    # Array PV value as 1D float array, None if not numeric (e.g. waveform of strings)
+    if value is None:
+        return None
+    try:
+        array = numpy.asarray(value, dtype=numpy.float64).ravel()
+    except (ValueError, TypeError):
+        return None
+    return array if array.size else None
+
+
+class SnapshotWaveformPlot(QtWidgets.QWidget):
+    """
+    Plot of array values (traces). Only minimum and maximum of values drawn to each pixel are drawn (see
+    minmax_decimate()), so arrays with millions of elements can be zoomed and moved interactively. Traces are decimated
+    again whenever visible range or plot size changes.
+
+    Mouse wheel zooms around the cursor, dragging moves the visible range and double click shows all elements.
+    """
+    range_changed = QtCore.pyqtSignal(int, int)
+
+    _MARGINS = QtCore.QMargins(70, 10, 10, 20)  # left, top, right, bottom (for axis labels)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumHeight(120)
+        self._traces = list()  # (name, 1D float array, color)
+        self._length = 0  # of the longest trace
+        self._start = 0  # visible range of elements [start, stop)
+        self._stop = 0
+        self._decimated = None  # (key, decimated traces) of last paint
+        self._drag_x = None
+
+    def set_traces(self, traces, keep_range=False):
+        """
+        Set traces to be drawn.
+
+        :param traces: List of (name, 1D float numpy array).
+        :param keep_range: Keep visible range (e.g. when values are updated), otherwise all elements are shown.
+        :return:
+        """
+        self._traces = [(name, values, QtGui.QColor(_TRACE_COLORS[i % len(_TRACE_COLORS)]))
+                        for i, (name, values) in enumerate(traces)]
+        self._length = max((len(values) for name, values in traces), default=0)
+        self._decimated = None
+        if keep_range and self._stop <= self._length:
+            self.update()
+        else:
+            self.set_range(0, self._length)
+
+    def set_range(self, start, stop):
+        """
+        Set visible range of elements.
+
+        :param start: First visible element.
+        :param stop: Element after last visible one.
+        :return:
+        """
+        stop = min(max(int(round(stop)), 2), self._length)
+        start = max(min(int(round(start)), stop - 2), 0)
+        if (start, stop) != (self._start, self._stop):
+            self._start, self._stop = start, stop
+            self.update()
+            self.range_changed.emit(start, stop)
+
+    def get_range(self):
+        return self._start, self._stop
+
+    def _plot_rect(self):
+        return self.rect().marginsRemoved(self._MARGINS)
+
+    def _get_decimated(self, width):
+        key = (self._start, self._stop, width)
+        if self._decimated is None or self._decimated[0] != key:
+            traces = list()
+            for name, values, color in self._traces:
+                indices, decimated = minmax_decimate(values, self._start, self._stop, width)
+                finite = numpy.isfinite(decimated)
+                traces.append((name, indices[finite], decimated[finite], color))
+            self._decimated = (key, traces)
+        return self._decimated[1]
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        rect = self._plot_rect()
+        painter.setPen(Qt.gray)
+        painter.drawRect(rect)
+        if not self._traces or rect.width() <= 0 or rect.height() <= 0:
+            return
+
+        traces = self._get_decimated(rect.width())
+        all_values = [values for name, indices, values, color in traces if len(values)]
+        if not all_values:
+            return
+        y_min = min(values.min() for values in all_values)
+        y_max = max(values.max() for values in all_values)
+        if y_max == y_min:
+            y_min -= 1
+            y_max += 1
+
+        # Axis labels
+        painter.setPen(Qt.black)
+        metrics = painter.fontMetrics()
+        painter.drawText(QtCore.QRect(0, rect.top(), rect.left() - 5, metrics.height()), Qt.AlignRight,
+                         '{:.6g}'.format(y_max))
+        painter.drawText(QtCore.QRect(0, rect.bottom() - metrics.height(), rect.left() - 5, metrics.height()),
+                         Qt.AlignRight, '{:.6g}'.format(y_min))
+        painter.drawText(QtCore.QRect(rect.left(), rect.bottom() + 2, rect.width(), metrics.height()), Qt.AlignLeft,
+                         str(self._start))
+        painter.drawText(QtCore.QRect(rect.left(), rect.bottom() + 2, rect.width(), metrics.height()),
+                         Qt.AlignRight, str(self._stop - 1))
+
+        # Traces and legend
+        x_scale = rect.width() / (self._stop - self._start)
+        y_scale = rect.height() / (y_max - y_min)
+        painter.setClipRect(rect)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
+        for i, (name, indices, values, color) in enumerate(traces):
+            x = rect.left() + (indices - self._start + 0.5) * x_scale
+            y = rect.bottom() - (values - y_min) * y_scale
+            painter.setPen(color)
+            if len(x) == 1:
+                painter.drawPoint(QtCore.QPointF(x[0], y[0]))
+            else:
+                painter.drawPolyline(QtGui.QPolygonF([QtCore.QPointF(*point) for point in zip(x.tolist(),
+                                                                                             y.tolist())]))
+            painter.drawText(rect.adjusted(0, 5 + i * metrics.height(), -5, 0), Qt.AlignRight | Qt.AlignTop, name)
+
+    def resizeEvent(self, event):
+        self._decimated = None
+        super().resizeEvent(event)
+
+    def _element_at(self, x):
+        rect = self._plot_rect()
+        return self._start + (x - rect.left()) * (self._stop - self._start) / max(rect.width(), 1)
+
+    def wheelEvent(self, event):
+        if not self._length:
+            return
+        factor = 0.8 if event.angleDelta().y() > 0 else 1.25
+        center = self._element_at(event.pos().x())
+        self.set_range(center - (center - self._start) * factor, center + (self._stop - center) * factor)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._drag_x = event.pos().x()
+
+    def mouseMoveEvent(self, event):
+        if self._drag_x is not None:
+            shift = self._element_at(self._drag_x) - self._element_at(event.pos().x())
+            shift = max(min(shift, self._length - self._stop), -self._start)
+            if int(shift):
+                self._drag_x = event.pos().x()
+                self.set_range(self._start + shift, self._stop + shift)
+
+    def mouseReleaseEvent(self, event):
+        self._drag_x = None
+
+    def mouseDoubleClickEvent(self, event):
+        self.set_range(0, self._length)
+
+
+class SnapshotWaveformWidget(QtWidgets.QWidget):
+    """
+    Panel with values of an array PV (current value and values in selected files) and their differences (to the
+    current value, or to the first file if PV is not connected). Both plots show the same range of elements.
+    """
+    closed = QtCore.pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pvname = None
+
+        self._title = QtWidgets.QLabel(self)
+        close_button = QtWidgets.QPushButton("Close", self)
+        close_button.clicked.connect(self._close)
+        title_layout = QtWidgets.QHBoxLayout()
+        title_layout.addWidget(self._title)
+        title_layout.addStretch()
+        title_layout.addWidget(close_button)
+
+        self._values_plot = SnapshotWaveformPlot(self)
+        self._diff_plot = SnapshotWaveformPlot(self)
+        self._values_plot.range_changed.connect(self._diff_plot.set_range)
+        self._diff_plot.range_changed.connect(self._handle_diff_range_changed)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(title_layout)
+        layout.addWidget(self._values_plot, 2)
+        layout.addWidget(QtWidgets.QLabel("Difference:", self))
+        layout.addWidget(self._diff_plot, 1)
+        self.setLayout(layout)
+
+    def set_values(self, pvname, curr_value, snap_values):
+        """
+        Show values of the PV.
+
+        :param pvname: PV name. If same as shown, visible range is kept.
+        :param curr_value: Current value (None if disconnected).
+        :param snap_values: List of (file name, value).
+        :return:
+        """
+        keep_range = (pvname == self.pvname)
+        self.pvname = pvname
+
+        traces = list()
+        curr = _to_numeric_array(curr_value)
+        if curr is not None:
+            traces.append(('Current value', curr))
+        for file_name, value in snap_values:
+            array = _to_numeric_array(value)
+            if array is not None:
+                traces.append((file_name, array))
+
+        # Differences to the reference (current value or first trace)
+        diffs = list()
+        if traces:
+            ref_name, ref = traces[0]
+            for name, values in traces[1:]:
+                n = min(len(ref), len(values))
+                diffs.append(('{} - {}'.format(name, ref_name), values[:n] - ref[:n]))
+
+        if traces:
+            self._title.setText(pvname)
+        else:
+            self._title.setText('{} (no numeric array values)'.format(pvname))
+        self._diff_plot.blockSignals(True)
+        self._values_plot.set_traces(traces, keep_range)
+        self._diff_plot.set_traces(diffs, keep_range)
+        self._diff_plot.set_range(*self._values_plot.get_range())
+        self._diff_plot.blockSignals(False)
+
+    def _handle_diff_range_changed(self, start, stop):
+        # Differences can be shorter than values, so range of values is not passed back to differences
+        self._values_plot.blockSignals(True)
+        self._values_plot.set_range(start, stop)
+        self._values_plot.blockSignals(False)
+
+    def _close(self):
+        self.pvname = None
+        self.hide()
+        self.closed.emit()
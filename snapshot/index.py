@@ -0,0 +1,492 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from snapshot.archive import SnapshotArchive, is_archive
+from snapshot.snapfile import read_metadata, save_file_suffixes
+from snapshot.watcher import is_network_fs
+
+# Index of the save directory is stored in a SQLite database beside the save files. It holds meta data of all save
+# files, so listing them does not require reading every file. On update() only files which were added or modified
+# (changed mtime or size) since the last update are read.
+#
+# Index is shared by all clients of the save directory (GUIs and "snapshot save" on different hosts), and each of them
+# registers saved files in it. All writes are done in immediate transactions (write lock is taken before anything is
+# read), so concurrent clients never store the same file twice, and wait for each other up to BUSY_TIMEOUT. On local
+# file systems the database is in WAL mode, so readers are never blocked by a writer. WAL needs shared memory which
+# does not work across hosts, so the default rollback journal is used on network file systems.
+INDEX_FILE_NAME = '.snapshot_index.sqlite'
+# Increase whenever the schema changes. Index is only a cache, so it is simply rebuilt.
+INDEX_SCHEMA_VERSION = 3
+# Seconds to wait for the write lock held by another client
+BUSY_TIMEOUT = 30
+
+_SCHEMA = """
+CREATE TABLE files (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    save_time REAL,
+    req_file_name TEXT,
+    comment TEXT NOT NULL DEFAULT '',
+    labels TEXT NOT NULL DEFAULT '[]',
+    pv_count INTEGER,
+    null_count INTEGER,
+    body_sha256 TEXT,
+    metadata TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX files_mtime ON files (mtime, name);
+CREATE INDEX files_comment ON files (comment, name);
+CREATE INDEX files_save_time ON files (save_time);
+CREATE INDEX files_body_sha256 ON files (body_sha256);
+CREATE TABLE file_labels (
+    label TEXT NOT NULL,
+    file_id INTEGER NOT NULL,
+    PRIMARY KEY (label, file_id)
+) WITHOUT ROWID;
+CREATE INDEX file_labels_file_id ON file_labels (file_id);
+CREATE TABLE comment_tokens (
+    token TEXT NOT NULL,
+    file_id INTEGER NOT NULL,
+    PRIMARY KEY (token, file_id)
+) WITHOUT ROWID;
+CREATE INDEX comment_tokens_file_id ON comment_tokens (file_id);
+"""
+
+
+def tokenize_comment(comment: str):
+    """
+    Split comment to tokens (lower case words) as stored in the comment index.
+
+    :param comment: Comment (or comment filter).
+
+    :return: Set of tokens.
+    """
+    return set(re.findall(r'\w+', comment.lower()))
+
+
+class SnapshotIndexQueries(object):
+    """
+    Queries of the indexed save files. Files can be in more indexes (each attached to the connection as one schema),
+    and are then listed as if they were in one. A file which is in more indexes is taken from the first one.
+    """
+    # Columns files can be sorted by
+    sort_columns = ('mtime', 'name', 'comment', 'labels')
+
+    _conn = None
+    _schemas = ('main',)
+
+    @staticmethod
+    def _where(schema, prefix='', name='', comment='', labels=()):
+        # Prefix is not matched with a name range, so SQLite uses the index of the sorted column instead of the name
+        # index (usually all files in the directory have the same prefix anyway).
+        conditions = ['substr(files.name, 1, ?) = ?']
+        params = [len(prefix), prefix]
+        if name:
+            conditions.append('instr(files.name, ?) > 0')
+            params.append(name)
+
+        # Label and comment filters are intersections of the inverted indexes. Each word of the comment filter must be
+        # a prefix of a word in the comment.
+        subqueries = list()
+        for label in labels:
+            subqueries.append('SELECT file_id FROM {}.file_labels WHERE label = ?'.format(schema))
+            params.append(label)
+        for token in sorted(tokenize_comment(comment or '')):
+            subqueries.append('SELECT file_id FROM {}.comment_tokens WHERE token >= ? AND token < ?'.format(schema))
+            params += [token, token + '\uffff']
+        if subqueries:
+            conditions.append('files.id IN ({})'.format(' INTERSECT '.join(subqueries)))
+
+        return ' AND '.join(conditions), params
+
+    def _shadowed(self, i):
+        # Condition which excludes files of the i-th schema which are also in one of the previous schemas
+        return ''.join(' AND NOT EXISTS (SELECT 1 FROM {}.files AS f WHERE f.name = files.name)'.format(schema)
+                       for schema in self._schemas[:i])
+
+    def _select(self, columns, condition='', condition_params=(), **filters):
+        # Compound select of files matching the filters from all schemas. Each part is sorted by its own index when
+        # ordered, so SQLite only merges them.
+        selects = list()
+        params = list()
+        for i, schema in enumerate(self._schemas):
+            where, where_params = self._where(schema, **filters)
+            if condition:
+                where += ' AND ' + condition
+                where_params += list(condition_params)
+            selects.append('SELECT {} FROM {}.files AS files WHERE {}{}'.format(columns, schema, where,
+                                                                               self._shadowed(i)))
+            params += where_params
+        return ' UNION ALL '.join(selects), params
+
+    def count_files(self, **filters):
+        """
+        Get number of files matching the filters.
+
+        :param filters: prefix, name, comment and labels filters (see query_files()).
+
+        :return: Number of files.
+        """
+        sql, params = self._select('COUNT(*) AS count', **filters)
+        return self._conn.execute('SELECT SUM(count) FROM ({})'.format(sql), params).fetchone()[0]
+
+    def query_files(self, order_by: str = 'mtime', descending: bool = True, offset: int = 0, limit: int = -1,
+                    **filters):
+        """
+        Get a sorted range of files matching the filters. Only columns needed to list the files are returned (no
+        meta data), so listing is cheap.
+
+        :param order_by: One of the sort_columns. Files with the same value are sorted by name.
+        :param descending: Sort in descending order.
+        :param offset: Number of files to skip.
+        :param limit: Maximal number of files (-1 for all).
+        :param filters: prefix (file name starts with), name (file name contains), comment (each word is a start
+                        of a word in the comment, case insensitive) and labels (list of labels file must have).
+
+        :return: List of dicts {'name': <file name>, 'mtime': <modification time>, 'comment': <comment>,
+                                'labels': <list of labels>}.
+        """
+        sql, params = self._select('name, mtime, comment, labels', **filters)
+        direction = 'DESC' if descending else 'ASC'
+        rows = self._conn.execute('{} ORDER BY {} {}, name {} LIMIT ? OFFSET ?'.format(
+            sql, self._sort_column(order_by), direction, direction), params + [limit, offset])
+        return [{'name': row['name'], 'mtime': row['mtime'], 'comment': row['comment'],
+                 'labels': json.loads(row['labels'])} for row in rows]
+
+    def get_position(self, file_name: str, order_by: str = 'mtime', descending: bool = True, **filters):
+        """
+        Get position of the file in the sorted list of files (see query_files()).
+
+        :param file_name: File name.
+        :param order_by: One of the sort_columns.
+        :param descending: Sorted in descending order.
+        :param filters: Filters as in query_files().
+
+        :return: Position (int) or None if file is not indexed or does not match the filters.
+        """
+        column = self._sort_column(order_by)
+        sql, params = self._select(column, 'files.name = ?', [file_name], **filters)
+        row = self._conn.execute(sql + ' LIMIT 1', params).fetchone()
+        if row is None:
+            return None
+
+        op = '>' if descending else '<'
+        sql, params = self._select('COUNT(*) AS count', '({0} {1} ? OR {0} = ? AND files.name {1} ?)'.format(
+            column, op), [row[0], row[0], file_name], **filters)
+        return self._conn.execute('SELECT SUM(count) FROM ({})'.format(sql), params).fetchone()[0]
+
+    def get_label_counts(self, prefix: str = ''):
+        """
+        Get number of files using each label.
+
+        :param prefix: Only files with names starting with prefix.
+
+        :return: Dict {<label>: <number of files>}.
+        """
+        selects = list()
+        params = list()
+        for i, schema in enumerate(self._schemas):
+            selects.append('SELECT label FROM {0}.file_labels AS fl JOIN {0}.files AS files ON files.id = fl.file_id '
+                           'WHERE substr(files.name, 1, ?) = ?{1}'.format(schema, self._shadowed(i)))
+            params += [len(prefix), prefix]
+        return dict(self._conn.execute('SELECT label, COUNT(*) FROM ({}) GROUP BY label'.format(
+            ' UNION ALL '.join(selects)), params).fetchall())
+
+    def get_data_version(self):
+        """
+        Get version of the indexed data. Version changes whenever index is modified by another connection (e.g. other
+        client registered a saved file), so it can be polled to refresh the shown files.
+
+        :return: Tuple of versions (one per index).
+        """
+        return tuple(self._conn.execute('PRAGMA {}.data_version'.format(schema)).fetchone()[0]
+                     for schema in self._schemas)
+
+    def _sort_column(self, order_by):
+        if order_by not in self.sort_columns:
+            raise ValueError('Files can not be sorted by "{}"'.format(order_by))
+        return order_by
+
+
+class SnapshotIndex(SnapshotIndexQueries):
+    # Index update is committed after each commit_size read files
+    commit_size = 1000
+
+    def __init__(self, save_dir: str, suffix: str = '.snap'):
+        """
+        Persistent index of save files in the directory. Save files in an archive (see SnapshotArchive) are indexed
+        the same way, with the archive given as save_dir (index is then kept in user's cache directory).
+
+        :param save_dir: Directory with save files (or archive).
+        :param suffix: Suffix of the (uncompressed) save files.
+
+        :return:
+        """
+        self.save_dir = os.path.abspath(save_dir)
+        self.suffix = suffix
+        self._archive = SnapshotArchive(self.save_dir) if is_archive(self.save_dir) else None
+        self.path = os.path.join(self.save_dir, INDEX_FILE_NAME)
+        try:
+            self._conn = self._connect(self.path)
+        except sqlite3.Error as e:
+            # Save directory is not writable. Keep index in user's cache directory instead.
+            self.path = os.path.join(os.path.expanduser('~'), '.cache', 'snapshot',
+                                     hashlib.sha1(self.save_dir.encode()).hexdigest() + '.sqlite')
+            logging.debug('Cannot use index in the save directory ({}). Using {}'.format(e, self.path))
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = self._connect(self.path)
+
+    @classmethod
+    def _connect(cls, path):
+        # Transactions are started explicitly (see _transaction())
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode = {}'.format('DELETE' if is_network_fs(path) else 'WAL'))
+        except sqlite3.OperationalError as e:
+            # E.g. database is in WAL mode and another client is using it. Current mode is kept.
+            logging.debug('Cannot set journal mode of {}: {}'.format(path, e))
+
+        if conn.execute('PRAGMA user_version').fetchone()[0] != INDEX_SCHEMA_VERSION:
+            with cls._transaction(conn):
+                # Checked again, because other client could create the index in the meantime
+                if conn.execute('PRAGMA user_version').fetchone()[0] != INDEX_SCHEMA_VERSION:
+                    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+                    for table in tables:
+                        conn.execute('DROP TABLE IF EXISTS {}'.format(table))
+                    for statement in _SCHEMA.split(';'):
+                        conn.execute(statement)
+                    conn.execute('PRAGMA user_version = {}'.format(INDEX_SCHEMA_VERSION))
+        return conn
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn):
+        # Write lock is taken at the beginning, so transaction never fails on upgrading a read lock to a write lock
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def close(self):
+        self._conn.close()
+
+    def update(self, progress=None, jobs: int = None, label_changes=None):
+        """
+        Synchronize index with the save directory. Only meta data of new or modified files is read (in a thread pool,
+        so it does not wait for each file on slow file systems).
+
+        :param progress: Callable progress(done, total) called after each committed chunk of commit_size files.
+        :param jobs: Number of threads reading the files (default as in concurrent.futures.ThreadPoolExecutor).
+        :param label_changes: Callable label_changes(name, old_labels, new_labels) called for each changed file.
+
+        :return: (added, modified, removed) lists of file names.
+        """
+        indexed = dict((row['name'], (row['mtime'], row['size'])) for row in
+                       self._conn.execute('SELECT name, mtime, size FROM files'))
+
+        changed = list()
+        existing = self._list_files()
+        for name, stat in existing.items():
+            if indexed.get(name) != stat:
+                changed.append((name, stat))
+
+        removed = [name for name in indexed if name not in existing]
+        return self._apply(changed, removed, indexed, progress, jobs, label_changes)
+
+    def update_files(self, names, label_changes=None):
+        """
+        Update index only for given files (e.g. reported by SnapshotDirWatcher), without scanning the directory.
+
+        :param names: Names of created, modified or deleted files.
+        :param label_changes: Callable label_changes(name, old_labels, new_labels) called for each changed file.
+
+        :return: (added, modified, removed) lists of file names.
+        """
+        indexed = dict()
+        changed = list()
+        removed = list()
+        members = self._archive.get_members() if self._archive else None
+        for name in names:
+            row = self._conn.execute('SELECT mtime, size FROM files WHERE name = ?', (name,)).fetchone()
+            if row is not None:
+                indexed[name] = (row['mtime'], row['size'])
+            if members is not None:
+                member = members.get(name)
+                stat = (member['mtime'], member['size']) if member else None
+            else:
+                try:
+                    stat = os.stat(os.path.join(self.save_dir, name))
+                    stat = (stat.st_mtime, stat.st_size)
+                except OSError:
+                    stat = None
+            if stat is None:
+                if row is not None:
+                    removed.append(name)
+            elif indexed.get(name) != stat:
+                changed.append((name, stat))
+
+        return self._apply(changed, removed, indexed, label_changes=label_changes)
+
+    def _list_files(self):
+        # Returns {name: (mtime, size)} of all save files in the directory (or archive)
+        suffixes = save_file_suffixes(self.suffix)
+        files = dict()
+        if self._archive:
+            for name, member in self._archive.get_members().items():
+                if name.endswith(suffixes):
+                    files[name] = (member['mtime'], member['size'])
+            return files
+
+        with os.scandir(self.save_dir) as entries:
+            for entry in entries:
+                # Hidden files are temporary files (e.g. meta data being replaced)
+                if entry.name.endswith(suffixes) and not entry.name.startswith('.'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # Broken symlink or deleted in the meantime
+                    files[entry.name] = (stat.st_mtime, stat.st_size)
+        return files
+
+    def _apply(self, changed, removed, indexed, progress=None, jobs=None, label_changes=None):
+        # Reads meta data of changed files and stores them to the index. Removed files are removed from the index.
+        # Files are read in chunks of commit_size without holding the write lock, and each chunk is stored in one
+        # transaction (files are available to other clients while update is running). File which was stored by
+        # another client since it was read (indexed mtime and size changed) is skipped, so newer data is not
+        # overwritten.
+        added = list()
+        modified = list()
+        if progress:
+            progress(0, len(changed))
+        with ThreadPoolExecutor(jobs) as executor:
+            for start in range(0, len(changed), self.commit_size):
+                chunk = changed[start:start + self.commit_size]
+                all_metadata = list(executor.map(self._read_metadata, [name for name, stat in chunk]))
+
+                with self._transaction(self._conn):
+                    for (name, (mtime, size)), metadata in zip(chunk, all_metadata):
+                        row = self._conn.execute('SELECT mtime, size FROM files WHERE name = ?', (name,)).fetchone()
+                        if (tuple(row) if row is not None else None) != indexed.get(name):
+                            continue
+                        old_labels, new_labels = self._store(name, mtime, size, metadata)
+                        if label_changes and old_labels != new_labels:
+                            label_changes(name, old_labels, new_labels)
+                        if name in indexed:
+                            modified.append(name)
+                        else:
+                            added.append(name)
+                if progress:
+                    progress(start + len(chunk), len(changed))
+
+        if removed:
+            with self._transaction(self._conn):
+                for name in removed:
+                    old_labels = self._remove(name)
+                    if label_changes and old_labels:
+                        label_changes(name, old_labels, [])
+
+        return added, modified, removed
+
+    def _read_metadata(self, name):
+        if self._archive:
+            # Archive index has meta data of all members
+            member = self._archive.get_members().get(name)
+            return member['metadata'] if member else None
+        try:
+            return read_metadata(os.path.join(self.save_dir, name))
+        except Exception as e:
+            # Still indexed (without meta data), so it is not reread on each update
+            logging.debug('Cannot read meta data of {}: {}'.format(name, e))
+            return None
+
+    def _store(self, name, mtime, size, metadata):
+        if metadata is None:
+            metadata = dict()
+        summary = metadata.get('summary')
+        if not isinstance(summary, dict):
+            summary = dict()
+        labels = metadata.get('labels')
+        if not isinstance(labels, list):
+            labels = list()
+
+        comment = str(metadata.get('comment', ''))
+
+        # Update (instead of replace) keeps id of the file, so it stays the same in the inverted indexes
+        values = (mtime, size, metadata.get('save_time'), metadata.get('req_file_name'), comment, json.dumps(labels),
+                  summary.get('pv_count'), summary.get('null_count'), summary.get('body_sha256'), json.dumps(metadata))
+        row = self._conn.execute('SELECT id, labels FROM files WHERE name = ?', (name,)).fetchone()
+        if row is not None:
+            file_id = row[0]
+            old_labels = json.loads(row[1])
+            self._conn.execute('UPDATE files SET mtime = ?, size = ?, save_time = ?, req_file_name = ?, comment = ?, '
+                               'labels = ?, pv_count = ?, null_count = ?, body_sha256 = ?, metadata = ? WHERE id = ?',
+                               values + (file_id,))
+        else:
+            file_id = self._conn.execute('INSERT INTO files (mtime, size, save_time, req_file_name, comment, labels, '
+                                         'pv_count, null_count, body_sha256, metadata, name) '
+                                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', values + (name,)).lastrowid
+            old_labels = list()
+
+        # Inverted indexes of labels and comment tokens
+        self._conn.execute('DELETE FROM file_labels WHERE file_id = ?', (file_id,))
+        self._conn.executemany('INSERT OR IGNORE INTO file_labels (label, file_id) VALUES (?, ?)',
+                               [(str(label), file_id) for label in labels])
+        self._conn.execute('DELETE FROM comment_tokens WHERE file_id = ?', (file_id,))
+        self._conn.executemany('INSERT INTO comment_tokens (token, file_id) VALUES (?, ?)',
+                               [(token, file_id) for token in tokenize_comment(comment)])
+        return old_labels, labels
+
+    def _remove(self, name):
+        # Returns labels of the removed file
+        row = self._conn.execute('SELECT id, labels FROM files WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return list()
+        self._conn.execute('DELETE FROM file_labels WHERE file_id = ?', (row[0],))
+        self._conn.execute('DELETE FROM comment_tokens WHERE file_id = ?', (row[0],))
+        self._conn.execute('DELETE FROM files WHERE id = ?', (row[0],))
+        return json.loads(row[1])
+
+    def get_files(self, prefix: str = '', before: float = None):
+        """
+        Get indexed save files.
+
+        :param prefix: Only files with names starting with prefix.
+        :param before: Only files modified before this time (seconds since epoch).
+
+        :return: List of dicts {'name': <file name>, 'mtime': <modification time>, 'size': <bytes>,
+                                'metadata': <dict with meta data>}, newest first.
+        """
+        rows = self._conn.execute('SELECT name, mtime, size, metadata FROM files WHERE name >= ? AND name < ? '
+                                  'AND mtime < ? ORDER BY mtime DESC',
+                                  (prefix, prefix + '\uffff', float('inf') if before is None else before))
+        return [self._row_to_file(row) for row in rows]
+
+    def get_file(self, name: str):
+        """
+        Get indexed save file.
+
+        :param name: File name.
+
+        :return: Dict as in get_files() or None if not indexed.
+        """
+        row = self._conn.execute('SELECT name, mtime, size, metadata FROM files WHERE name = ?', (name,)).fetchone()
+        if row is not None:
+            return self._row_to_file(row)
+        else:
+            return None
+
+    @staticmethod
+    def _row_to_file(row):
+        return {'name': row['name'], 'mtime': row['mtime'], 'size': row['size'],
+                'metadata': json.loads(row['metadata'])}
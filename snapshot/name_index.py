@@ -0,0 +1,124 @@
+import bisect
+import collections
+import re
+import string
+
+import numpy
+
+# Length of indexed substrings (n-grams) of names
+_NGRAM = 3
+# Characters matching only themselves in regular expressions
+_LITERAL_CHARS = frozenset(string.ascii_letters + string.digits + ':_-')
+_EMPTY_ROWS = numpy.zeros(0, dtype=numpy.int32)
+
+
+def regex_prefix(pattern: str, flags: int = 0):
+    """
+    Get literal prefix of regular expression, which all strings fully matching the expression start with.
+
+    :param pattern: Regular expression.
+    :param flags: Flags of compiled expression (prefix is not used when matching ignores case).
+
+    :return: Prefix (empty if there is none).
+    """
+    if flags & (re.IGNORECASE | re.VERBOSE) or '|' in pattern:
+        return ''
+    end = 0
+    while end < len(pattern) and pattern[end] in _LITERAL_CHARS:
+        end += 1
+    if end < len(pattern) and pattern[end] in '*?{':
+        end -= 1  # Last character is optional
+    return pattern[:end]
+
+
+class SnapshotNameIndex(object):
+    def __init__(self, names=(), cache_size: int = 32):
+        """
+        Index of PV names for filtering by substring or regular expression. Substring filters only check names
+        containing all n-grams of the substring, and regular expressions only names starting with their literal
+        prefix. Results of the last cache_size filters are kept.
+
+        :param names: List of names (index of name is its row).
+        :param cache_size: Number of kept results.
+
+        :return:
+        """
+        self._names = list(names)
+        order = sorted(range(len(self._names)), key=self._names.__getitem__)
+        self._sorted_names = [self._names[row] for row in order]
+        self._sorted_rows = numpy.array(order, dtype=numpy.int32)
+
+        ngrams = collections.defaultdict(list)
+        for row, name in enumerate(self._names):
+            for ngram in {name[i:i + _NGRAM] for i in range(len(name) - _NGRAM + 1)}:
+                ngrams[ngram].append(row)
+        self._ngrams = {ngram: numpy.array(rows, dtype=numpy.int32) for ngram, rows in ngrams.items()}
+
+        self._cache_size = cache_size
+        self._matches = collections.OrderedDict()  # filter key: mask, least recently used first
+
+    def __len__(self):
+        return len(self._names)
+
+    def match(self, name_filter):
+        """
+        Get rows matching the filter.
+
+        :param name_filter: Substring (str) or compiled regular expression (fully matching names).
+
+        :return: Read only numpy bool array, True for rows matching the filter.
+        """
+        if isinstance(name_filter, str):
+            key = ('str', name_filter)
+        else:
+            key = ('re', name_filter.pattern, name_filter.flags)
+
+        mask = self._matches.get(key)
+        if mask is None:
+            if key[0] == 'str':
+                mask = self._match_substring(name_filter)
+            else:
+                mask = self._match_regex(name_filter)
+            mask.flags.writeable = False
+            self._matches[key] = mask
+            if len(self._matches) > self._cache_size:
+                self._matches.popitem(last=False)
+        else:
+            self._matches.move_to_end(key)
+        return mask
+
+    def _match_substring(self, text):
+        if not text:
+            return numpy.ones(len(self._names), dtype=bool)
+
+        if len(text) >= _NGRAM:
+            # Names containing all n-grams of the text, rarest first to keep the intersection small
+            postings = sorted((self._ngrams.get(text[i:i + _NGRAM], _EMPTY_ROWS)
+                               for i in range(len(text) - _NGRAM + 1)), key=len)
+            candidates = postings[0]
+            for rows in postings[1:]:
+                if not len(candidates):
+                    break
+                candidates = numpy.intersect1d(candidates, rows, assume_unique=True)
+        else:
+            candidates = numpy.arange(len(self._names))
+
+        # Matches of a shorter filter contained in the text (e.g. while typing) contain all matches of the text
+        for key, mask in reversed(self._matches.items()):
+            if key[0] == 'str' and key[1] in text:
+                candidates = candidates[mask[candidates]]
+                break
+
+        return self._mask([row for row in candidates.tolist() if text in self._names[row]])
+
+    def _match_regex(self, regex):
+        prefix = regex_prefix(regex.pattern, regex.flags)
+        start = bisect.bisect_left(self._sorted_names, prefix)
+        stop = bisect.bisect_left(self._sorted_names, prefix + chr(0x10ffff)) if prefix else len(self._names)
+        return self._mask([row for row in self._sorted_rows[start:stop].tolist()
+                           if regex.fullmatch(self._names[row]) is not None])
+
+    def _mask(self, rows):
+        mask = numpy.zeros(len(self._names), dtype=bool)
+        mask[rows] = True
+        return mask
@@ -1,4 +1,7 @@
 from snapshot.core import SnapshotError, SnapshotPv
+from snapshot.snapfile import open_save_file
+from snapshot.tolerance import ToleranceError, parse_tolerance
+import json
 import os
 import re
 
@@ -36,10 +39,12 @@ class SnapshotReqFile(object):
         self._curr_line_n = 0
         self._curr_line_txt = ''
         self._err = list()
+        self.tolerances = dict()  # {pvname: PvTolerance} of PVs with tolerance declared after the name, set by read()
 
     def read(self):
         """
         Parse request file and return list of pv names where changeable_macros are not replaced. ("raw" pv names).
+        Tolerances (JSON object after the PV name, e.g. 'PV:NAME,{"abs": 0.01}') are stored in self.tolerances.
         In case of problems raises exceptions.
                 ReqParseError
                     ReqFileFormatError
@@ -47,7 +52,8 @@ class SnapshotReqFile(object):
 
         :return: List of PV names.
         """
-        f = open(self._path)
+        # Save files (also compressed ones) can be used as request files
+        f = open_save_file(self._path)
 
         pvs = list()
         err = list()
@@ -60,8 +66,8 @@ class SnapshotReqFile(object):
             # skip comments and empty lines
             if not self._curr_line.startswith(('#', "data{", "}", "!")) and self._curr_line.strip():
                 # First replace macros, then check if any unreplaced macros which are not "global"
-                pvname = SnapshotPv.macros_substitution((self._curr_line.rstrip().split(',', maxsplit=1)[0]),
-                                                        self._macros)
+                split_line = self._curr_line.rstrip().split(',', maxsplit=1)
+                pvname = SnapshotPv.macros_substitution(split_line[0], self._macros)
 
                 try:
                     # Check if any unreplaced macros
@@ -72,6 +78,15 @@ class SnapshotReqFile(object):
 
                 pvs.append(pvname)
 
+                # Values in save files (also used as request files) are never JSON objects
+                if len(split_line) > 1 and split_line[1].strip().startswith('{'):
+                    try:
+                        self.tolerances[pvname] = parse_tolerance(json.loads(split_line[1]))
+                    except (ValueError, ToleranceError) as e:
+                        f.close()
+                        raise ReqFileFormatError(self._format_err((self._curr_line_n, self._curr_line),
+                                                                  'Invalid tolerance. {}'.format(e)))
+
             elif self._curr_line.startswith('!'):
                 # Calling another req file
                 split_line = self._curr_line[1:].split(',', maxsplit=1)
@@ -112,6 +127,7 @@ class SnapshotReqFile(object):
                     sub_f = SnapshotReqFile(path, parent=self, macros=macros)
                     sub_pvs = sub_f.read()
                     pvs += sub_pvs
+                    self.tolerances.update(sub_f.tolerances)
 
                 except IOError as e:
                     f.close()
@@ -0,0 +1,133 @@
+import calendar
+import logging
+import os
+import time
+
+from snapshot.index import SnapshotIndex
+from snapshot.snapfile import get_linked_paths, move_save_files, remove_save_file
+
+# Retention policy is a list of rules, each selecting save files to be kept (e.g. all files from the last 7 days, one
+# file per day for 3 months, and all files labeled "golden"). File is kept if any of the rules keeps it, all other
+# files are pruned (deleted or moved to an archive directory).
+DAY = 24 * 3600
+
+
+class SnapshotRetentionRule(object):
+    def __init__(self, within: float = None, every: float = None, labels=None):
+        """
+        Rule selecting save files to be kept.
+
+        :param within: Keep only files younger than within seconds (by modification time). None for any age.
+        :param every: Keep only the newest file in each period of every seconds (e.g. DAY for one file per day).
+                      Periods are aligned to the local midnight. None to keep all files.
+        :param labels: Keep only files with at least one of the labels. None for any labels.
+
+        :return:
+        """
+        self.within = within
+        self.every = every
+        self.labels = set(labels) if labels else None
+
+    def __repr__(self):
+        return 'SnapshotRetentionRule(within={}, every={}, labels={})'.format(self.within, self.every, self.labels)
+
+    def select(self, files, now: float):
+        """
+        Select files to be kept.
+
+        :param files: List of dicts with 'name', 'mtime' and 'labels' (as returned by SnapshotIndex.query_files()),
+                      newest first.
+        :param now: Current time (seconds since epoch).
+
+        :return: Set of names of files to be kept.
+        """
+        kept = set()
+        periods = set()
+        for file in files:
+            if self.within is not None and now - file['mtime'] >= self.within:
+                break  # All following files are older
+            if self.labels is not None and not self.labels.intersection(file['labels']):
+                continue
+            if self.every:
+                # Local time as if it was UTC, so days start at the local midnight
+                period = calendar.timegm(time.localtime(file['mtime'])) // self.every
+                if period in periods:
+                    continue
+                periods.add(period)
+            kept.add(file['name'])
+        return kept
+
+
+def select_pruned(files, rules, now: float = None):
+    """
+    Select files which are not kept by any of the rules.
+
+    :param files: List of dicts with 'name', 'mtime' and 'labels', newest first.
+    :param rules: List of SnapshotRetentionRule.
+    :param now: Current time (default: time.time()).
+
+    :return: List of names of files to be pruned, newest first.
+    """
+    if not rules:
+        raise ValueError('At least one retention rule is needed (otherwise all files would be pruned).')
+    if now is None:
+        now = time.time()
+
+    kept = set()
+    for rule in rules:
+        kept |= rule.select(files, now)
+    return [file['name'] for file in files if file['name'] not in kept]
+
+
+def prune(save_dir: str, rules, prefix: str = '', archive_dir: str = None, dry_run: bool = False, now: float = None,
+          suffix: str = '.snap'):
+    """
+    Delete (or move to the archive directory) save files which are not kept by the retention rules. Files are selected
+    from the index of the save directory, which is updated first. Symlinks (e.g. *_latest.snap) and files they point
+    to are never pruned.
+
+    :param save_dir: Directory with save files.
+    :param rules: List of SnapshotRetentionRule.
+    :param prefix: Only files with names starting with prefix are pruned.
+    :param archive_dir: Move pruned files to this directory (or archive file) instead of deleting them.
+    :param dry_run: Only select files to be pruned.
+    :param now: Current time (default: time.time()).
+    :param suffix: Suffix of the (uncompressed) save files.
+
+    :return: List of names of pruned files (or files which would be pruned if dry_run).
+    """
+    index = SnapshotIndex(save_dir, suffix)
+    try:
+        index.update()
+        linked = get_linked_paths(index.save_dir)
+        pruned = list()
+        for name in select_pruned(index.query_files('mtime', True, prefix=prefix), rules, now):
+            path = os.path.join(index.save_dir, name)
+            if path not in linked and os.path.realpath(path) not in linked:
+                pruned.append(name)
+        if dry_run:
+            return pruned
+
+        paths = [os.path.join(index.save_dir, name) for name in pruned]
+        if archive_dir:
+            done = [os.path.basename(path) for path in move_save_files(paths, archive_dir)]
+        else:
+            done = list()
+            for path in paths:
+                try:
+                    remove_save_file(path)
+                    done.append(os.path.basename(path))
+                except OSError as e:
+                    logging.warning('Cannot prune {}: {}'.format(path, e))
+
+        # Index is updated for all pruned files at once (in one transaction)
+        index.update_files(done)
+        if archive_dir and done:
+            archive_index = SnapshotIndex(archive_dir, suffix)
+            try:
+                archive_index.update_files(done)
+            finally:
+                archive_index.close()
+        return done
+    finally:
+        index.close()
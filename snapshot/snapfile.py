@@ -0,0 +1,476 @@
+import bz2
+import filecmp
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import logging
+import lzma
+import os
+import shutil
+
+from snapshot.archive import SnapshotArchive, is_archive, open_archive_member, split_archive_path
+from snapshot.blobstore import BLOB_DIR_NAME, SnapshotBlobStore, find_blob_refs
+from snapshot.core import SnapshotError
+
+# Save files can optionally be compressed with one of the stdlib codecs. Compressed files keep the ".snap" suffix with
+# the codec suffix appended (e.g. "file.snap.gz"), so they are still recognized when scanning the save directory.
+compressors = {'gz': gzip, 'bz2': bz2, 'xz': lzma}
+
+# Meta data line is padded with spaces to a multiple of METADATA_BLOCK_SIZE bytes (with at least METADATA_SPARE_SIZE
+# bytes of spare room), so it can later be replaced in place (e.g. when labels or comment are edited) without rewriting
+# the rest of the file.
+METADATA_BLOCK_SIZE = 512
+METADATA_SPARE_SIZE = 256
+
+
+def get_compression(path: str):
+    """
+    Get compression codec of the file from its suffix. Symbolic links (e.g. "*_latest.snap") are followed.
+
+    :param path: Path to the file.
+
+    :return: Name of the codec (one of the compressors keys) or None if file is not compressed.
+    """
+    codec = os.path.splitext(os.path.realpath(path))[1][1:]
+    if codec in compressors:
+        return codec
+    else:
+        return None
+
+
+def add_compression_suffix(path: str, compression: str):
+    """
+    Append suffix of the compression codec to the path (if not already there).
+
+    :param path: Path to the file.
+    :param compression: Name of the codec (one of the compressors keys) or None.
+
+    :return: Path with codec suffix.
+    """
+    if not compression:
+        return path
+    elif compression not in compressors:
+        raise SnapshotError('Unknown compression "{}". Use one of: {}'.format(compression,
+                                                                             ', '.join(compressors.keys())))
+    elif path.endswith('.' + compression):
+        return path
+    else:
+        return path + '.' + compression
+
+
+def open_save_file(path: str, mode: str = 'r'):
+    """
+    Open save file in text mode. Compressed files are (de)compressed transparently while streaming, so reading the
+    first line (meta data) does not decompress the whole file. Save files in archives (e.g. "old.snaparc/file.snap")
+    are read from the archive.
+
+    :param path: Path to the file.
+    :param mode: 'r' or 'w'.
+
+    :return: File object.
+    """
+    compression = get_compression(path)
+    member = open_archive_member(path) if mode == 'r' else None
+    if member is not None:
+        return compressors[compression].open(member, 'rt') if compression else io.TextIOWrapper(member)
+    elif compression:
+        return compressors[compression].open(path, mode + 't')
+    else:
+        return open(path, mode)
+
+
+def format_metadata(metadata: dict):
+    """
+    Get meta data line of the save file (json dump of the dict, padded with spaces).
+
+    :param metadata: Dict with meta data.
+
+    :return: Line (including new line character).
+    """
+    line = "#" + json.dumps(metadata)
+    size = -(-(len(line) + 1 + METADATA_SPARE_SIZE) // METADATA_BLOCK_SIZE) * METADATA_BLOCK_SIZE
+    return line.ljust(size - 1) + "\n"
+
+
+def read_metadata(path: str):
+    """
+    Read only meta data of the save file (first line), without reading the rest of the file.
+
+    :param path: Path to the save file.
+
+    :return: Dict with meta data or None if file has no (valid) meta data.
+    """
+    with open_save_file(path) as save_file:
+        line = save_file.readline()
+
+    if line.startswith('#'):
+        try:
+            metadata = json.loads(line[1:])
+            if isinstance(metadata, dict):
+                return metadata
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+class SaveFileBodySummary(object):
+    def __init__(self):
+        """
+        Summary of the save file body, computed line by line (e.g. while the file is parsed). Digest is computed from
+        UTF-8 encoded lines (with "\\n" line endings), so it does not depend on compression or platform.
+
+        :return:
+        """
+        self._digest = hashlib.sha256()
+        self._pv_count = 0
+        self._null_count = 0
+        self._size = 0
+
+    def update(self, line: str):
+        """
+        Add next body line (not the meta data line).
+
+        :param line: Line.
+
+        :return:
+        """
+        line_bytes = line.encode()
+        self._digest.update(line_bytes)
+        self._size += len(line_bytes)
+        if line.strip() and not line.startswith('#'):
+            self._pv_count += 1
+            if ',' not in line:
+                self._null_count += 1
+
+    def result(self):
+        """
+        :return: Dict {'pv_count': <int>, 'null_count': <number of PVs without value>, 'body_size': <bytes>,
+                       'body_sha256': <hex digest>}
+        """
+        return {'pv_count': self._pv_count, 'null_count': self._null_count, 'body_size': self._size,
+                'body_sha256': self._digest.hexdigest()}
+
+
+def summarize_body(lines):
+    """
+    Compute summary of the save file body (see SaveFileBodySummary).
+
+    :param lines: Iterable of body lines (without meta data line).
+
+    :return: Dict with summary.
+    """
+    summary = SaveFileBodySummary()
+    for line in lines:
+        summary.update(line)
+    return summary.result()
+
+
+def summarize_save_file(path: str):
+    """
+    Compute summary of the save file body (see summarize_body()) by reading the file.
+
+    :param path: Path to the save file.
+
+    :return: Dict with summary.
+    """
+    with open_save_file(path) as save_file:
+        first_line = save_file.readline()
+        if first_line.startswith('#'):
+            return summarize_body(save_file)
+        else:
+            return summarize_body(itertools.chain([first_line], save_file))
+
+
+def file_digest(path: str):
+    """
+    Get SHA-256 digest of the file content (e.g. request file).
+
+    :param path: Path to the file.
+
+    :return: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def replace_metadata(path: str, metadata: dict):
+    """
+    Replace meta data of the save file. If the new meta data fits into the existing (padded) meta data line, only the
+    line is overwritten in place. Otherwise (or if the file is compressed) file is rewritten to a temporary file which
+    then atomically replaces the original one.
+
+    :param path: Path to the save file.
+    :param metadata: Dict with new meta data.
+
+    :return:
+    """
+    if split_archive_path(path) is not None:
+        raise SnapshotError('Meta data of {} cannot be changed, because it is in an archive.'.format(path))
+    path = os.path.realpath(path)  # Replace file, not the "_latest" symlink
+    line = ("#" + json.dumps(metadata)).encode()
+
+    if not get_compression(path):
+        with open(path, 'r+b') as save_file:
+            old_line = save_file.readline()
+            if old_line.startswith(b'#'):
+                ending = old_line[len(old_line.rstrip(b'\r\n')):]
+                capacity = len(old_line) - len(ending)
+                if len(line) <= capacity:
+                    save_file.seek(0)
+                    save_file.write(line.ljust(capacity) + ending)
+                    return
+
+    # Hidden temporary file in the same directory (for atomic replace), written with the same compression
+    tmp_path = os.path.join(os.path.dirname(path), '.{}.{}.tmp'.format(os.path.basename(path), os.getpid()))
+    compression = get_compression(path)
+    try:
+        with open_save_file(path) as save_file, \
+                (compressors[compression].open(tmp_path, 'wt') if compression else open(tmp_path, 'w')) as tmp_file:
+            tmp_file.write(format_metadata(metadata))
+            first_line = save_file.readline()
+            if not first_line.startswith('#'):
+                tmp_file.write(first_line)  # File without meta data
+            shutil.copyfileobj(save_file, tmp_file)
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def save_file_suffixes(suffix: str = '.snap'):
+    """
+    Get all suffixes a save file can have (plain and compressed).
+
+    :param suffix: Suffix of the uncompressed save file.
+
+    :return: Tuple of suffixes.
+    """
+    return (suffix,) + tuple(suffix + '.' + codec for codec in compressors)
+
+
+def is_save_file(name: str, suffix: str = '.snap'):
+    """
+    Check if file name is a name of the save file (plain or compressed).
+
+    :param name: File name.
+    :param suffix: Suffix of the uncompressed save file.
+
+    :return: True if save file.
+    """
+    return name.endswith(save_file_suffixes(suffix))
+
+
+def list_save_files(save_dir: str, prefix: str = '', suffix: str = '.snap'):
+    """
+    Get paths of all save files (plain and compressed) in the directory. Directory is listed only once, no matter how
+    many suffixes are supported.
+
+    :param save_dir: Directory (or archive) with save files.
+    :param prefix: Only files starting with prefix are returned.
+    :param suffix: Suffix of the uncompressed save file.
+
+    :return: List of paths.
+    """
+    paths = list()
+    suffixes = save_file_suffixes(suffix)
+    if is_archive(save_dir):
+        for name in SnapshotArchive(save_dir).get_members():
+            if name.startswith(prefix) and name.endswith(suffixes):
+                paths.append(os.path.join(save_dir, name))
+        return paths
+
+    with os.scandir(save_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith(prefix) and entry.name.endswith(suffixes):
+                paths.append(entry.path)
+    return paths
+
+
+def get_linked_paths(save_dir: str):
+    """
+    Get paths of symlinks in the directory (e.g. *_latest.snap) and of the files they point to. Such files should not
+    be moved or deleted by bulk operations.
+
+    :param save_dir: Directory with save files.
+
+    :return: Set of absolute paths (symlinks as listed, targets resolved).
+    """
+    with os.scandir(os.path.abspath(save_dir)) as entries:
+        links = [entry.path for entry in entries if entry.is_symlink()]
+    return set(links) | set(os.path.realpath(link) for link in links)
+
+
+def remove_save_file(path: str):
+    """
+    Delete save file. If save file references values in the blob store, references are released (and blobs which are
+    no longer used are deleted).
+
+    :param path: Path to the save file.
+
+    :return:
+    """
+    save_dir = os.path.dirname(os.path.abspath(path))
+    digests = set()
+    if not os.path.islink(path) and os.path.isdir(os.path.join(save_dir, BLOB_DIR_NAME)):
+        with open_save_file(path) as save_file:
+            digests = find_blob_refs(save_file)
+
+    os.remove(path)
+
+    if digests:
+        SnapshotBlobStore(save_dir).release(os.path.basename(path), digests)
+
+
+def move_save_file(path: str, dest_dir: str):
+    """
+    Move save file to another directory (e.g. on another file system). Modification time is kept. Values the file
+    references in the blob store are moved to the blob store of the destination directory.
+
+    :param path: Path to the save file.
+    :param dest_dir: Destination directory (or archive, see pack_save_files()).
+
+    :return: Path of the moved file.
+    """
+    name = os.path.basename(path)
+    dest_path = os.path.join(dest_dir, name)
+    if is_archive(dest_dir):
+        pack_save_files([path], dest_dir)
+    elif os.path.exists(dest_path):
+        # E.g. previous move was interrupted before the file was removed
+        if not filecmp.cmp(path, dest_path, shallow=False):
+            raise FileExistsError('File {} already exists.'.format(dest_path))
+    else:
+        save_dir = os.path.dirname(os.path.abspath(path))
+        if not os.path.islink(path) and os.path.isdir(os.path.join(save_dir, BLOB_DIR_NAME)):
+            with open_save_file(path) as save_file:
+                digests = find_blob_refs(save_file)
+            blob_store = SnapshotBlobStore(save_dir)
+            dest_blob_store = SnapshotBlobStore(dest_dir)
+            for digest in digests:
+                dest_blob_store.put(blob_store.get(digest), name)
+
+        # Copied to a hidden file first, so the file is never seen partially copied
+        tmp_path = os.path.join(dest_dir, '.{}.{}.tmp'.format(name, os.getpid()))
+        try:
+            shutil.copy2(path, tmp_path)
+            os.replace(tmp_path, dest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    remove_save_file(path)
+    return dest_path
+
+
+def move_save_files(paths, dest_dir: str):
+    """
+    Move save files to another directory (see move_save_file()). Files moved to an archive are appended to it at once.
+    Files which cannot be moved are skipped (and logged).
+
+    :param paths: Paths to the save files.
+    :param dest_dir: Destination directory or archive.
+
+    :return: List of paths (original) of moved files.
+    """
+    moved = list()
+    if is_archive(dest_dir):
+        pack_save_files(paths, dest_dir)
+        for path in paths:
+            try:
+                remove_save_file(path)
+                moved.append(path)
+            except OSError as e:
+                logging.warning('Cannot remove {} (already in {}): {}'.format(path, dest_dir, e))
+    else:
+        for path in paths:
+            try:
+                move_save_file(path, dest_dir)
+                moved.append(path)
+            except OSError as e:
+                logging.warning('Cannot move {} to {}: {}'.format(path, dest_dir, e))
+    return moved
+
+
+def pack_save_files(paths, archive_path: str):
+    """
+    Append save files to the archive (see SnapshotArchive). Files are stored unchanged, with their modification time
+    and meta data in the archive index. Values the files reference in the blob store are appended as well, so the
+    archive does not depend on the blob store.
+
+    :param paths: Paths to the save files.
+    :param archive_path: Path to the archive (created if it does not exist).
+
+    :return: List of appended save file names.
+    """
+    archive = SnapshotArchive(archive_path)
+    archived_blobs = set(name for name in archive.get_members() if name.startswith(BLOB_DIR_NAME + '/'))
+
+    def read_members():
+        # Files are read one by one while being appended, so they are never all in memory
+        for path in paths:
+            with open(path, 'rb') as save_file:
+                data = save_file.read()
+            yield os.path.basename(path), data, os.stat(path).st_mtime, read_metadata(path) or dict()
+
+            save_dir = os.path.dirname(os.path.abspath(path))
+            if os.path.isdir(os.path.join(save_dir, BLOB_DIR_NAME)):
+                with open_save_file(path) as save_file:
+                    digests = find_blob_refs(save_file)
+                blob_store = SnapshotBlobStore(save_dir)
+                for digest in digests:
+                    blob_path = blob_store.get_blob_path(digest)
+                    blob_name = os.path.relpath(blob_path, save_dir).replace(os.sep, '/')
+                    if blob_name not in archived_blobs:
+                        archived_blobs.add(blob_name)
+                        with open(blob_path, 'rb') as blob_file:
+                            yield blob_name, blob_file.read(), os.stat(blob_path).st_mtime, None
+
+    return [name for name in archive.append(read_members()) if not name.startswith(BLOB_DIR_NAME + '/')]
+
+
+def unpack_save_files(archive_path: str, dest_dir: str, names=None):
+    """
+    Extract save files from the archive. Modification time is restored. Values the files reference in the archive
+    are stored to the blob store of the destination directory.
+
+    :param archive_path: Path to the archive.
+    :param dest_dir: Destination directory.
+    :param names: Names of the save files to be extracted (default: all).
+
+    :return: List of paths of extracted files.
+    """
+    archive = SnapshotArchive(archive_path)
+    members = archive.get_members()
+    if names is None:
+        names = sorted(name for name in members if not name.startswith(BLOB_DIR_NAME + '/'))
+
+    paths = list()
+    for name in names:
+        data = archive.read(name)
+        with open_save_file(os.path.join(archive.path, name)) as save_file:
+            digests = find_blob_refs(save_file)
+        if digests:
+            blob_store = SnapshotBlobStore(archive.path)
+            dest_blob_store = SnapshotBlobStore(dest_dir)
+            for digest in digests:
+                dest_blob_store.put(blob_store.get(digest), name)
+
+        # Written to a hidden file first, so the file is never seen partially written
+        dest_path = os.path.join(dest_dir, name)
+        tmp_path = os.path.join(dest_dir, '.{}.{}.tmp'.format(name, os.getpid()))
+        try:
+            with open(tmp_path, 'wb') as save_file:
+                save_file.write(data)
+            os.utime(tmp_path, (members[name]['mtime'], members[name]['mtime']))
+            os.replace(tmp_path, dest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        paths.append(dest_path)
+    return paths
@@ -28,7 +28,8 @@ def _support_old_args(args_replacements):
 
 def save(args):
     from .cmd import save
-    save(args.FILE, args.out, args.macro, args.force, args.timeout, args.labels, args.comment)
+    save(args.FILE, args.out, args.macro, args.force, args.timeout, args.labels, args.comment, args.compress,
+         args.dedup)
 
 
 def restore(args):
@@ -36,14 +37,43 @@ def restore(args):
     restore(args.FILE, args.force, args.timeout)
 
 
+def verify(args):
+    from .cmd import verify
+    if verify(args.DIR, args.req, args.macro, args.prefix, args.jobs, args.out):
+        sys.exit(1)
+
+
+def prune(args):
+    from .cmd import prune
+    prune(args.DIR, args.keep_all, args.keep_daily, args.keep_weekly, args.keep_label, args.prefix, args.archive,
+          args.dry_run, args.out)
+
+
+def archive_pack(args):
+    from .cmd import archive_pack
+    archive_pack(args.ARCHIVE, args.FILE, args.prefix, args.remove)
+
+
+def archive_unpack(args):
+    from .cmd import archive_unpack
+    archive_unpack(args.ARCHIVE, args.dir, args.NAME)
+
+
+def archive_list(args):
+    from .cmd import archive_list
+    archive_list(args.ARCHIVE, args.out)
+
+
 def gui(args):
     from .gui import start_gui
     start_gui(args.FILE, args.macro, save_dir=args.dir, force=args.force, default_labels=args.labels,
-              force_default_labels=args.force_labels, init_path=args.base, config_path=args.config)
+              force_default_labels=args.force_labels, init_path=args.base, config_path=args.config,
+              archive_dirs=args.archive, migrate_after=args.migrate_after)
 
 
 def main():
     """ Main creates Qt application and handles arguments """
+    from .snapfile import compressors
 
     args_pars = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter)
     args_pars.set_defaults(macro=None)
@@ -65,6 +95,11 @@ def main():
                           help="list of comma separated predefined labels e.g.: \"label_1,label_2\"")
     gui_pars.add_argument('--force_labels', help="force predefined labels", action='store_true')
     gui_pars.add_argument('--config', help="path to configuration file")
+    gui_pars.add_argument('--archive', action='append', metavar='DIR',
+                          help="directory with archived snapshot files, listed together with saved files (can be "
+                               "used more times, fastest first)")
+    gui_pars.add_argument('--migrate_after', type=float, metavar='DAYS',
+                          help="move saved files older than DAYS to the (last) archive directory")
 
     # Save
     save_pars = subparsers.add_parser('save', help='save current state of PVs to file without using GUI')
@@ -79,6 +114,11 @@ def main():
                             help="list of comma separated labels e.g.: \"label_1,label_2\"")
     save_pars.add_argument('--comment', default='', help="Comment")
     save_pars.add_argument('--timeout', default=10, type=int, help='max time waiting for PVs to be connected')
+    save_pars.add_argument('--compress', choices=list(compressors),
+                           help="compress saved file (codec suffix is appended to the file name)")
+    save_pars.add_argument('--dedup', nargs='?', type=int, const=4096, metavar='MIN_BYTES',
+                           help="store array values larger than MIN_BYTES (default 4096) only once in a blob store "
+                                "next to the saved file")
 
     # Restore
     rest_pars = subparsers.add_parser('restore', help='restore saved state of PVs from file without using GUI')
@@ -89,8 +129,53 @@ def main():
     rest_pars.add_argument('--timeout', default=10, type=int,
                            help='max time waiting for PVs to be connected and restored')
 
+    # Verify
+    verify_pars = subparsers.add_parser('verify', help='check integrity of saved files in directory')
+    verify_pars.set_defaults(func=verify)
+    verify_pars.add_argument('DIR', help='directory with saved files')
+    verify_pars.add_argument('--req', help='request file. If specified, files are checked to contain all its PVs.')
+    verify_pars.add_argument('-m', '--macro', help="macros for request file e.g.: \"SYS=TEST,DEV=D1\"")
+    verify_pars.add_argument('-p', '--prefix', default='', help='check only files starting with prefix')
+    verify_pars.add_argument('-j', '--jobs', type=int, help='number of parallel processes (default: number of CPUs)')
+    verify_pars.add_argument('-o', '--out', help='write report to file instead of stdout')
+
+    # Prune
+    prune_pars = subparsers.add_parser('prune', help='delete (or archive) saved files not kept by retention rules')
+    prune_pars.set_defaults(func=prune)
+    prune_pars.add_argument('DIR', help='directory with saved files')
+    prune_pars.add_argument('--keep_all', type=float, metavar='DAYS', help='keep all files from the last DAYS')
+    prune_pars.add_argument('--keep_daily', type=float, metavar='DAYS',
+                            help='keep the newest file of each day from the last DAYS')
+    prune_pars.add_argument('--keep_weekly', type=float, metavar='DAYS',
+                            help='keep the newest file of each week from the last DAYS')
+    prune_pars.add_argument('--keep_label', action='append', metavar='LABEL',
+                            help='keep all files with the label (can be used more times)')
+    prune_pars.add_argument('-p', '--prefix', default='', help='prune only files starting with prefix')
+    prune_pars.add_argument('--archive', metavar='ARCHIVE_DIR', help='move files to ARCHIVE_DIR instead of deleting')
+    prune_pars.add_argument('--dry_run', action='store_true', help='only list files which would be pruned')
+    prune_pars.add_argument('-o', '--out', help='write names of pruned files to file instead of stdout')
+
+    # Archive
+    archive_pars = subparsers.add_parser('archive', help='pack saved files to an archive file, unpack or list them')
+    archive_subparsers = archive_pars.add_subparsers(dest='action', required=True, help='archive actions')
+    pack_pars = archive_subparsers.add_parser('pack', help='append saved files to archive')
+    pack_pars.set_defaults(func=archive_pack)
+    pack_pars.add_argument('ARCHIVE', help='archive file (created if it does not exist)')
+    pack_pars.add_argument('FILE', nargs='+', help='saved file or directory with saved files')
+    pack_pars.add_argument('-p', '--prefix', default='', help='pack only files starting with prefix (in directories)')
+    pack_pars.add_argument('--remove', action='store_true', help='remove files after they are packed')
+    unpack_pars = archive_subparsers.add_parser('unpack', help='extract saved files from archive')
+    unpack_pars.set_defaults(func=archive_unpack)
+    unpack_pars.add_argument('ARCHIVE', help='archive file')
+    unpack_pars.add_argument('NAME', nargs='*', help='name of the file to extract (default: all)')
+    unpack_pars.add_argument('-d', '--dir', default='.', help='destination directory')
+    list_pars = archive_subparsers.add_parser('list', help='list saved files in archive (one JSON object per line)')
+    list_pars.set_defaults(func=archive_list)
+    list_pars.add_argument('ARCHIVE', help='archive file')
+    list_pars.add_argument('-o', '--out', help='write list to file instead of stdout')
+
     # Following two functions modify sys.argv
-    _set_default_subparser('gui', ['gui', 'save', 'restore'])
+    _set_default_subparser('gui', ['gui', 'save', 'restore', 'verify', 'prune', 'archive'])
     # From version 1.3.1 handling of options have changed to be more consistent. However following function replaces
     # old style options with new style equivalents (backward compatibility).Old style options are no more shown in the
     # help, so users are encouraged to use new style.
@@ -106,26 +191,27 @@ usage: {}       {}
 -------- Command line save mode --------
 {}
 -------- Command line restore mode --------
+{}
+-------- Command line verify mode --------
+{}
+-------- Command line prune mode --------
+{}
+-------- Command line archive mode --------
 {}'''.format(
         re.sub('(?:\sgui|usage:\s)', '', gui_pars.format_usage()),
         re.sub('usage:\s', '', gui_pars.format_help()),
         save_pars.format_help(),
-        rest_pars.format_help()
+        rest_pars.format_help(),
+        verify_pars.format_help(),
+        prune_pars.format_help(),
+        archive_pars.format_help()
     )
 
     args_pars.description = '''Tool for saving and restoring snapshots of EPICS process variables (PVs).
 Can be used as graphical interface tool or a command line tool.'''
 
     args = args_pars.parse_args()
-
-    import cProfile, pstats
-    pr = cProfile.Profile()
-    pr.enable()
     args.func(args)
-    pr.disable()
-    sortby = 'cumulative'
-    ps = pstats.Stats(pr).sort_stats(sortby)
-    ps.print_stats()
 
 # Start the application here
 if __name__ == '__main__':
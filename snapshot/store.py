@@ -0,0 +1,195 @@
+import logging
+import os
+import sqlite3
+import time
+
+from snapshot.archive import archive_member_exists, is_archive
+from snapshot.index import SnapshotIndex, SnapshotIndexQueries
+from snapshot.snapfile import get_linked_paths, move_save_files
+
+# Save files can be kept in more directories (tiers), e.g. recent files on a fast local disk and older ones on an
+# archive mount. Each directory has its own index, and files of all directories are listed as if they were in one.
+# Archive files (see SnapshotArchive) can be used instead of directories.
+
+
+class SnapshotStore(SnapshotIndexQueries):
+    # Files are migrated in chunks of commit_size files
+    commit_size = SnapshotIndex.commit_size
+
+    def __init__(self, save_dirs, suffix: str = '.snap'):
+        """
+        Save files in more directories, fastest first. If a file is in more directories, the one in the first
+        (fastest) directory is listed and read. New files are saved to the first directory, and old files can be moved
+        to the last (archive) directory with migrate().
+
+        :param save_dirs: List of directories (or archives) with save files, fastest first.
+        :param suffix: Suffix of the (uncompressed) save files.
+
+        :return:
+        """
+        self.save_dirs = list()
+        for save_dir in save_dirs:
+            save_dir = os.path.abspath(save_dir)
+            if save_dir not in self.save_dirs:
+                self.save_dirs.append(save_dir)
+        self.suffix = suffix
+        self.indexes = [SnapshotIndex(save_dir, suffix) for save_dir in self.save_dirs]
+
+        # Index of each directory is attached as one schema, so all are queried at once
+        self._conn = sqlite3.connect(':memory:', timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._schemas = tuple('tier{}'.format(i) for i in range(len(self.indexes)))
+        for schema, index in zip(self._schemas, self.indexes):
+            self._conn.execute('ATTACH DATABASE ? AS {}'.format(schema), (index.path,))
+
+    def close(self):
+        self._conn.close()
+        for index in self.indexes:
+            index.close()
+
+    def update(self, progress=None, jobs: int = None):
+        """
+        Synchronize indexes of all directories (see SnapshotIndex.update()). Directory which can not be listed (e.g.
+        archive is not mounted) is skipped, and files already in its index are still listed.
+
+        :param progress: Callable progress(done, total) called after each committed chunk of files (of the directory
+                         being updated).
+        :param jobs: Number of threads reading the files.
+
+        :return: (added, modified, removed) lists of file names.
+        """
+        added, modified, removed = list(), list(), list()
+        for index in self.indexes:
+            try:
+                changes = index.update(progress, jobs)
+            except OSError as e:
+                logging.warning('Cannot update index of {}: {}'.format(index.save_dir, e))
+                continue
+            added += changes[0]
+            modified += changes[1]
+            removed += changes[2]
+        return added, modified, removed
+
+    def update_files(self, names, label_changes=None, save_dir: str = None):
+        """
+        Update indexes only for given files (see SnapshotIndex.update_files()).
+
+        :param names: Names of created, modified or deleted files.
+        :param label_changes: Callable label_changes(name, old_labels, new_labels) called for each file whose listed
+                              labels changed. Labels of a file which is also in a faster directory do not change.
+        :param save_dir: Update only index of this directory (e.g. the one where changes were reported).
+
+        :return: (added, modified, removed) lists of file names.
+        """
+        names = list(names)
+        old_labels = self._get_listed_labels(names) if label_changes else None
+
+        added, modified, removed = list(), list(), list()
+        for index in self.indexes:
+            if save_dir is None or index.save_dir == os.path.abspath(save_dir):
+                changes = index.update_files(names)
+                added += changes[0]
+                modified += changes[1]
+                removed += changes[2]
+
+        if label_changes:
+            new_labels = self._get_listed_labels(names)
+            for name in names:
+                if old_labels.get(name, list()) != new_labels.get(name, list()):
+                    label_changes(name, old_labels.get(name, list()), new_labels.get(name, list()))
+        return added, modified, removed
+
+    def _get_listed_labels(self, names):
+        labels = dict()
+        for name in names:
+            file = self.get_file(name)
+            if file is not None:
+                labels[name] = file['metadata'].get('labels', list())
+        return labels
+
+    def get_files(self, prefix: str = '', before: float = None):
+        """
+        Get indexed save files of all directories.
+
+        :param prefix: Only files with names starting with prefix.
+        :param before: Only files modified before this time (seconds since epoch).
+
+        :return: List of dicts as in SnapshotIndex.get_files() with additional 'path' of the file, newest first.
+        """
+        files = dict()
+        for index in self.indexes:
+            for file in index.get_files(prefix, before):
+                if file['name'] not in files:
+                    file['path'] = os.path.join(index.save_dir, file['name'])
+                    files[file['name']] = file
+        return sorted(files.values(), key=lambda file: file['mtime'], reverse=True)
+
+    def get_file(self, name: str):
+        """
+        Get indexed save file from the fastest directory holding it.
+
+        :param name: File name.
+
+        :return: Dict as in get_files() or None if not indexed.
+        """
+        for index in self.indexes:
+            file = index.get_file(name)
+            if file is not None:
+                file['path'] = os.path.join(index.save_dir, name)
+                return file
+        return None
+
+    def get_path(self, name: str):
+        """
+        Get path of the save file in the fastest directory holding it.
+
+        :param name: File name.
+
+        :return: Path or None if file is in none of the directories.
+        """
+        for save_dir in self.save_dirs:
+            path = os.path.join(save_dir, name)
+            if os.path.lexists(path) or archive_member_exists(path):
+                return path
+        return None
+
+    def migrate(self, max_age: float, prefix: str = '', progress=None):
+        """
+        Move save files older than max_age from faster directories to the last (archive) directory or archive file.
+        Modification time is kept, so files keep their position in the list. Values in the blob store are moved with
+        the files.
+
+        :param max_age: Minimal age (in seconds, by modification time) of the files to be moved.
+        :param prefix: Only files with names starting with prefix.
+        :param progress: Callable progress(done, total) called after each chunk of moved files.
+
+        :return: List of moved file names.
+        """
+        before = time.time() - max_age
+        archive = self.indexes[-1]
+        files = dict()
+        for index in self.indexes[:-1]:
+            if is_archive(index.save_dir):
+                continue  # Files can not be removed from archive
+            # Symlinks (e.g. *_latest.snap) and files they point to stay where they are
+            kept = get_linked_paths(index.save_dir)
+            for file in index.get_files(prefix, before):
+                path = os.path.join(index.save_dir, file['name'])
+                if path not in kept and os.path.realpath(path) not in kept:
+                    files.setdefault(index, list()).append(path)
+
+        # Files are moved in chunks (archive is appended once per chunk) and indexes are updated after each chunk
+        moved = list()
+        total = sum(len(paths) for paths in files.values())
+        if progress:
+            progress(0, total)
+        for index, paths in files.items():
+            for i in range(0, len(paths), self.commit_size):
+                names = [os.path.basename(path) for path in move_save_files(paths[i:i + self.commit_size],
+                                                                           archive.save_dir)]
+                index.update_files(names)
+                archive.update_files(names)
+                moved += names
+                if progress:
+                    progress(min(total, len(moved)), total)
+        return moved
@@ -0,0 +1,82 @@
+import re
+from collections import namedtuple
+
+from snapshot.core import SnapshotError
+
+# Numeric values of a PV (also elements of arrays) are treated as equal if they differ by at most
+# abs + rel * (larger of their absolute values), see snapshot.core.close_mask(). Tolerance can be declared for a single
+# PV in the request file:
+#     PV:NAME,{"abs": 0.01, "rel": 1e-6}
+# or for all PVs matching a regex in "tolerances" of the configuration file:
+#     "tolerances": [{"pvs": ".*:SET$", "abs": 0.01}]
+PvTolerance = namedtuple('PvTolerance', ['abs', 'rel'])
+
+
+def parse_tolerance(data):
+    """
+    Create PvTolerance from dict with "abs" and/or "rel" (missing ones are 0).
+
+    :param data: Dict (parsed JSON).
+
+    :return: PvTolerance
+    """
+    if not isinstance(data, dict):
+        raise ToleranceError('Tolerance must be an object with "abs" and/or "rel".')
+
+    unknown = set(data.keys()) - {'abs', 'rel'}
+    if unknown:
+        raise ToleranceError('Unknown tolerance keys: {}'.format(', '.join(sorted(unknown))))
+
+    values = list()
+    for key in ('abs', 'rel'):
+        value = data.get(key, 0)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not value >= 0:
+            raise ToleranceError('Tolerance "{}" must be a non-negative number.'.format(key))
+        values.append(float(value))
+
+    return PvTolerance(*values)
+
+
+class SnapshotToleranceRules(object):
+    def __init__(self, rules=None):
+        """
+        Tolerances of PVs selected by regex.
+
+        :param rules: List of dicts {"pvs": regex, "abs": ..., "rel": ...} (as "tolerances" in the configuration
+                      file). For each PV the first rule whose regex fully matches the PV name is used.
+
+        :return:
+        """
+        self._rules = list()
+        for rule in rules or list():
+            if not isinstance(rule, dict) or not isinstance(rule.get('pvs'), str):
+                raise ToleranceError('Each tolerance rule must have a "pvs" regex.')
+            try:
+                rgx = re.compile(rule['pvs'])
+            except re.error as e:
+                raise ToleranceError('Invalid regex "{}" of tolerance rule: {}'.format(rule['pvs'], e))
+
+            self._rules.append((rgx, parse_tolerance({key: value for key, value in rule.items() if key != 'pvs'})))
+
+    def __bool__(self):
+        return bool(self._rules)
+
+    def get(self, pvname: str):
+        """
+        Get tolerance of the PV.
+
+        :param pvname: PV name.
+
+        :return: PvTolerance or None if no rule matches the PV.
+        """
+        for rgx, tolerance in self._rules:
+            if rgx.fullmatch(pvname):
+                return tolerance
+        return None
+
+
+class ToleranceError(SnapshotError):
+    """
+    Invalid tolerance definition.
+    """
+    pass
@@ -0,0 +1,238 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+
+from snapshot.archive import SnapshotArchive, is_archive
+from snapshot.snapfile import is_save_file
+
+# Watches the save directory and reports names of created, modified or deleted save files. On Linux inotify is used
+# (through ctypes, so no extra dependency is needed). On network file systems inotify does not see changes done by other
+# hosts, so the directory is polled instead (only file stats are compared, files are not read). Archives (see
+# SnapshotArchive) are always polled, and their index is only read when the archive file was changed.
+NETWORK_FS_TYPES = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afs', 'ceph', 'lustre', 'gpfs', 'beegfs', '9p',
+                    'fuse.sshfs', 'fuse.glusterfs'}
+
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+def get_fs_type(path: str):
+    """
+    Get type of the file system the path is on (Linux only).
+
+    :param path: Path to the file or directory.
+
+    :return: File system type as in /proc/mounts (e.g. 'ext4', 'nfs4') or None if unknown.
+    """
+    path = os.path.realpath(path)
+    fs_type = None
+    mount_point = ''
+    try:
+        with open('/proc/mounts') as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount = fields[1].replace('\\040', ' ')
+                if (path == mount or path.startswith(mount.rstrip('/') + '/')) and len(mount) >= len(mount_point):
+                    mount_point = mount
+                    fs_type = fields[2]
+    except OSError:
+        pass
+    return fs_type
+
+
+def is_network_fs(path: str):
+    """
+    Check if the path is on a network file system.
+
+    :param path: Path to the file or directory.
+
+    :return: True if on a network file system.
+    """
+    return get_fs_type(path) in NETWORK_FS_TYPES
+
+
+def _init_inotify():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class SnapshotDirWatcher(object):
+    def __init__(self, save_dir: str, callback, suffix: str = '.snap', poll_interval: float = 5.0,
+                 delay: float = 0.2, use_inotify: bool = None):
+        """
+        Watcher of the save directory. Changes are reported from a separate thread by calling
+        callback(names), where names is a set of changed save file names (created, modified or deleted) or None if
+        changes could be lost (e.g. inotify queue overflow) and the whole directory must be rescanned.
+
+        :param save_dir: Directory with save files (or archive).
+        :param callback: Callable called with changed file names.
+        :param suffix: Suffix of the (uncompressed) save files.
+        :param poll_interval: Interval (in seconds) of directory polling if inotify can not be used.
+        :param delay: Changes are collected for delay seconds after the first change, and reported at once.
+        :param use_inotify: Force (or disable) use of inotify. By default it is used if available and save directory
+                            is not on a network file system.
+
+        :return:
+        """
+        self.save_dir = os.path.abspath(save_dir)
+        self.callback = callback
+        self.suffix = suffix
+        self.poll_interval = poll_interval
+        self.delay = delay
+
+        self._archive = SnapshotArchive(self.save_dir) if is_archive(self.save_dir) else None
+        self._libc = None
+        if not self._archive and (use_inotify or use_inotify is None and not is_network_fs(self.save_dir)):
+            self._libc = _init_inotify()
+        self._stop = threading.Event()
+        self._wake_fd = None  # Wakes inotify thread on stop
+        self._thread = None
+
+    @property
+    def mode(self):
+        return 'inotify' if self._libc else 'poll'
+
+    def start(self):
+        if self._libc:
+            fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            mask = (_IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_ATTRIB |
+                    _IN_DELETE_SELF | _IN_MOVE_SELF)
+            if fd < 0 or self._libc.inotify_add_watch(fd, self.save_dir.encode(), mask) < 0:
+                logging.debug('inotify not available ({}), polling {}'.format(
+                    os.strerror(ctypes.get_errno()), self.save_dir))
+                if fd >= 0:
+                    os.close(fd)
+                self._libc = None
+
+        if self._libc:
+            wake_read_fd, self._wake_fd = os.pipe()
+            target = lambda: self._watch(fd, wake_read_fd)
+        else:
+            stats = self._scan()  # Initial state, so no change after start() is missed
+            target = lambda: self._poll(stats)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=target, name='SnapshotDirWatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop watching and wait for the watcher thread to finish.
+
+        :return:
+        """
+        self._stop.set()
+        if self._wake_fd is not None:
+            try:
+                os.write(self._wake_fd, b'\0')
+            except OSError:
+                pass  # Thread already finished (directory removed)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._wake_fd is not None:
+            os.close(self._wake_fd)
+            self._wake_fd = None
+
+    def _is_watched(self, name):
+        # Hidden files are temporary files (e.g. meta data being replaced)
+        return not name.startswith('.') and is_save_file(name, self.suffix)
+
+    def _report(self, names):
+        try:
+            self.callback(names)
+        except Exception:
+            logging.exception('Handling changes of {} failed'.format(self.save_dir))
+
+    def _watch(self, fd, wake_fd):
+        try:
+            names = set()
+            while not self._stop.is_set():
+                ready = select.select([fd, wake_fd], [], [], self.delay if names else None)[0]
+                if not ready:
+                    # No more changes in delay after the last one
+                    self._report(names)
+                    names = set()
+                    continue
+                elif fd not in ready:
+                    continue  # Stopped
+
+                try:
+                    data = os.read(fd, 65536)
+                except BlockingIOError:
+                    continue
+
+                offset = 0
+                while offset < len(data):
+                    wd, mask, cookie, length = _IN_EVENT_HEADER.unpack_from(data, offset)
+                    offset += _IN_EVENT_HEADER.size
+                    name = data[offset:offset + length].rstrip(b'\0').decode(errors='surrogateescape')
+                    offset += length
+
+                    if mask & _IN_Q_OVERFLOW:
+                        names = set()
+                        self._report(None)
+                    elif mask & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED):
+                        logging.debug('Save directory {} was removed. Stop watching.'.format(self.save_dir))
+                        self._report(None)
+                        return
+                    elif name and self._is_watched(name):
+                        names.add(name)
+        finally:
+            os.close(fd)
+            os.close(wake_fd)
+
+    def _scan(self):
+        stats = dict()
+        if self._archive:
+            try:
+                members = self._archive.get_members()
+            except Exception as e:
+                logging.debug('Cannot read {}: {}'.format(self.save_dir, e))
+                return stats
+            for name, member in members.items():
+                if self._is_watched(name):
+                    stats[name] = (member['mtime'], member['size'])
+            return stats
+
+        try:
+            with os.scandir(self.save_dir) as entries:
+                for entry in entries:
+                    if self._is_watched(entry.name):
+                        try:
+                            stat = entry.stat()
+                            stats[entry.name] = (stat.st_mtime, stat.st_size)
+                        except OSError:
+                            pass
+        except OSError as e:
+            logging.debug('Cannot scan {}: {}'.format(self.save_dir, e))
+        return stats
+
+    def _poll(self, stats):
+        while not self._stop.wait(self.poll_interval):
+            new_stats = self._scan()
+            names = set(name for name in stats.keys() | new_stats.keys() if stats.get(name) != new_stats.get(name))
+            stats = new_stats
+            if names:
+                self._report(names)
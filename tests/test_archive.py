@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy
+
+from snapshot.archive import SnapshotArchive
+from snapshot.blobstore import SnapshotBlobStore
+from snapshot.ca_core.snapshot_ca import Snapshot
+from snapshot.index import SnapshotIndex
+from snapshot.retention import SnapshotRetentionRule, prune
+from snapshot.snapfile import pack_save_files, unpack_save_files
+from snapshot.store import SnapshotStore
+
+
+class TestSnapshotArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.save_dir = os.path.join(self.dir, 'saves')
+        os.mkdir(self.save_dir)
+        self.archive_path = os.path.join(self.dir, 'old.snaparc')
+        self.req_file_path = os.path.join(self.dir, 'test.req')
+        open(self.req_file_path, 'w').close()
+        self.snapshot = Snapshot(self.req_file_path)
+        self.pvs = {'TST:scalar': {'value': 5.5, 'raw_name': 'TST:scalar'},
+                    'TST:array': {'value': numpy.arange(100.), 'raw_name': 'TST:array'}}
+        self.blob_store = SnapshotBlobStore(self.save_dir, min_size=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def save(self, name, age=0, **kw):
+        path = os.path.join(self.save_dir, name)
+        self.snapshot.parse_to_save_file(self.pvs, path, blob_store=self.blob_store, **kw)
+        if kw.get('compression'):
+            path += '.' + kw['compression']
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def assert_parsed(self, path):
+        saved_pvs, meta_data, err = Snapshot.parse_from_save_file(path)
+        self.assertEqual(err, [])
+        self.assertEqual(saved_pvs['TST:scalar']['value'], 5.5)
+        self.assertTrue(numpy.array_equal(saved_pvs['TST:array']['value'], numpy.arange(100.)))
+        return meta_data
+
+    def test_pack(self):
+        paths = [self.save('test_1.snap', age=100, labels=['a']), self.save('test_2.snap', compression='gz')]
+        self.assertEqual(pack_save_files(paths, self.archive_path), ['test_1.snap', 'test_2.snap.gz'])
+
+        # Blob store values are packed once, members are read directly from the archive
+        members = SnapshotArchive(self.archive_path).get_members()
+        self.assertEqual(len(members), 3)
+        self.assertEqual(members['test_1.snap']['metadata']['labels'], ['a'])
+        self.assertEqual(self.assert_parsed(os.path.join(self.archive_path, 'test_1.snap'))['labels'], ['a'])
+        self.assert_parsed(os.path.join(self.archive_path, 'test_2.snap.gz'))
+
+        # Newer member replaces the old one
+        self.save('test_1.snap', labels=['b'])
+        pack_save_files([os.path.join(self.save_dir, 'test_1.snap')], self.archive_path)
+        self.assertEqual(len(SnapshotArchive(self.archive_path).get_members()), 3)
+        self.assertEqual(self.assert_parsed(os.path.join(self.archive_path, 'test_1.snap'))['labels'], ['b'])
+
+        # Archive can be indexed and listed like a directory
+        index = SnapshotIndex(self.archive_path)
+        self.assertEqual(sorted(index.update()[0]), ['test_1.snap', 'test_2.snap.gz'])
+        self.assertEqual(index.get_label_counts(), {'b': 1})
+        index.close()
+
+        # Archive read while a member is being appended is consistent (reader waits for the new index)
+        archive = SnapshotArchive(self.archive_path)
+        read_members = list()
+        reader = threading.Thread(target=lambda: read_members.append(archive.get_members()))
+
+        def appended_members():
+            reader.start()
+            time.sleep(0.2)
+            self.assertTrue(reader.is_alive())
+            yield 'test_3.snap', b'data', time.time(), dict()
+
+        archive.append(appended_members())
+        reader.join()
+        self.assertIn('test_3.snap', read_members[0])
+        self.assertEqual(archive.read('test_3.snap'), b'data')
+
+        dest_dir = os.path.join(self.dir, 'unpacked')
+        os.mkdir(dest_dir)
+        paths = unpack_save_files(self.archive_path, dest_dir, ['test_2.snap.gz'])
+        self.assertEqual(paths, [os.path.join(dest_dir, 'test_2.snap.gz')])
+        self.assertEqual(os.path.getmtime(paths[0]), members['test_2.snap.gz']['mtime'])
+        shutil.rmtree(self.save_dir)
+        self.assert_parsed(paths[0])
+
+    def test_prune_and_migrate(self):
+        self.save('test_1.snap', age=3 * 24 * 3600)
+        self.save('test_2.snap', age=2 * 24 * 3600)
+        self.save('test_3.snap')
+
+        rules = [SnapshotRetentionRule(within=2.5 * 24 * 3600)]
+        self.assertEqual(prune(self.save_dir, rules, archive_dir=self.archive_path), ['test_1.snap'])
+
+        store = SnapshotStore([self.save_dir, self.archive_path])
+        store.update()
+        self.assertEqual(store.migrate(24 * 3600), ['test_2.snap'])
+        self.assertEqual(store.count_files(), 3)
+        path = store.get_path('test_2.snap')
+        self.assertEqual(path, os.path.join(self.archive_path, 'test_2.snap'))
+        self.assertEqual(store.get_file('test_1.snap')['path'], os.path.join(self.archive_path, 'test_1.snap'))
+        self.assertEqual(sorted(os.listdir(self.save_dir))[-1], 'test_3.snap')
+        self.assert_parsed(path)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+import numpy
+
+from snapshot.cache import SnapshotLruCache, estimate_pvs_size
+
+
+class TestSnapshotLruCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = SnapshotLruCache(100)
+        cache.put('a', 1, 40)
+        cache.put('b', 2, 40)
+        self.assertEqual(cache.get('a'), 1)  # 'b' is now least recently used
+        cache.put('c', 3, 40)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.size, 80)
+
+        cache.put('d', 4, 101)  # Too big
+        self.assertNotIn('d', cache)
+        cache.put('a', 5, 10)
+        self.assertEqual(cache.size, 50)
+        self.assertEqual(cache.pop('a'), 5)
+        self.assertEqual(cache.size, 40)
+        self.assertIsNone(cache.get('a'))
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def test_estimate(self):
+        small = estimate_pvs_size({'TST:a': {'value': 1.0}})
+        large = estimate_pvs_size({'TST:a': {'value': numpy.zeros(1000)}})
+        self.assertGreater(small, 0)
+        self.assertGreaterEqual(large - small, 8000)
@@ -0,0 +1,52 @@
+import unittest
+
+import numpy
+
+from snapshot.columns import FLOAT, INT, MISSING, OBJECT, SnapshotColumn, columns_eq_mask, eq_mask
+from snapshot.core import SnapshotPv
+
+
+def compare(row, value1, value2):
+    return SnapshotPv.compare(value1, value2, isinstance(value1, (list, numpy.ndarray)))
+
+
+class TestSnapshotColumn(unittest.TestCase):
+
+    def test_values(self):
+        values = [None, 1, 2.5, 'abc', [1, 2], 2 ** 60]
+        column = SnapshotColumn(values, size=7)
+        self.assertEqual(column.kinds.tolist(), [MISSING, INT, FLOAT, OBJECT, OBJECT, OBJECT, MISSING])
+        self.assertEqual([column[row] for row in range(len(values))], values)
+        self.assertIsInstance(column[1], int)
+        self.assertIsNone(column[6])
+        self.assertEqual(set(column.objects), {3, 4, 5})
+
+        column.texts[3] = 'abc'
+        column[3] = 4.0
+        self.assertEqual(column.kinds[3], FLOAT)
+        self.assertNotIn(3, column.objects)
+        self.assertNotIn(3, column.texts)
+
+        column.resize(9)
+        self.assertEqual(len(column), 9)
+        self.assertIsNone(column[8])
+        column.resize(4)
+        self.assertEqual(set(column.objects), set())
+
+    def test_eq_mask(self):
+        column1 = SnapshotColumn([None, 1, 2.5, 'abc', [1, 2], None, 3])
+        column2 = SnapshotColumn([None, 1.0, 2.6, 'abc', numpy.array([1, 2]), 0, 'x'])
+        self.assertEqual(eq_mask(column1, column2, compare).tolist(), [True, True, False, True, True, False, False])
+
+    def test_columns_eq_mask(self):
+        columns = [SnapshotColumn([1, 2, 'a']), SnapshotColumn([1, 2, 'a']), SnapshotColumn([1, 3, 'b'])]
+        self.assertEqual(columns_eq_mask(columns[:2], compare, 3).tolist(), [True, True, True])
+        self.assertEqual(columns_eq_mask(columns, compare, 3).tolist(), [True, False, False])
+        self.assertEqual(columns_eq_mask(columns[:1], compare, 3).tolist(), [True, True, True])
+        self.assertEqual(columns_eq_mask([], compare, 0).tolist(), [])
+
+    def test_eq_mask_tolerances(self):
+        column1 = SnapshotColumn([1.0, 1.0, 10, 'a'])
+        column2 = SnapshotColumn([1.05, 1.05, 11, 'a'])
+        tolerances = (numpy.array([0.1, 0, 0, 0]), numpy.array([0, 0, 0.1, 0]))
+        self.assertEqual(eq_mask(column1, column2, compare, tolerances).tolist(), [True, False, True, True])
@@ -0,0 +1,35 @@
+import unittest
+
+import numpy
+
+from snapshot.decimate import minmax_decimate
+
+
+class TestDecimate(unittest.TestCase):
+
+    def test_small(self):
+        values = numpy.arange(10.)
+        indices, decimated = minmax_decimate(values, 2, 8, 5)
+        self.assertEqual(indices.tolist(), [2, 3, 4, 5, 6, 7])
+        self.assertEqual(decimated.tolist(), values[2:8].tolist())
+        self.assertEqual(len(minmax_decimate(values, 8, 2, 5)[0]), 0)
+
+    def test_peaks(self):
+        values = numpy.zeros(1000001)
+        values[123457] = 5.
+        values[999999] = -3.
+        indices, decimated = minmax_decimate(values, 0, len(values), 1000)
+        self.assertLessEqual(len(indices), 2000)
+        self.assertTrue(numpy.all(numpy.diff(indices) >= 0))
+        self.assertIn(123457, indices.tolist())
+        self.assertIn(999999, indices.tolist())
+        self.assertEqual(decimated.max(), 5.)
+        self.assertEqual(decimated.min(), -3.)
+        self.assertTrue(numpy.array_equal(values[indices], decimated))
+
+    def test_range(self):
+        values = numpy.sin(numpy.arange(100000) / 100.)
+        indices, decimated = minmax_decimate(values, 5000, 6001, 100)
+        self.assertTrue(indices.min() >= 5000 and indices.max() <= 6000)
+        self.assertAlmostEqual(decimated.max(), values[5000:6001].max())
+        self.assertAlmostEqual(decimated.min(), values[5000:6001].min())
@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from snapshot.ca_core.snapshot_ca import Snapshot
+from snapshot.index import INDEX_FILE_NAME, SnapshotIndex
+
+
+class TestSnapshotIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.req_file_path = os.path.join(self.dir, 'test.req')
+        open(self.req_file_path, 'w').close()
+        self.snapshot = Snapshot(self.req_file_path)
+        self.pvs = {'TST:scalar': {'value': 5.5, 'raw_name': 'TST:scalar'}}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def save(self, name, **kw):
+        path = os.path.join(self.dir, name)
+        self.snapshot.parse_to_save_file(self.pvs, path, **kw)
+        return path
+
+    def test_update(self):
+        self.save('test_1.snap', labels=['a'], comment='first')
+        self.save('test_2.snap', compression='gz')
+        self.save('other_1.snap')
+
+        index = SnapshotIndex(self.dir)
+        self.assertTrue(os.path.isfile(os.path.join(self.dir, INDEX_FILE_NAME)))
+        progress = list()
+        added, modified, removed = index.update(progress=lambda done, total: progress.append((done, total)), jobs=2)
+        self.assertEqual(progress, [(0, 3), (3, 3)])  # After each committed chunk
+        self.assertEqual(sorted(added), ['other_1.snap', 'test_1.snap', 'test_2.snap.gz'])
+        self.assertEqual((modified, removed), ([], []))
+
+        files = index.get_files('test_')
+        self.assertEqual(sorted(f['name'] for f in files), ['test_1.snap', 'test_2.snap.gz'])
+        metadata = index.get_file('test_1.snap')['metadata']
+        self.assertEqual((metadata['labels'], metadata['comment']), (['a'], 'first'))
+        self.assertEqual(metadata['summary']['pv_count'], 1)
+        index.close()
+
+        # Index is persistent, only changes are read
+        index = SnapshotIndex(self.dir)
+        self.assertEqual(index.update(), ([], [], []))
+        self.save('test_1.snap', labels=['b'], comment='x' * 1000)
+        os.remove(os.path.join(self.dir, 'other_1.snap'))
+        self.assertEqual(index.update(), ([], ['test_1.snap'], ['other_1.snap']))
+        self.assertEqual(index.get_file('test_1.snap')['metadata']['labels'], ['b'])
+        self.assertIsNone(index.get_file('other_1.snap'))
+        index.close()
+
+    def test_update_files(self):
+        self.save('test_1.snap')
+        index = SnapshotIndex(self.dir)
+        index.update()
+
+        self.save('test_1.snap', comment='x' * 1000)
+        self.save('test_2.snap')
+        self.assertEqual(index.update_files(['test_1.snap', 'test_2.snap', 'test_3.snap']),
+                         (['test_2.snap'], ['test_1.snap'], []))
+        os.remove(os.path.join(self.dir, 'test_2.snap'))
+        self.assertEqual(index.update_files(['test_2.snap']), ([], [], ['test_2.snap']))
+        self.assertEqual([f['name'] for f in index.get_files()], ['test_1.snap'])
+        index.close()
+
+    def test_query(self):
+        for i, labels in enumerate([['a'], ['a', 'b'], ['b'], []]):
+            self.save('test_{}.snap'.format(i), labels=labels, comment='comment {}'.format(i))
+        self.save('other_1.snap', labels=['a'])
+        index = SnapshotIndex(self.dir)
+        index.update()
+
+        self.assertEqual(index.count_files(prefix='test_'), 4)
+        self.assertEqual(index.count_files(prefix='test_', labels=['a']), 2)
+        self.assertEqual(index.count_files(prefix='test_', labels=['a', 'b']), 1)
+        self.assertEqual(index.count_files(comment='comment 3', name='3'), 1)
+        self.assertEqual(index.count_files(comment='COMM'), 4)
+        self.assertEqual(index.count_files(comment='omment'), 0)
+
+        files = index.query_files('name', False, offset=1, limit=2, prefix='test_')
+        self.assertEqual([f['name'] for f in files], ['test_1.snap', 'test_2.snap'])
+        self.assertEqual(files[0]['labels'], ['a', 'b'])
+        files = index.query_files('labels', True, prefix='test_', labels=['b'])
+        self.assertEqual([f['name'] for f in files], ['test_2.snap', 'test_1.snap'])
+
+        self.assertEqual(index.get_position('test_2.snap', 'name', False, prefix='test_'), 2)
+        self.assertEqual(index.get_position('test_2.snap', 'name', True, prefix='test_'), 1)
+        self.assertIsNone(index.get_position('test_2.snap', 'name', True, labels=['a']))
+
+        self.assertEqual(index.get_label_counts('test_'), {'a': 2, 'b': 2})
+
+        # Inverted indexes are updated with the file
+        self.save('test_1.snap', labels=['c'], comment='edited')
+        os.remove(os.path.join(self.dir, 'test_2.snap'))
+        label_changes = list()
+        index.update(label_changes=lambda *args: label_changes.append(args))
+        self.assertEqual(sorted(label_changes), [('test_1.snap', ['a', 'b'], ['c']), ('test_2.snap', ['b'], [])])
+        self.assertEqual(index.get_label_counts('test_'), {'a': 1, 'c': 1})
+        self.assertEqual(index.count_files(labels=['b']), 0)
+        self.assertEqual([f['name'] for f in index.query_files(labels=['c'], comment='edit')], ['test_1.snap'])
+        index.close()
+
+    def test_shared(self):
+        index = SnapshotIndex(self.dir)
+        index.update()
+        version = index.get_data_version()
+
+        # Saved file is registered by the saving client, other clients see it without update
+        self.snapshot.save_pvs(os.path.join(self.dir, 'test_1.snap'), labels=['a'],
+                               symlink_path=os.path.join(self.dir, 'test_latest.snap'))
+        self.assertNotEqual(index.get_data_version(), version)
+        self.assertEqual(sorted(f['name'] for f in index.get_files()), ['test_1.snap', 'test_latest.snap'])
+        self.assertEqual(index.get_label_counts(), {'a': 2})
+        self.assertEqual(index.update(), ([], [], []))
+        self.assertEqual(index._conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+        # File stored by another client while it was being read is not overwritten with the stale data
+        other_index = SnapshotIndex(self.dir)
+        read_metadata = index._read_metadata
+
+        def read_metadata_and_edit(name):
+            metadata = read_metadata(name)
+            self.save('test_1.snap', labels=['b'], comment='x' * 1000)
+            other_index.update_files(['test_1.snap'])
+            return metadata
+
+        os.utime(os.path.join(self.dir, 'test_1.snap'), (1, 1))
+        index._read_metadata = read_metadata_and_edit
+        self.assertEqual(index.update_files(['test_1.snap']), ([], [], []))
+        self.assertEqual(index.get_file('test_1.snap')['metadata']['labels'], ['b'])
+        other_index.close()
+        index.close()
+
+    def test_invalid_file(self):
+        with open(os.path.join(self.dir, 'broken.snap.gz'), 'w') as f:
+            f.write('not compressed')
+
+        index = SnapshotIndex(self.dir)
+        self.assertEqual(index.update()[0], ['broken.snap.gz'])
+        self.assertEqual(index.get_file('broken.snap.gz')['metadata'], {})
+        self.assertEqual(index.update(), ([], [], []))
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
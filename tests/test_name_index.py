@@ -0,0 +1,51 @@
+import re
+import unittest
+
+from snapshot.name_index import SnapshotNameIndex, regex_prefix
+
+
+def scan(names, name_filter):
+    if isinstance(name_filter, str):
+        return [name_filter in name for name in names]
+    return [name_filter.fullmatch(name) is not None for name in names]
+
+
+class TestSnapshotNameIndex(unittest.TestCase):
+    names = ['SYS:MOT1:POS', 'SYS:MOT2:POS', 'SYS:MOT10:VEL', 'OTHER:POS', 'sys:mot1:pos', 'A', '']
+
+    def test_substring(self):
+        index = SnapshotNameIndex(self.names)
+        for text in ['', 'S', 'PO', 'POS', 'MOT1', 'MOT1:', ':MOT10:VEL', 'XYZ', 'SYS:MOT1:POSX']:
+            self.assertEqual(index.match(text).tolist(), scan(self.names, text), text)
+
+    def test_regex(self):
+        index = SnapshotNameIndex(self.names)
+        for pattern in ['.*', 'SYS:.*', 'SYS:MOT1.*', 'SYS:MOT1?:POS', 'SYS:MOT1|OTHER.*', '.*POS', 'A', '']:
+            regex = re.compile(pattern)
+            self.assertEqual(index.match(regex).tolist(), scan(self.names, regex), pattern)
+        regex = re.compile('sys:mot1:pos', re.IGNORECASE)
+        self.assertEqual(index.match(regex).tolist(), scan(self.names, regex))
+
+    def test_cache(self):
+        index = SnapshotNameIndex(self.names, cache_size=2)
+        mask = index.match('MOT')
+        self.assertIs(index.match('MOT'), mask)
+        self.assertFalse(mask.flags.writeable)
+        index.match('POS')
+        index.match(re.compile('.*'))
+        self.assertIsNot(index.match('MOT'), mask)
+        self.assertEqual(index.match('MOT').tolist(), mask.tolist())
+
+    def test_empty(self):
+        index = SnapshotNameIndex()
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.match('abc').tolist(), [])
+        self.assertEqual(index.match(re.compile('a.*')).tolist(), [])
+
+    def test_regex_prefix(self):
+        self.assertEqual(regex_prefix('SYS:MOT1.*'), 'SYS:MOT1')
+        self.assertEqual(regex_prefix('SYS:MOT1?'), 'SYS:MOT')
+        self.assertEqual(regex_prefix('SYS:MOT1+'), 'SYS:MOT1')
+        self.assertEqual(regex_prefix('SYS:(A|B)'), '')
+        self.assertEqual(regex_prefix('SYS.*', re.IGNORECASE), '')
+        self.assertEqual(regex_prefix(r'\d+'), '')
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from snapshot.ca_core.snapshot_ca import Snapshot
+from snapshot.index import SnapshotIndex
+from snapshot.retention import DAY, SnapshotRetentionRule, prune, select_pruned
+
+
+class TestRetention(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.req_file_path = os.path.join(self.dir, 'test.req')
+        open(self.req_file_path, 'w').close()
+        self.snapshot = Snapshot(self.req_file_path)
+        self.now = time.mktime((2020, 6, 30, 12, 0, 0, 0, 0, -1))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def save(self, name, age, **kw):
+        path = os.path.join(self.dir, name)
+        self.snapshot.parse_to_save_file({'TST:scalar': {'value': 1, 'raw_name': 'TST:scalar'}}, path, **kw)
+        os.utime(path, (self.now - age, self.now - age))
+
+    def test_select(self):
+        # Every 6 hours for 10 days, newest first
+        files = [{'name': str(i), 'mtime': self.now - i * 6 * 3600, 'labels': ['golden'] if i == 39 else []}
+                 for i in range(40)]
+        rules = [SnapshotRetentionRule(within=2 * DAY), SnapshotRetentionRule(within=7 * DAY, every=DAY),
+                 SnapshotRetentionRule(labels=['golden'])]
+        pruned = select_pruned(files, rules, self.now)
+        kept = [file['name'] for file in files if file['name'] not in pruned]
+        # All from the last 2 days, then the newest of each day (saved at 18:00) and the golden one
+        self.assertEqual(kept, [str(i) for i in range(8)] + ['11', '15', '19', '23', '27', '39'])
+        self.assertRaises(ValueError, select_pruned, files, [], self.now)
+
+    def test_prune(self):
+        for i in range(5):
+            self.save('test_{}.snap'.format(i), i * DAY, labels=['golden'] if i == 3 else [])
+        self.save('other.snap', 4 * DAY)
+        os.symlink('test_4.snap', os.path.join(self.dir, 'test_latest.snap'))
+        rules = [SnapshotRetentionRule(within=1.5 * DAY), SnapshotRetentionRule(labels=['golden'])]
+
+        self.assertEqual(prune(self.dir, rules, 'test_', dry_run=True, now=self.now), ['test_2.snap'])
+        archive_dir = os.path.join(self.dir, 'archive')
+        os.mkdir(archive_dir)
+        self.assertEqual(prune(self.dir, rules, 'test_', archive_dir=archive_dir, now=self.now), ['test_2.snap'])
+        self.assertTrue(os.path.isfile(os.path.join(archive_dir, 'test_2.snap')))
+
+        index = SnapshotIndex(self.dir)
+        self.assertIsNone(index.get_file('test_2.snap'))
+        self.assertEqual(index.count_files(), 6)
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
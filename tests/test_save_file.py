@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy
+
+from snapshot.blobstore import BLOB_DIR_NAME, SnapshotBlobStore
+from snapshot.ca_core.snapshot_ca import Snapshot
+from snapshot.snapfile import SaveFileBodySummary, file_digest, list_save_files, read_metadata, remove_save_file, \
+    replace_metadata, summarize_save_file
+
+
+class TestSaveFile(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.req_file_path = os.path.join(self.dir, 'test.req')
+        open(self.req_file_path, 'w').close()
+        self.snapshot = Snapshot(self.req_file_path)
+        self.pvs = {'TST:scalar': {'value': 5.5, 'raw_name': 'TST:scalar'},
+                    'TST:string': {'value': 'abc', 'raw_name': 'TST:string'},
+                    'TST:array': {'value': numpy.arange(10.), 'raw_name': 'TST:array'},
+                    'TST:none': {'value': None, 'raw_name': 'TST:none'}}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def assert_pvs_loaded(self, saved_pvs):
+        self.assertEqual(saved_pvs['TST:scalar']['value'], 5.5)
+        self.assertEqual(saved_pvs['TST:string']['value'], 'abc')
+        self.assertTrue(numpy.array_equal(saved_pvs['TST:array']['value'], numpy.arange(10.)))
+        self.assertIsNone(saved_pvs['TST:none']['value'])
+
+    def test_compressed(self):
+        for compression in ['gz', 'bz2', 'xz']:
+            path = os.path.join(self.dir, 'test_{}.snap'.format(compression))
+            self.snapshot.parse_to_save_file(self.pvs, path, compression=compression, comment='compressed')
+            self.assertTrue(os.path.isfile(path + '.' + compression))
+
+            saved_pvs, meta_data, err = Snapshot.parse_from_save_file(path + '.' + compression)
+            self.assertEqual(err, [])
+            self.assertEqual(meta_data['comment'], 'compressed')
+            self.assert_pvs_loaded(saved_pvs)
+
+        self.snapshot.parse_to_save_file(self.pvs, os.path.join(self.dir, 'test_plain.snap'))
+        self.assertEqual(len(list_save_files(self.dir, 'test_')), 4)
+
+    def test_blob_store(self):
+        blob_store = SnapshotBlobStore(self.dir, min_size=10)
+        path_1 = os.path.join(self.dir, 'test_1.snap')
+        path_2 = os.path.join(self.dir, 'test_2.snap')
+        self.snapshot.parse_to_save_file(self.pvs, path_1, blob_store=blob_store)
+        self.snapshot.parse_to_save_file(self.pvs, path_2, blob_store=blob_store, compression='gz')
+        path_2 += '.gz'
+
+        with open(path_1) as save_file:
+            self.assertIn('TST:array,@', save_file.read())
+
+        for path in [path_1, path_2]:
+            saved_pvs, meta_data, err = Snapshot.parse_from_save_file(path)
+            self.assertEqual(err, [])
+            self.assert_pvs_loaded(saved_pvs)
+
+        # Same value is stored only once and released when the last file is deleted
+        blob_dir = os.path.join(self.dir, BLOB_DIR_NAME)
+        self.assertEqual(len(os.listdir(blob_dir)), 1)
+        remove_save_file(path_1)
+        self.assertEqual(Snapshot.parse_from_save_file(path_2)[2], [])
+        remove_save_file(path_2)
+        self.assertEqual(blob_store.collect_garbage(), [])
+        self.assertEqual([os.listdir(os.path.join(blob_dir, d)) for d in os.listdir(blob_dir)], [[]])
+
+    def test_blob_store_concurrent_refs(self):
+        blob_store = SnapshotBlobStore(self.dir, min_size=10)
+        value_str = '[' + ', '.join(str(i) for i in range(100)) + ']'
+        digest = blob_store.put(value_str, 'first.snap')[1:]
+
+        # References added while other references are released are kept
+        owners = ['test_{}.snap'.format(i) for i in range(20)]
+        threads = [threading.Thread(target=blob_store.put, args=(value_str, owner)) for owner in owners]
+        threads += [threading.Thread(target=blob_store.release, args=('first.snap', [digest])) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(blob_store.get_refs(digest), set(owners))
+        self.assertEqual(blob_store.get(digest), value_str)
+
+        self.assertEqual(blob_store.release('other.snap', [digest]), [])
+        for owner in owners[:-1]:
+            blob_store.release(owner, [digest])
+        self.assertEqual(blob_store.release(owners[-1], [digest]), [digest])
+        self.assertEqual(blob_store.get_refs(digest), set())
+        self.assertFalse(os.path.exists(blob_store.get_blob_path(digest)))
+
+    def test_replace_metadata(self):
+        path = os.path.join(self.dir, 'test.snap')
+        self.snapshot.parse_to_save_file(self.pvs, path, labels=['a'], comment='')
+        size = os.path.getsize(path)
+
+        # Fits into padded meta data line: replaced in place
+        replace_metadata(path, {'labels': ['a', 'b'], 'comment': 'edited'})
+        self.assertEqual(os.path.getsize(path), size)
+        saved_pvs, meta_data, err = Snapshot.parse_from_save_file(path)
+        self.assertEqual(meta_data, {'labels': ['a', 'b'], 'comment': 'edited'})
+        self.assert_pvs_loaded(saved_pvs)
+
+        # Does not fit (and compressed): rewritten
+        for compression in [None, 'gz']:
+            if compression:
+                self.snapshot.parse_to_save_file(self.pvs, path, compression=compression)
+                path += '.' + compression
+            replace_metadata(path, {'comment': 'x' * 2000})
+            saved_pvs, meta_data, err = Snapshot.parse_from_save_file(path)
+            self.assertEqual(meta_data, {'comment': 'x' * 2000})
+            self.assertEqual(err, [])
+            self.assert_pvs_loaded(saved_pvs)
+        self.assertEqual(sorted(os.listdir(self.dir)), ['test.req', 'test.snap', 'test.snap.gz'])
+
+    def test_summary(self):
+        path = os.path.join(self.dir, 'test.snap')
+        self.snapshot.parse_to_save_file(self.pvs, path, compression='xz')
+        summary = read_metadata(path + '.xz')['summary']
+        self.assertEqual(summary['pv_count'], 4)
+        self.assertEqual(summary['null_count'], 1)
+        self.assertEqual(summary['req_file_sha256'], file_digest(self.req_file_path))
+        self.assertEqual(dict(summary, req_file_sha256=None), dict(summarize_save_file(path + '.xz'),
+                                                                   req_file_sha256=None))
+
+        # Same summary computed while parsing
+        body_summary = SaveFileBodySummary()
+        Snapshot.parse_from_save_file(path + '.xz', body_summary)
+        self.assertEqual(body_summary.result(), summarize_save_file(path + '.xz'))
+
+
+if __name__ == '__main__':
+    unittest.main()
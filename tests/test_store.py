@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy
+
+from snapshot.blobstore import SnapshotBlobStore
+from snapshot.ca_core.snapshot_ca import Snapshot
+from snapshot.store import SnapshotStore
+
+
+class TestSnapshotStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.dirs = [os.path.join(self.dir, 'fast'), os.path.join(self.dir, 'archive')]
+        for save_dir in self.dirs:
+            os.mkdir(save_dir)
+        self.req_file_path = os.path.join(self.dir, 'test.req')
+        open(self.req_file_path, 'w').close()
+        self.snapshot = Snapshot(self.req_file_path)
+        self.pvs = {'TST:scalar': {'value': 5.5, 'raw_name': 'TST:scalar'},
+                    'TST:array': {'value': numpy.arange(100.), 'raw_name': 'TST:array'}}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def save(self, tier, name, age=0, **kw):
+        path = os.path.join(self.dirs[tier], name)
+        self.snapshot.parse_to_save_file(self.pvs, path, **kw)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_tiers(self):
+        self.save(0, 'test_1.snap', labels=['a'])
+        self.save(1, 'test_1.snap', age=100, labels=['b'])
+        self.save(1, 'test_2.snap', age=50, labels=['b'])
+
+        store = SnapshotStore(self.dirs)
+        store.update()
+        # File in both directories is listed (and read) from the faster one
+        self.assertEqual(store.count_files(prefix='test_'), 2)
+        self.assertEqual([f['name'] for f in store.query_files('mtime', False)], ['test_2.snap', 'test_1.snap'])
+        self.assertEqual(store.get_label_counts(), {'a': 1, 'b': 1})
+        self.assertEqual(store.get_position('test_1.snap', 'mtime', True), 0)
+        self.assertEqual(store.get_path('test_1.snap'), os.path.join(self.dirs[0], 'test_1.snap'))
+        self.assertEqual(store.get_file('test_2.snap')['path'], os.path.join(self.dirs[1], 'test_2.snap'))
+
+        # Archived copy is listed when file is deleted from the faster directory
+        os.remove(os.path.join(self.dirs[0], 'test_1.snap'))
+        label_changes = list()
+        store.update_files(['test_1.snap'], lambda *args: label_changes.append(args), self.dirs[0])
+        self.assertEqual(label_changes, [('test_1.snap', ['a'], ['b'])])
+        self.assertEqual(store.get_label_counts(), {'b': 2})
+        self.assertEqual(store.count_files(labels=['b']), 2)
+        store.close()
+
+    def test_migrate(self):
+        blob_store = SnapshotBlobStore(self.dirs[0], min_size=10)
+        self.save(0, 'test_old.snap', age=3 * 24 * 3600, blob_store=blob_store)
+        self.save(0, 'test_new.snap', blob_store=blob_store)
+        self.save(0, 'test_linked.snap', age=3 * 24 * 3600)
+        os.symlink('test_linked.snap', os.path.join(self.dirs[0], 'test_latest.snap'))
+
+        store = SnapshotStore(self.dirs)
+        store.update()
+        self.assertEqual(store.migrate(2 * 24 * 3600), ['test_old.snap'])
+        path = store.get_path('test_old.snap')
+        self.assertEqual(path, os.path.join(self.dirs[1], 'test_old.snap'))
+        self.assertEqual(store.get_file('test_old.snap')['path'], path)
+        self.assertEqual(store.count_files(), 4)
+
+        # Values stored as blobs are moved with the file
+        saved_pvs, meta_data, err = Snapshot.parse_from_save_file(path)
+        self.assertEqual(err, [])
+        self.assertTrue(numpy.array_equal(saved_pvs['TST:array']['value'], numpy.arange(100.)))
+        self.assertEqual(Snapshot.parse_from_save_file(os.path.join(self.dirs[0], 'test_new.snap'))[2], [])
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from snapshot.core import SnapshotPv
+from snapshot.parser import ReqFileFormatError, SnapshotReqFile
+from snapshot.tolerance import PvTolerance, SnapshotToleranceRules, ToleranceError, parse_tolerance
+
+
+class TestTolerance(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_parse(self):
+        self.assertEqual(parse_tolerance({'abs': 1}), PvTolerance(1.0, 0.0))
+        self.assertEqual(parse_tolerance({'rel': 0.5, 'abs': 0.1}), PvTolerance(0.1, 0.5))
+        for data in [{'abs': -1}, {'abs': 'x'}, {'abs': True}, {'tol': 1}, [1]]:
+            with self.assertRaises(ToleranceError):
+                parse_tolerance(data)
+
+    def test_rules(self):
+        rules = SnapshotToleranceRules([{'pvs': '.*:SET$', 'abs': 0.1}, {'pvs': 'TST:.*', 'rel': 0.01}])
+        self.assertEqual(rules.get('TST:A:SET'), PvTolerance(0.1, 0.0))
+        self.assertEqual(rules.get('TST:B'), PvTolerance(0.0, 0.01))
+        self.assertIsNone(rules.get('OTHER:B'))
+        self.assertFalse(SnapshotToleranceRules())
+        with self.assertRaises(ToleranceError):
+            SnapshotToleranceRules([{'pvs': '('}])
+
+    def test_compare(self):
+        tolerance = PvTolerance(0.1, 0.01)
+        self.assertTrue(SnapshotPv.compare(1.0, 1.05, tolerance=tolerance))
+        self.assertTrue(SnapshotPv.compare(100.0, 100.9, tolerance=tolerance))
+        self.assertFalse(SnapshotPv.compare(1.0, 1.2, tolerance=tolerance))
+        self.assertFalse(SnapshotPv.compare(1.0, 1.05))
+        self.assertFalse(SnapshotPv.compare('a', 'b', tolerance=tolerance))
+        self.assertTrue(SnapshotPv.compare(numpy.array([1.0, 2.0]), [1.05, 2.0], True, tolerance))
+        self.assertFalse(SnapshotPv.compare(numpy.array([1.0, 2.0]), [1.05, 2.0, 3.0], True, tolerance))
+        self.assertTrue(SnapshotPv.compare(['a', 'b'], ['a', 'b'], True, tolerance))
+
+        # Arrays of PV not known to be an array (e.g. disconnected)
+        self.assertTrue(SnapshotPv.compare(numpy.array([1.0, 2.0]), numpy.array([1.05, 2.0]), tolerance=tolerance))
+        self.assertFalse(SnapshotPv.compare(numpy.array([1.0, 2.0]), numpy.array([1.5, 2.0]), tolerance=tolerance))
+        self.assertFalse(SnapshotPv.compare(numpy.array([1.0, 2.0]), 1.0, tolerance=tolerance))
+        self.assertTrue(SnapshotPv.compare(numpy.array([1.0, 2.0]), numpy.array([1.0, 2.0])))
+        self.assertFalse(SnapshotPv.compare(numpy.array([1.0, 2.0]), None))
+
+    def test_req_file(self):
+        path = os.path.join(self.dir, 'test.req')
+        with open(path, 'w') as f:
+            f.write('TST:a\nTST:b,{"abs": 0.5}\n')
+        req_file = SnapshotReqFile(path)
+        self.assertEqual(req_file.read(), ['TST:a', 'TST:b'])
+        self.assertEqual(req_file.tolerances, {'TST:b': PvTolerance(0.5, 0.0)})
+
+        with open(path, 'w') as f:
+            f.write('TST:b,{"abs": -1}\n')
+        with self.assertRaises(ReqFileFormatError):
+            SnapshotReqFile(path).read()
@@ -0,0 +1,89 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from snapshot.ca_core.snapshot_ca import Snapshot
+from snapshot.cmd.snapshot_cmd import verify
+
+
+class TestVerify(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.save_dir = os.path.join(self.dir, 'saves')
+        os.mkdir(self.save_dir)
+        self.report_path = os.path.join(self.dir, 'report.json')
+        self.req_file_path = os.path.join(self.dir, 'test.req')
+        with open(self.req_file_path, 'w') as req_file:
+            req_file.write('TST:scalar\nTST:array\n')
+        self.snapshot = Snapshot(self.req_file_path)
+        self.pvs = {'TST:scalar': {'value': 5.5, 'raw_name': 'TST:scalar'},
+                    'TST:array': {'value': numpy.arange(100.), 'raw_name': 'TST:array'},
+                    'TST:none': {'value': None, 'raw_name': 'TST:none'}}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def save(self, name, pvs=None, **kw):
+        path = os.path.join(self.save_dir, name)
+        self.snapshot.parse_to_save_file(pvs or self.pvs, path, **kw)
+        if kw.get('compression'):
+            path += '.' + kw['compression']
+        return path
+
+    def truncate(self, path):
+        with open(path, 'r+b') as save_file:
+            save_file.truncate(os.path.getsize(path) - 20)
+
+    def verify(self, **kw):
+        failed = verify(self.save_dir, jobs=1, out=self.report_path, **kw)
+        with open(self.report_path) as report_file:
+            lines = [json.loads(line) for line in report_file]
+        return failed, {report['file']: report for report in lines[:-1]}, lines[-1]['totals']
+
+    def test_intact(self):
+        self.save('test_1.snap')
+        self.save('test_2.snap', compression='gz')
+        failed, reports, totals = self.verify()
+        self.assertEqual(failed, 0)
+        self.assertEqual(totals, {'files': 2, 'failed': 0, 'warnings': 0})
+        for name in ['test_1.snap', 'test_2.snap.gz']:
+            self.assertTrue(reports[name]['ok'])
+            self.assertEqual(reports[name]['errors'], [])
+            self.assertEqual(reports[name]['pv_count'], 3)
+            self.assertEqual(reports[name]['null_count'], 1)
+            self.assertNotIn('missing_pvs', reports[name])
+
+    def test_truncated(self):
+        self.truncate(self.save('test_1.snap'))
+        self.truncate(self.save('test_2.snap', compression='gz'))
+        self.save('test_3.snap')
+        failed, reports, totals = self.verify()
+        self.assertEqual(failed, 2)
+        self.assertEqual(totals, {'files': 3, 'failed': 2, 'warnings': 0})
+        self.assertFalse(reports['test_1.snap']['ok'])
+        self.assertIn('Digest of the file does not match the one in meta data (corrupted or truncated file).',
+                      reports['test_1.snap']['errors'])
+        self.assertFalse(reports['test_2.snap.gz']['ok'])
+        self.assertTrue(reports['test_2.snap.gz']['errors'][0].startswith('File cannot be parsed:'))
+        self.assertTrue(reports['test_3.snap']['ok'])
+
+    def test_req_file(self):
+        self.save('test_1.snap')
+        self.save('test_2.snap', pvs={'TST:scalar': self.pvs['TST:scalar']}, compression='xz')
+        failed, reports, totals = self.verify(req_file_path=self.req_file_path)
+        self.assertEqual(failed, 1)
+        self.assertTrue(reports['test_1.snap']['ok'])
+        self.assertEqual(reports['test_1.snap']['missing_pvs'], [])
+        self.assertEqual(reports['test_1.snap']['extra_pvs'], ['TST:none'])
+        self.assertFalse(reports['test_2.snap.xz']['ok'])
+        self.assertEqual(reports['test_2.snap.xz']['missing_pvs'], ['TST:array'])
+        self.assertEqual(reports['test_2.snap.xz']['errors'], ['1 PVs from request file are not in the file.'])
+
+
+if __name__ == '__main__':
+    unittest.main()
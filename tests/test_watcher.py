@@ -0,0 +1,65 @@
+import os
+import queue
+import shutil
+import tempfile
+import unittest
+
+from snapshot.watcher import SnapshotDirWatcher, get_fs_type
+
+
+class TestSnapshotDirWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.changes = queue.Queue()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, text='#{}\n'):
+        with open(os.path.join(self.dir, name), 'a') as f:
+            f.write(text)
+
+    def get_changes(self):
+        names = set()
+        # Collect all reported changes
+        names.update(self.changes.get(timeout=5))
+        while True:
+            try:
+                names.update(self.changes.get(timeout=0.3))
+            except queue.Empty:
+                return names
+
+    def check_watcher(self, use_inotify):
+        self.write('test_1.snap')
+        watcher = SnapshotDirWatcher(self.dir, self.changes.put, poll_interval=0.05, delay=0.05,
+                                     use_inotify=use_inotify)
+        watcher.start()
+        try:
+            self.write('test_2.snap.gz')
+            self.write('test.txt')
+            self.write('.123.test_1.snap')
+            self.assertEqual(self.get_changes(), {'test_2.snap.gz'})
+
+            self.write('test_1.snap', 'pv,1\n')
+            os.remove(os.path.join(self.dir, 'test_2.snap.gz'))
+            self.assertEqual(self.get_changes(), {'test_1.snap', 'test_2.snap.gz'})
+        finally:
+            watcher.stop()
+        return watcher
+
+    def test_inotify(self):
+        watcher = self.check_watcher(True)
+        if watcher.mode != 'inotify':
+            self.skipTest('inotify not available')
+
+    def test_poll(self):
+        self.assertEqual(self.check_watcher(False).mode, 'poll')
+
+    def test_fs_type(self):
+        if os.path.exists('/proc/mounts'):
+            self.assertIsNotNone(get_fs_type(self.dir))
+
+
+if __name__ == '__main__':
+    unittest.main()